@@ -0,0 +1,77 @@
+"""
+Micro-benchmark of packet crafting: packets/s produced on one core by the send_*
+helpers (full protobuf build per packet) and by PacketTemplate.emit (pre-serialized
+packet, only id/time/ciphertext patched). Publishing is discarded.
+
+Usage:
+    python -m benchmarks.bench_crafter [--count N] [--repeat R]
+"""
+import argparse
+import logging
+import statistics
+import time
+from settings import CHANNEL, KEY
+from src.mesh.packet.crafter import PacketTemplate, send_message, send_node_info, send_position
+
+NODE = 0x1234abcd
+DEST = 0xffffffff
+
+
+class NullPublisher:
+    """Accepts the MqttBrokerClient publish API and discards everything."""
+    def is_connected(self):
+        return True
+
+    def publish(self, topic, payload):
+        pass
+
+
+def _send_cases():
+    client = NullPublisher()
+    return {
+        'nodeinfo': lambda i: send_node_info(
+            '!ffffffff', True, '!1234abcd', CHANNEL, KEY, i, 'Spoof', 'Spoofed node', 'Spoof', 43, None, 'topic', client),
+        'position': lambda i: send_position(
+            '!ffffffff', 45.5, -122.6, '120', '!1234abcd', CHANNEL, KEY, i, '!1234abcd', 'topic', client),
+        'message': lambda i: send_message(
+            '!ffffffff', 'hello mesh', '!1234abcd', CHANNEL, KEY, i, '!1234abcd', 'topic', client),
+    }
+
+
+def _template_cases():
+    templates = {
+        'nodeinfo': PacketTemplate.node_info(DEST, True, NODE, CHANNEL, KEY, 'Spoof', 'Spoofed node', 'Spoof', 43, None),
+        'position': PacketTemplate.position(DEST, 45.5, -122.6, '120', NODE, CHANNEL, KEY, '!1234abcd'),
+        'message': PacketTemplate.message(DEST, 'hello mesh', NODE, CHANNEL, KEY, '!1234abcd'),
+    }
+    return {name: template.emit for name, template in templates.items()}
+
+
+def run(fn, count, repeat):
+    fn(0)
+    rates = []
+    for _ in range(repeat):
+        started = time.process_time()
+        for i in range(count):
+            fn(i)
+        rates.append(count / (time.process_time() - started))
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Packet crafting throughput micro-benchmark")
+    parser.add_argument('--count', type=int, default=20000, help='Packets per timed pass (default: 20000)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed passes per case (default: 5)')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    send_cases = _send_cases()
+    template_cases = _template_cases()
+    print(f"packets per pass: {args.count}  passes: {args.repeat}  (median packets/s, CPU time)")
+    for name in send_cases:
+        crafted = statistics.median(run(send_cases[name], args.count, args.repeat))
+        templated = statistics.median(run(template_cases[name], args.count, args.repeat))
+        print(f"{name:<9} send_*: {crafted:>10,.0f}/s  template: {templated:>10,.0f}/s  ({templated / crafted:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+End-to-end load test on the in-process broker (MQTT_BROKER=local), with no network access.
+
+Scenarios:
+    ingest  synthetic traffic -> broker -> sniffer (sync or --async) -> DB;
+            reports handled packets/s and the drop rate
+    react   packets from a spoofed node -> reactive spoofer -> spoof publish;
+            reports the reaction latency seen on the broker
+
+Usage:
+    python -m benchmarks.bench_e2e ingest [--count N] [--rate R] [--nodes N] [--mix SPEC] [--encrypted-ratio F] [--async [--workers N]]
+    python -m benchmarks.bench_e2e react [--count N] [--interval S]
+
+The database is created in a temporary directory, so the working database is not touched.
+"""
+import os
+import sys
+import tempfile
+
+# Must be set before settings is imported; load_dotenv does not override them
+os.environ['MQTT_BROKER'] = 'local'
+os.environ['LOCAL_TRAFFIC_RATE'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix='spooftastic-bench-'))
+
+import _thread  # noqa: E402
+import argparse  # noqa: E402
+import logging  # noqa: E402
+import statistics  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+from settings import CLIENT_ID, BROADCAST_MAC  # noqa: E402
+from src.agents.async_sniffer import AsyncSniffer  # noqa: E402
+from src.agents.sniffer import Sniffer  # noqa: E402
+from src.agents.spoofer import Spoofer  # noqa: E402
+from src.clients.local_broker import LOCAL_BROKER  # noqa: E402
+from src.mesh.packet.filters import PacketFilter  # noqa: E402
+from src.mesh.traffic import SyntheticTraffic, DEFAULT_MIX, FIRST_NODE  # noqa: E402
+from src.utils import num_to_id  # noqa: E402
+
+
+def _wait_subscribed(timeout=10):
+    deadline = time.monotonic() + timeout
+    while not LOCAL_BROKER.stats()['subscriptions']:
+        if time.monotonic() > deadline:
+            raise RuntimeError("sniffer did not subscribe")
+        time.sleep(0.01)
+    time.sleep(0.2)
+
+
+def run_ingest(args):
+    traffic = SyntheticTraffic(nodes=args.nodes, mix=args.mix, encrypted_ratio=args.encrypted_ratio, seed=1)
+    # Pre-generated so the generator's own cost is not part of the measurement
+    messages = traffic.take(args.count)
+    if args.async_mode:
+        sniffer = AsyncSniffer(workers=args.workers) if args.workers else AsyncSniffer()
+    else:
+        sniffer = Sniffer()
+    handled = [0]
+    last = [0.0]
+
+    def on_packet(*_, **__):
+        handled[0] += 1
+        last[0] = time.perf_counter()
+
+    result = {}
+
+    def drive():
+        _wait_subscribed()
+        started = time.perf_counter()
+        if args.rate:
+            LOCAL_BROKER.start_traffic(messages, args.rate, count=len(messages))
+        else:
+            for topic, payload in messages:
+                LOCAL_BROKER.publish(topic, payload, 'bench')
+        # Done once everything is handled or dropped, or nothing moved for two seconds
+        progress, idle_since = -1, time.monotonic()
+        while True:
+            dropped = LOCAL_BROKER.dropped + getattr(sniffer, 'counters', {}).get('dropped', 0)
+            if handled[0] + dropped >= len(messages):
+                break
+            if handled[0] != progress:
+                progress, idle_since = handled[0], time.monotonic()
+            elif time.monotonic() - idle_since > 2:
+                break
+            time.sleep(0.01)
+        LOCAL_BROKER.stop_traffic()
+        result.update(elapsed=max(last[0] - started, 1e-9), dropped=dropped)
+        _thread.interrupt_main()
+
+    threading.Thread(target=drive, daemon=True).start()
+    closing = time.perf_counter()
+    sniffer.sniff(callback=on_packet, packet_filter=PacketFilter(keep_undecoded=True))
+    closing = time.perf_counter() - closing
+    published = len(messages)
+    print(f"sniffer: {'async' if args.async_mode else 'sync'}  messages: {published}  rate: {args.rate or 'max'}")
+    print(f"handled: {handled[0]} in {result['elapsed']:.2f}s ({handled[0] / result['elapsed']:.0f} packets/s)")
+    print(f"dropped: {result['dropped']} ({result['dropped'] / published:.2%}), not handled: {published - handled[0]}")
+    print(f"broker: {LOCAL_BROKER.stats()}")
+    print(f"total incl. final DB flush: {closing:.2f}s")
+
+
+def run_react(args):
+    target = FIRST_NODE
+    traffic = SyntheticTraffic(nodes=1, seed=1)
+    triggered = {}
+    responded = threading.Event()
+    latencies = []
+
+    def tap(client_id, topic, payload, published_at):
+        # Spoof bursts go out through the publisher pool connections
+        if client_id and client_id.startswith(f"{CLIENT_ID}-pub") and 'at' in triggered and not responded.is_set():
+            latencies.append(published_at - triggered['at'])
+            responded.set()
+
+    LOCAL_BROKER.taps.append(tap)
+
+    def drive():
+        _wait_subscribed()
+        for _ in range(args.count):
+            responded.clear()
+            topic, payload = traffic.packet(target, 'position')
+            triggered['at'] = LOCAL_BROKER.publish(topic, payload, 'bench').timestamp
+            responded.wait(2)
+            time.sleep(args.interval)
+        _thread.interrupt_main()
+
+    threading.Thread(target=drive, daemon=True).start()
+    spoofer = Spoofer()
+    try:
+        spoofer.spoof_reactive(
+            BROADCAST_MAC, num_to_id(target), 'SPF', 'Spoofed node', None, 1.0, 2.0, 3.0, None, burst=1, period=0
+        )
+    finally:
+        spoofer.close()
+    print(f"triggers: {args.count}  reactions: {len(latencies)}")
+    if len(latencies) >= 2:
+        ms = sorted(l * 1000 for l in latencies)
+        q = statistics.quantiles(ms, n=100, method='inclusive')
+        print(f"reaction latency ms: p50 {q[49]:.2f}  p90 {q[89]:.2f}  p99 {q[98]:.2f}  max {ms[-1]:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test on the in-process broker")
+    scenarios = parser.add_subparsers(dest="scenario", required=True)
+    ingest = scenarios.add_parser("ingest", help="Sniffer throughput and drop rate")
+    ingest.add_argument('--count', type=int, default=20000, help='Messages to publish (default: 20000)')
+    ingest.add_argument('--rate', type=float, default=0, help='Messages/s to publish, 0 for as fast as possible (default: 0)')
+    ingest.add_argument('--nodes', type=int, default=50, help='Virtual nodes (default: 50)')
+    ingest.add_argument('--mix', type=str, default=DEFAULT_MIX, help=f'Packet kind mix (default: {DEFAULT_MIX})')
+    ingest.add_argument('--encrypted-ratio', type=float, default=0.8, help='Fraction of encrypted packets (default: 0.8)')
+    ingest.add_argument('--async', dest='async_mode', action='store_true', help='Use the asyncio sniffer')
+    ingest.add_argument('--workers', type=int, help='Decode workers for --async')
+    react = scenarios.add_parser("react", help="Reactive spoof latency")
+    react.add_argument('--count', type=int, default=200, help='Trigger packets (default: 200)')
+    react.add_argument('--interval', type=float, default=0.02, help='Seconds between triggers (default: 0.02)')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    try:
+        run_ingest(args) if args.scenario == 'ingest' else run_react(args)
+    finally:
+        LOCAL_BROKER.close()
+
+
+if __name__ == "__main__":
+    main()
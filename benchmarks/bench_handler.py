@@ -0,0 +1,89 @@
+"""
+Micro-benchmark of the sniffer message handler: per-message CPU time spent in
+filtered_on_message_factory's handler (envelope parse, filtering, decryption and
+packet handling) with DB writes discarded.
+
+Usage:
+    python -m benchmarks.bench_handler [--corpus FILE] [--count N] [--repeat R]
+
+--corpus takes a file with one hex-encoded ServiceEnvelope per line (e.g. captured
+from a broker); without it a synthetic corpus is generated with the crafter.
+"""
+import argparse
+import logging
+import statistics
+import time
+from types import SimpleNamespace
+from meshtastic.protobuf import portnums_pb2
+from settings import CHANNEL, KEY, ROOT_TOPIC
+from src.mesh.encryption import get_channel_crypto
+from src.mesh.packet.handler import filtered_on_message_factory
+from src.mesh.traffic import SyntheticTraffic
+
+PORTNUMS = [
+    portnums_pb2.TEXT_MESSAGE_APP,
+    portnums_pb2.RANGE_TEST_APP,
+    portnums_pb2.POSITION_APP,
+    portnums_pb2.NODEINFO_APP,
+    portnums_pb2.TRACEROUTE_APP,
+    portnums_pb2.ROUTING_APP,
+    portnums_pb2.TELEMETRY_APP,
+]
+
+
+class NullWriter:
+    """Accepts the DBClient write API and discards everything."""
+    def add_or_update_node(self, node_number, **kwargs):
+        pass
+
+    def add_node_packet(self, from_node_id, gateway_node_id, to_node_id, **kwargs):
+        pass
+
+    def add_or_update_channel(self, channel_num, channel_id=None, member_node_ids=None, aes_key=None):
+        pass
+
+    def mark_packet_success_by_ack(self, request_id, acked_at=None):
+        return None
+
+
+def synthetic_corpus(count, nodes=50, encrypted_ratio=0.8, seed=1):
+    traffic = SyntheticTraffic(nodes=nodes, encrypted_ratio=encrypted_ratio, seed=seed)
+    return [payload for _, payload in traffic.take(count)]
+
+
+def load_corpus(path):
+    with open(path, 'r') as f:
+        return [bytes.fromhex(line.strip()) for line in f if line.strip()]
+
+
+def run(corpus, repeat):
+    topic = f"{ROOT_TOPIC}{CHANNEL}/!ffffffff"
+    messages = [SimpleNamespace(topic=topic, payload=payload) for payload in corpus]
+    handler = filtered_on_message_factory(enabled_portnums=PORTNUMS, key=get_channel_crypto(CHANNEL, KEY), writer=NullWriter())
+    # Warm-up pass fills caches (node registry, crypto contexts)
+    for msg in messages:
+        handler(None, None, msg)
+    per_message = []
+    for _ in range(repeat):
+        started = time.process_time()
+        for msg in messages:
+            handler(None, None, msg)
+        per_message.append((time.process_time() - started) / len(messages))
+    return per_message
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Handler per-message CPU micro-benchmark")
+    parser.add_argument('--corpus', type=str, help='File with one hex-encoded ServiceEnvelope per line')
+    parser.add_argument('--count', type=int, default=5000, help='Synthetic corpus size (default: 5000)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed passes over the corpus (default: 5)')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.count)
+    per_message = run(corpus, args.repeat)
+    print(f"messages: {len(corpus)}  passes: {args.repeat}")
+    print(f"CPU per message: median {statistics.median(per_message) * 1e6:.1f} us, best {min(per_message) * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
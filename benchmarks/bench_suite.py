@@ -0,0 +1,362 @@
+"""
+Benchmark suite for the ingest, crypto and query hot paths, with JSON results and a
+baseline comparison to catch regressions before deploying.
+
+Groups (all by default, or a comma-separated subset with --only):
+    parse    ServiceEnvelope parse
+    crypto   decrypt_packet / encrypt_message
+    handler  handle_packet per portnum, DB writes discarded
+    crafter  PacketTemplate emission
+    db       add_or_update_node / add_node_packet on an empty and a --db-rows database
+    query    db nodes activity / db channels activity on the --db-rows database
+
+Usage:
+    python -m benchmarks.bench_suite [--only GROUPS] [--count N] [--repeat R] [--db-rows N]
+                                     [--json results.json] [--baseline baseline.json] [--tolerance 0.15]
+
+Every fixture is seeded: the packet corpus comes from SyntheticTraffic and the large
+database is generated once per (--db-rows, schema) and cached in --fixtures. Rows added by
+the insert cases are removed again, so the cached database stays the same between runs.
+With --baseline, results that are worse than the baseline by more than --tolerance are
+listed and the exit status is 1.
+"""
+import os
+import sys
+import tempfile
+
+# The DB singleton opens meshtastic_nodes.db in the working directory on import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Relative --json/--baseline/--fixtures paths are resolved against the invocation directory
+INVOKED_FROM = os.getcwd()
+WORKDIR = tempfile.mkdtemp(prefix='spooftastic-bench-')
+os.chdir(WORKDIR)
+
+import argparse  # noqa: E402
+import contextlib  # noqa: E402
+import io  # noqa: E402
+import json  # noqa: E402
+import logging  # noqa: E402
+import platform  # noqa: E402
+import random  # noqa: E402
+import sqlite3  # noqa: E402
+import statistics  # noqa: E402
+import time  # noqa: E402
+from datetime import datetime, timedelta  # noqa: E402
+from meshtastic.protobuf import mqtt_pb2, portnums_pb2  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from settings import CHANNEL, KEY  # noqa: E402
+import src.commands.db as db_command  # noqa: E402
+from src.clients.db_client import DBClient, DB_URL  # noqa: E402
+from src.mesh.encryption import get_channel_crypto, decrypt_packet, encrypt_message  # noqa: E402
+from src.mesh.packet.context import MessageContext  # noqa: E402
+from src.mesh.packet.handler import handle_packet, decrypt_context  # noqa: E402
+from src.mesh.traffic import SyntheticTraffic, KINDS, FIRST_NODE  # noqa: E402
+from src.parser import build_parser  # noqa: E402
+from src.utils import num_to_id, num_to_mac  # noqa: E402
+from benchmarks.bench_crafter import _template_cases  # noqa: E402
+from benchmarks.bench_handler import NullWriter  # noqa: E402
+
+GROUPS = ('parse', 'crypto', 'handler', 'crafter', 'db', 'query')
+# Bump when the fixture database layout changes, so cached fixtures are rebuilt
+FIXTURE_VERSION = 4
+FIXTURE_NODES = 1000
+FIXTURE_DAYS = 30
+DB_FILE = DB_URL.replace('sqlite:///', '')
+
+
+class Results:
+    """Named measurements with their unit and whether higher or lower is better."""
+    def __init__(self):
+        self.entries = {}
+
+    def add(self, name, value, unit, better):
+        self.entries[name] = {'value': value, 'unit': unit, 'better': better}
+        print(f"{name:<40} {value:>14,.2f} {unit}")
+
+    def rate(self, name, count, seconds):
+        self.add(name, count / seconds, 'ops/s', 'higher')
+
+    def latency(self, name, seconds, unit='us'):
+        scale = {'us': 1e6, 'ms': 1e3, 's': 1}[unit]
+        self.add(name, seconds * scale, unit, 'lower')
+
+
+def best_of(fn, repeat, clock=time.process_time, warmup=True):
+    """Median duration of `repeat` calls of fn, after a warm-up call unless warmup is False."""
+    if warmup:
+        fn()
+    durations = []
+    for _ in range(repeat):
+        started = clock()
+        fn()
+        durations.append(clock() - started)
+    return statistics.median(durations)
+
+
+def corpus(count, encrypted_ratio=1.0):
+    mix = ','.join(f'{kind}=1' for kind in KINDS)
+    return SyntheticTraffic(nodes=200, mix=mix, encrypted_ratio=encrypted_ratio, seed=1).take(count)
+
+
+def bench_parse(results, args):
+    payloads = [payload for _, payload in corpus(args.count)]
+
+    def parse():
+        for payload in payloads:
+            mqtt_pb2.ServiceEnvelope().ParseFromString(payload)
+    results.rate('parse.service_envelope', len(payloads), best_of(parse, args.repeat))
+
+
+def bench_crypto(results, args):
+    crypto = get_channel_crypto(CHANNEL, KEY)
+    packets = []
+    for _, payload in corpus(args.count):
+        envelope = mqtt_pb2.ServiceEnvelope()
+        envelope.ParseFromString(payload)
+        packets.append(envelope.packet)
+    data = [decrypt_packet(packet, crypto) for packet in packets]
+
+    def decrypt():
+        for packet in packets:
+            decrypt_packet(packet, crypto)
+
+    def encrypt():
+        for packet, decoded in zip(packets, data):
+            encrypt_message(CHANNEL, crypto, packet, decoded, getattr(packet, 'from'))
+    results.rate('crypto.decrypt_packet', len(packets), best_of(decrypt, args.repeat))
+    results.rate('crypto.encrypt_message', len(packets), best_of(encrypt, args.repeat))
+
+
+def bench_handler(results, args):
+    crypto = get_channel_crypto(CHANNEL, KEY)
+    writer = NullWriter()
+    by_portnum = {}
+    for topic, payload in corpus(args.count, encrypted_ratio=0.8):
+        ctx = MessageContext(topic, payload).parse()
+        decrypt_context(ctx, crypto)
+        if ctx.decoded is not None:
+            by_portnum.setdefault(portnums_pb2.PortNum.Name(ctx.decoded.portnum), []).append(ctx)
+    for portnum, contexts in sorted(by_portnum.items()):
+        def handle():
+            for ctx in contexts:
+                handle_packet(ctx, writer=writer)
+        results.latency(f'handler.{portnum}', best_of(handle, args.repeat) / len(contexts))
+
+
+def bench_crafter(results, args):
+    for name, emit in _template_cases().items():
+        def craft():
+            for i in range(args.count):
+                emit(i)
+        results.rate(f'crafter.template.{name}', args.count, best_of(craft, args.repeat))
+
+
+def fixture_path(args):
+    return os.path.join(args.fixtures, f'packets-{args.db_rows}-v{FIXTURE_VERSION}', DB_FILE)
+
+
+def build_fixture(path, rows, seed=1):
+    """Create a database with FIXTURE_NODES nodes and `rows` packets over the last FIXTURE_DAYS days."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + '.partial'
+    if os.path.exists(partial):
+        os.remove(partial)
+    # A separate instance creates the schema, and the rollups once the packets are in
+    client = object.__new__(DBClient)
+    client._init_db(f'sqlite:///{partial}')
+    client.close()
+    rng = random.Random(seed)
+    numbers = [FIRST_NODE + i for i in range(FIXTURE_NODES)]
+    now = datetime.now()
+    conn = sqlite3.connect(partial)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.executemany(
+        'INSERT INTO nodes (id, node_number, node_mac, node_id, short_name, long_name, hw_model, last_seen, freeze) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)',
+        ((i + 1, n, num_to_mac(n), num_to_id(n), num_to_id(n)[-4:], f'Node {num_to_id(n)[1:]}', '43', now.strftime('%Y-%m-%d %H:%M:%S'))
+         for i, n in enumerate(numbers))
+    )
+    types = ['NODEINFO_APP', 'POSITION_APP', 'TELEMETRY_APP', 'TEXT_MESSAGE_APP', 'ROUTING_APP', 'TRACEROUTE_APP']
+    ids = [num_to_id(n) for n in numbers]
+    span = FIXTURE_DAYS * 86400
+    started = time.monotonic()
+    chunk = 100000
+    for offset in range(0, rows, chunk):
+        batch = []
+        for i in range(offset, min(offset + chunk, rows)):
+            sender = rng.randrange(FIXTURE_NODES)
+            direct = rng.random() < 0.2
+            # Rows as the handler writes them, in receive order, every node reference as a !abcd1234 node id
+            batch.append((
+                (now - timedelta(seconds=span * (1 - i / rows))).strftime('%Y-%m-%d %H:%M:%S.%f'),
+                ids[sender], ids[sender // 10 * 10], ids[rng.randrange(FIXTURE_NODES)] if direct else '!ffffffff',
+                rng.choice(types), rng.randrange(10, 200), (rng.random() < 0.7) if direct else None, CHANNEL,
+                rng.getrandbits(32), rng.randrange(-120, -60), round(rng.uniform(-15, 10), 2), 3, rng.randrange(0, 4),
+            ))
+        conn.executemany(
+            'INSERT INTO node_packet (timestamp, from_node_id, gateway_node_id, to_node_id, packet_type, payload_size, success, channel_id, packet_id, rx_rssi, rx_snr, hop_start, hop_limit) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', batch
+        )
+        conn.commit()
+        logging.warning(f"[Bench] Fixture: {offset + len(batch):,}/{rows:,} packets ({time.monotonic() - started:.0f}s)")
+    conn.close()
+    # As `db rollup rebuild` builds them: the channel queries only read the rollups
+    logging.warning(f"[Bench] Fixture: {client.rebuild_rollups():,} rollup rows")
+    client.close()
+    os.replace(partial, path)
+
+
+@contextlib.contextmanager
+def database(directory):
+    """A DBClient on directory/meshtastic_nodes.db, also used by the db command handler meanwhile."""
+    previous = os.getcwd()
+    os.chdir(directory)
+    # A separate instance, the DB singleton stays on the working database
+    client = object.__new__(DBClient)
+    client._init_db()
+    command_db = db_command.DB
+    db_command.DB = client
+    try:
+        yield client
+    finally:
+        db_command.DB = command_db
+        client.close()
+        os.chdir(previous)
+
+
+def bench_inserts(results, args, label, directory):
+    with database(directory) as client:
+        with client.get_session() as session:
+            max_packet = session.execute(text('SELECT COALESCE(MAX(id), 0) FROM node_packet')).scalar()
+            max_node = session.execute(text('SELECT COALESCE(MAX(id), 0) FROM nodes')).scalar()
+        count = args.db_count
+        numbers = [FIRST_NODE + i % FIXTURE_NODES for i in range(count)]
+        started = time.perf_counter()
+        for i, number in enumerate(numbers):
+            client.add_or_update_node(node_number=number, last_seen=f'2024-01-01 00:00:{i % 60:02d}', rssi=-90.0, snr=5.0)
+        results.rate(f'db.add_or_update_node.{label}', count, time.perf_counter() - started)
+        stamp = datetime.now()
+        started = time.perf_counter()
+        for i, number in enumerate(numbers):
+            client.add_node_packet(
+                num_to_id(number), num_to_id(FIRST_NODE), '!ffffffff', packet_type='POSITION_APP', payload_size=42, timestamp=stamp,
+                channel_id=CHANNEL, packet_id=i, rx_rssi=-90, rx_snr=5.0, hop_start=3, hop_limit=2, want_ack=False,
+            )
+        results.rate(f'db.add_node_packet.{label}', count, time.perf_counter() - started)
+        # Leave the cached fixture as it was
+        with client.get_session() as session:
+            session.execute(text('DELETE FROM node_packet WHERE id > :id'), {'id': max_packet})
+            session.execute(text('DELETE FROM channel_node_association WHERE node_id > :id'), {'id': max_node})
+            session.execute(text('DELETE FROM nodes WHERE id > :id'), {'id': max_node})
+            session.commit()
+
+
+def bench_db(results, args):
+    empty = tempfile.mkdtemp(dir=WORKDIR)
+    bench_inserts(results, args, 'empty', empty)
+    path = ensure_fixture(args)
+    bench_inserts(results, args, 'large', os.path.dirname(path))
+
+
+def ensure_fixture(args):
+    path = fixture_path(args)
+    if not os.path.exists(path):
+        logging.warning(f"[Bench] Building a {args.db_rows:,} packet fixture database in {path}")
+        build_fixture(path, args.db_rows)
+    return path
+
+
+def bench_query(results, args):
+    path = ensure_fixture(args)
+    parser = build_parser()
+    commands = {
+        'query.db_nodes_activity': ['db', 'nodes', 'activity'],
+        'query.db_channels_activity': ['db', 'channels', 'activity'],
+    }
+    with database(os.path.dirname(path)):
+        for name, argv in commands.items():
+            command_args = parser.parse_args(argv)
+
+            def run():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    db_command.handle_db_mode(command_args)
+            # Queries on the large fixture are slow enough to skip the warm-up run; the median absorbs a cold cache
+            results.latency(name, best_of(run, args.query_repeat, clock=time.perf_counter, warmup=False), unit='ms')
+
+
+BENCHES = {
+    'parse': bench_parse,
+    'crypto': bench_crypto,
+    'handler': bench_handler,
+    'crafter': bench_crafter,
+    'db': bench_db,
+    'query': bench_query,
+}
+
+
+def compare(results, baseline, tolerance):
+    """Print the change against the baseline per measurement; return the names that regressed."""
+    regressions = []
+    print(f"\n{'benchmark':<40} {'baseline':>14} {'current':>14} {'change':>8}")
+    for name, entry in results.entries.items():
+        previous = baseline.get(name)
+        if not previous or not previous['value']:
+            continue
+        change = entry['value'] / previous['value'] - 1
+        worse = -change if entry['better'] == 'higher' else change
+        flag = ''
+        if worse > tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<40} {previous['value']:>14,.2f} {entry['value']:>14,.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite with JSON results and baseline comparison")
+    parser.add_argument('--only', type=str, help=f"Comma-separated groups to run (default: all of {','.join(GROUPS)})")
+    parser.add_argument('--count', type=int, default=5000, help='Corpus size for the CPU groups (default: 5000)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed passes per CPU case (default: 5)')
+    parser.add_argument('--db-rows', type=int, default=10_000_000, help='Packets in the large fixture database (default: 10000000)')
+    parser.add_argument('--db-count', type=int, default=2000, help='Inserts per DB case (default: 2000)')
+    parser.add_argument('--query-repeat', type=int, default=3, help='Timed runs per query (default: 3)')
+    parser.add_argument('--fixtures', type=str, default=os.path.join(tempfile.gettempdir(), 'spooftastic-bench-fixtures'), help='Cache directory for fixture databases')
+    parser.add_argument('--json', type=str, help='Write the results to this JSON file')
+    parser.add_argument('--baseline', type=str, help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed relative slowdown against the baseline (default: 0.15)')
+    args = parser.parse_args()
+    for name in ('json', 'baseline', 'fixtures'):
+        if getattr(args, name):
+            setattr(args, name, os.path.join(INVOKED_FROM, getattr(args, name)))
+    groups = args.only.split(',') if args.only else list(GROUPS)
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(sorted(unknown))}")
+    logging.getLogger().setLevel(logging.WARNING)
+    results = Results()
+    for group in groups:
+        BENCHES[group](results, args)
+    report = {
+        'meta': {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': {k: v for k, v in vars(args).items() if k not in ('json', 'baseline')},
+        },
+        'results': results.entries,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
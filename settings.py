@@ -19,8 +19,69 @@ ROOT_TOPIC = get_env_or_default('ROOT_TOPIC', 'msh/US/2/e/')
 CLIENT_ID = get_env_or_default('CLIENT_ID', 'sftcli')
 CHANNEL = get_env_or_default('CHANNEL', 'LongFast')
 KEY = get_env_or_default('KEY', 'AQ==')
+# Optional file with extra channel keys, one "<channel name> <psk>" per line
+KEYRING_FILE = get_env_or_default('KEYRING_FILE', None)
+# Seconds to wait for a pooled publisher connection before giving up on a send
+PUBLISH_CONNECT_TIMEOUT = float(get_env_or_default('PUBLISH_CONNECT_TIMEOUT', 5.0))
 DEBUG = get_env_or_default('DEBUG', 'False').lower() in ('true', '1', 'yes')
 
+# In-process broker stand-in, used when MQTT_BROKER=local: per-subscriber delivery queue size,
+# optional capture file of everything published, and synthetic traffic fed into it (rate 0 disables)
+LOCAL_BROKER_QUEUE_SIZE = int(get_env_or_default('LOCAL_BROKER_QUEUE_SIZE', 10000))
+LOCAL_BROKER_CAPTURE = get_env_or_default('LOCAL_BROKER_CAPTURE', None)
+LOCAL_TRAFFIC_RATE = float(get_env_or_default('LOCAL_TRAFFIC_RATE', 0))
+LOCAL_TRAFFIC_NODES = int(get_env_or_default('LOCAL_TRAFFIC_NODES', 50))
+LOCAL_TRAFFIC_MIX = get_env_or_default('LOCAL_TRAFFIC_MIX', 'nodeinfo=3,position=3,text=3,telemetry=1')
+LOCAL_TRAFFIC_ENCRYPTED_RATIO = float(get_env_or_default('LOCAL_TRAFFIC_ENCRYPTED_RATIO', 0.8))
+
+# Async sniffer (sniffer --async): decode workers ('thread' or 'process') and raw message inbox size
+SNIFFER_WORKERS = int(get_env_or_default('SNIFFER_WORKERS', os.cpu_count() or 1))
+SNIFFER_WORKER_MODE = get_env_or_default('SNIFFER_WORKER_MODE', 'thread')
+SNIFFER_INBOX_SIZE = int(get_env_or_default('SNIFFER_INBOX_SIZE', 10000))
+
+# Worker processes and records per shard for parallel re-ingest of capture files
+REINGEST_WORKERS = int(get_env_or_default('REINGEST_WORKERS', os.cpu_count() or 1))
+REINGEST_SHARD_RECORDS = int(get_env_or_default('REINGEST_SHARD_RECORDS', 20000))
+
+# Capture files: start a new file after CAPTURE_ROTATE_MB, fsync every CAPTURE_FSYNC_SECONDS
+CAPTURE_ROTATE_MB = int(get_env_or_default('CAPTURE_ROTATE_MB', 256))
+CAPTURE_FSYNC_SECONDS = float(get_env_or_default('CAPTURE_FSYNC_SECONDS', 5.0))
+
+# Worker threads running reactive spoof bursts
+REACTIVE_WORKERS = int(get_env_or_default('REACTIVE_WORKERS', 4))
+
+# Sniffer write-behind ingest queue
+INGEST_QUEUE_SIZE = int(get_env_or_default('INGEST_QUEUE_SIZE', 10000))
+INGEST_BATCH_SIZE = int(get_env_or_default('INGEST_BATCH_SIZE', 500))
+INGEST_FLUSH_MS = int(get_env_or_default('INGEST_FLUSH_MS', 250))
+INGEST_PUT_TIMEOUT = float(get_env_or_default('INGEST_PUT_TIMEOUT', 1.0))
+INGEST_RETRIES = int(get_env_or_default('INGEST_RETRIES', 3))
+INGEST_RETRY_MS = int(get_env_or_default('INGEST_RETRY_MS', 100))
+
+# Pending-ACK tracker: seconds a want_ack packet waits for its ACK, and maximum packets waiting
+ACK_TTL_SECONDS = float(get_env_or_default('ACK_TTL_SECONDS', 300))
+ACK_TRACKER_SIZE = int(get_env_or_default('ACK_TRACKER_SIZE', 100000))
+
+# Database: SQLAlchemy URL (SQLite file or PostgreSQL server) and connections kept per pool
+DB_URL = get_env_or_default('DB_URL', 'sqlite:///meshtastic_nodes.db')
+DB_POOL_SIZE = int(get_env_or_default('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(get_env_or_default('DB_MAX_OVERFLOW', 10))
+
+# SQLite storage profile (legacy, durable, balanced or fast) and "pragma=value,..." overrides
+DB_PROFILE = get_env_or_default('DB_PROFILE', 'balanced')
+DB_PRAGMAS = get_env_or_default('DB_PRAGMAS', '')
+
+# Packet retention: raw packets from days older than DB_RETENTION_DAYS are deleted (0 keeps them),
+# checked every DB_PRUNE_INTERVAL seconds while ingesting, when expired rollups are deleted too
+DB_RETENTION_DAYS = int(get_env_or_default('DB_RETENTION_DAYS', 0))
+DB_PRUNE_INTERVAL = float(get_env_or_default('DB_PRUNE_INTERVAL', 3600))
+
+# Upgrade an outdated database schema when an ingest mode starts; otherwise run `db migrate`
+DB_AUTO_MIGRATE = get_env_or_default('DB_AUTO_MIGRATE', 'True').lower() in ('true', '1', 'yes')
+
+# In-memory node registry in front of node lookups
+NODE_CACHE_SIZE = int(get_env_or_default('NODE_CACHE_SIZE', 50000))
+
 # Logging configuration
 LOGLEVEL = get_env_or_default('LOGLEVEL', 'INFO').upper()
 LOGFORMAT = get_env_or_default('LOGFORMAT', '%(asctime)s - %(levelname)s - %(message)s')
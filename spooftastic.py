@@ -1,9 +1,5 @@
 import logging
 from src.parser import build_parser
-from src.commands.sniffer import handle_sniffer_mode
-from src.commands.send import handle_send_mode
-from src.commands.db import handle_db_mode
-from src.commands.spoofer import handle_spoofer_mode
 
 
 def main():
@@ -12,16 +8,39 @@ def main():
     global DEBUG
     DEBUG = getattr(args, 'debug', False)
     logging.getLogger().setLevel(logging.DEBUG if DEBUG else logging.INFO)
+    # Handlers are imported by their mode only: importing the DB backed ones opens (and creates) the DB
     match args.mode:
         case 'sniffer':
+            from src.commands.sniffer import handle_sniffer_mode
             handle_sniffer_mode(args)
         case 'send':
+            from src.commands.send import handle_send_mode
             handle_send_mode(args)
         case 'db':
+            from src.commands.db import handle_db_mode
             handle_db_mode(args)
         case 'spoofer':
+            from src.commands.spoofer import handle_spoofer_mode
             handle_spoofer_mode(args)
+        case 'campaign':
+            from src.commands.campaign import handle_campaign_mode
+            handle_campaign_mode(args)
+        case 'capture':
+            from src.commands.capture import handle_capture_mode
+            handle_capture_mode(args)
+        case 'replay':
+            from src.commands.replay import handle_replay_mode
+            handle_replay_mode(args)
+        case 'reingest':
+            from src.commands.reingest import handle_reingest_mode
+            handle_reingest_mode(args)
+        case 'generate':
+            from src.commands.generate import handle_generate_mode
+            handle_generate_mode(args)
+        case 'analyze':
+            from src.commands.analyze import handle_analyze_mode
+            handle_analyze_mode(args)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from settings import MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, ROOT_TOPIC, CHANNEL, CLIENT_ID, KEYRING_FILE, SNIFFER_WORKERS, SNIFFER_WORKER_MODE, SNIFFER_INBOX_SIZE
+from src.agents.sniffer import Sniffer
+from src.clients.mqtt_client import connect_and_get_client, disconnect_client
+from src.mesh.keyring import Keyring
+from src.mesh.packet.context import MessageContext
+from src.mesh.packet.filters import PacketFilter
+from src.mesh.packet.handler import decrypt_context, process_message
+
+_STOP = object()
+# Messages handed to a decode worker per call; batching amortizes the executor hand-off
+DECODE_BATCH = 64
+
+# Per-process state of process-pool decode workers, set by _init_worker
+_worker_keyring = None
+_worker_filter = None
+
+
+def _init_worker(key, keyring_file, packet_filter):
+    global _worker_keyring, _worker_filter
+    _worker_keyring = Keyring.for_channel(CHANNEL, key, keyring_file)
+    _worker_filter = packet_filter
+
+
+def decode_message(topic, payload, received_at, keyring=None, packet_filter=None, record_all=False):
+    """
+    CPU-bound part of the pipeline: parse the envelope, apply the header filter and decrypt.
+    Returns the MessageContext, or None when the header filter drops the packet.
+    Runs in decode workers; without keyring/packet_filter it uses the process-pool worker state.
+    """
+    keyring = keyring if keyring is not None else _worker_keyring
+    packet_filter = packet_filter if packet_filter is not None else _worker_filter
+    ctx = MessageContext(topic, payload, received_at).parse()
+    if ctx.packet is None:
+        return ctx if record_all else None
+    if packet_filter is not None and not record_all and not packet_filter.accepts_header(ctx):
+        return None
+    decrypt_context(ctx, keyring)
+    return ctx
+
+
+def decode_batch(items, **kwargs):
+    """Decode a list of (topic, payload, received_at); returns (contexts, filtered, failed)."""
+    contexts = []
+    filtered = failed = 0
+    for item in items:
+        try:
+            ctx = decode_message(*item, **kwargs)
+        except Exception as e:
+            failed += 1
+            logging.info(f"[AsyncSniffer] Error decoding message: {e}")
+            continue
+        if ctx is None:
+            filtered += 1
+        else:
+            contexts.append(ctx)
+    return contexts, filtered, failed
+
+
+class AsyncSniffer(Sniffer):
+    """
+    asyncio variant of the sniffer.
+
+    paho's network thread only hands raw payloads to the event loop. A pool of decode
+    workers (threads, or processes to use several cores) parses, filters and decrypts,
+    and a single writer task runs the packet handlers and owns persistence: it feeds the
+    ingest queue and flushes it to the DB on a dedicated thread, so a slow commit never
+    blocks socket reads or decoding.
+    """
+    def __init__(self, key=None, debug=False, keyring_file=None, workers=SNIFFER_WORKERS, worker_mode=SNIFFER_WORKER_MODE, inbox_size=SNIFFER_INBOX_SIZE):
+        super().__init__(key=key, debug=debug, keyring_file=keyring_file)
+        self.keyring_file = keyring_file or KEYRING_FILE
+        self.workers = max(1, workers)
+        self.worker_mode = worker_mode
+        self.inbox_size = inbox_size
+        self.counters = {'received': 0, 'dropped': 0, 'filtered': 0, 'failed': 0, 'processed': 0}
+
+    def _enqueue(self, item):
+        # Runs on the event loop, scheduled from paho's network thread
+        try:
+            self._inbox.put_nowait(item)
+            self.counters['received'] += 1
+        except asyncio.QueueFull:
+            self.counters['dropped'] += 1
+            if self.counters['dropped'] == 1 or self.counters['dropped'] % 1000 == 0:
+                logging.warning(f"[AsyncSniffer] Inbox full, dropped {self.counters['dropped']} messages so far")
+
+    def _make_executor(self, packet_filter, record_all):
+        if self.worker_mode == 'process':
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker, initargs=(self.key, self.keyring_file, packet_filter)
+            )
+            return executor, partial(decode_batch, record_all=record_all)
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='decode')
+        return executor, partial(decode_batch, keyring=self.keyring, packet_filter=packet_filter, record_all=record_all)
+
+    async def _decoder(self, executor, decode):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            items = []
+            item = await self._inbox.get()
+            while True:
+                # Each decoder consumes exactly one stop marker
+                if item is _STOP:
+                    stopping = True
+                    break
+                items.append(item)
+                if len(items) >= DECODE_BATCH or self._inbox.empty():
+                    break
+                item = self._inbox.get_nowait()
+            if not items:
+                continue
+            try:
+                contexts, filtered, failed = await loop.run_in_executor(executor, decode, items)
+            except Exception as e:
+                self.counters['failed'] += len(items)
+                logging.error(f"[AsyncSniffer] Decode worker failed: {e}")
+                continue
+            self.counters['filtered'] += filtered
+            self.counters['failed'] += failed
+            for ctx in contexts:
+                await self._outbox.put(ctx)
+
+    async def _writer(self, db_executor, packet_filter, callback, record_all):
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.ingest.flush_interval
+        stopping = False
+        while not stopping:
+            try:
+                ctx = await asyncio.wait_for(self._outbox.get(), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                ctx = None
+            # Handle whatever else is already waiting without going back through wait_for
+            while ctx is not None:
+                if ctx is _STOP:
+                    stopping = True
+                    break
+                try:
+                    process_message(ctx, self.keyring, packet_filter=packet_filter, callback=callback, writer=self.ingest, record_all=record_all)
+                    self.counters['processed'] += 1
+                except Exception as e:
+                    self.counters['failed'] += 1
+                    logging.info(f"[AsyncSniffer] Error handling message: {e}")
+                if self.ingest.pending >= self.ingest.batch_size or self._outbox.empty():
+                    break
+                ctx = self._outbox.get_nowait()
+            if self.ingest.pending >= self.ingest.batch_size or time.monotonic() >= deadline:
+                if self.ingest.pending:
+                    await loop.run_in_executor(db_executor, self.ingest.flush)
+                deadline = time.monotonic() + self.ingest.flush_interval
+        await loop.run_in_executor(db_executor, self.ingest.flush)
+
+    async def _run(self, packet_filter, callback, record_all):
+        loop = asyncio.get_running_loop()
+        self._inbox = asyncio.Queue(maxsize=self.inbox_size)
+        self._outbox = asyncio.Queue(maxsize=self.inbox_size)
+        executor, decode = self._make_executor(packet_filter, record_all)
+        db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        # More decoder tasks than workers keeps the pool busy while results are handed over
+        decoders = [asyncio.create_task(self._decoder(executor, decode)) for _ in range(self.workers * 2)]
+        writer = asyncio.create_task(self._writer(db_executor, packet_filter, callback, record_all))
+
+        def on_message(client, userdata, msg):
+            loop.call_soon_threadsafe(self._enqueue, (msg.topic, msg.payload, time.time()))
+
+        self.mqtt_client = connect_and_get_client(
+            MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, self.key, self.debug, lambda: None, self.publish_topic, CLIENT_ID
+        )
+        topic = packet_filter.topic if packet_filter.topic else f"{ROOT_TOPIC}#"
+        self.mqtt_client.client.on_message = on_message
+        self.mqtt_client.client.subscribe(topic)
+        logging.info(f"AsyncSniffer: Subscribed to {topic} with {self.workers} {self.worker_mode} decode workers.")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            # Stop receiving, let the decoders drain the inbox, then the writer the outbox
+            disconnect_client(self.mqtt_client, self.debug)
+            self.mqtt_client = None
+            await asyncio.sleep(0)
+            for _ in decoders:
+                await self._inbox.put(_STOP)
+            await asyncio.gather(*decoders)
+            await self._outbox.put(_STOP)
+            await writer
+            executor.shutdown()
+            db_executor.shutdown()
+
+    def sniff(
+            self,
+            node_id=None,
+            callback=None,
+            enabled_portnums=None,
+            packet_filter=None,
+            record_all=False
+    ):
+        if packet_filter is None:
+            packet_filter = PacketFilter(from_ids=[node_id] if node_id else None, portnums=enabled_portnums)
+        self.packet_filter = packet_filter
+        try:
+            asyncio.run(self._run(packet_filter, callback, record_all))
+        except KeyboardInterrupt:
+            logging.info("AsyncSniffer: Exiting.")
+        finally:
+            logging.info(f"[AsyncSniffer] {self.counters}")
+            self.close()
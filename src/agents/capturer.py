@@ -0,0 +1,37 @@
+import logging
+import time
+from src.clients.mqtt_client import connect_and_get_client, disconnect_client
+from src.clients.capture import CaptureWriter
+from settings import MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, ROOT_TOPIC, CHANNEL, BROADCAST_MAC, CLIENT_ID
+from src.utils import set_topic
+
+class Capturer:
+    """Records raw broker traffic to a capture file without decoding it."""
+    def __init__(self, path, debug=False, **writer_kwargs):
+        self.debug = debug
+        self.mqtt_client = None
+        self.publish_topic = set_topic(BROADCAST_MAC, ROOT_TOPIC, CHANNEL)
+        self.writer = CaptureWriter(path, **writer_kwargs)
+
+    def close(self):
+        if self.mqtt_client:
+            disconnect_client(self.mqtt_client, self.debug)
+            self.mqtt_client = None
+        self.writer.close()
+
+    def capture(self, topic=None):
+        topic = topic or f"{ROOT_TOPIC}#"
+        self.mqtt_client = connect_and_get_client(
+            MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, None, self.debug, lambda: None, self.publish_topic, CLIENT_ID
+        )
+        self.mqtt_client.client.on_message = lambda client, userdata, msg: self.writer.write(msg.topic, msg.payload)
+        self.mqtt_client.client.subscribe(topic)
+        logging.info(f"Capturer: Subscribed to {topic}.")
+        try:
+            while True:
+                time.sleep(10)
+                logging.info(f"[Capture] {self.writer.records} records, {self.writer.bytes} bytes")
+        except KeyboardInterrupt:
+            logging.info("Capturer: Exiting capture.")
+        finally:
+            self.close()
@@ -0,0 +1,71 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from settings import REACTIVE_WORKERS
+from src.utils import LatencyHistogram
+
+
+class ReactiveScheduler:
+    """
+    Runs reactive spoof bursts on a bounded worker pool.
+
+    Bursts are keyed (typically by (node, portnum)); a trigger that arrives while a
+    burst with the same key is still in flight is coalesced into it instead of starting
+    a second, racing burst. Trigger to first publish latency is recorded in `latency`.
+    """
+    def __init__(self, max_workers=REACTIVE_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='reactive')
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self.latency = LatencyHistogram()
+        self.triggered = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    def trigger(self, key, burst_fn, triggered_at=None, latency=None):
+        """
+        Schedule burst_fn(on_publish) for key unless a burst for key is already running.
+        burst_fn must call on_publish() right after its first publish so the
+        trigger->publish latency can be measured from `triggered_at` (perf_counter time)
+        into `latency` (defaults to self.latency). Returns False if the trigger was coalesced.
+        """
+        triggered_at = time.perf_counter() if triggered_at is None else triggered_at
+        with self._lock:
+            if key in self._in_flight:
+                self.coalesced += 1
+                return False
+            self._in_flight.add(key)
+            self.triggered += 1
+        self._executor.submit(self._run, key, burst_fn, triggered_at, latency or self.latency)
+        return True
+
+    def _run(self, key, burst_fn, triggered_at, latency):
+        recorded = []
+        def on_publish():
+            if not recorded:
+                recorded.append(True)
+                latency.record(time.perf_counter() - triggered_at)
+        try:
+            burst_fn(on_publish)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logging.error(f"[Reactive] Burst for {key} failed: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+
+    def close(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def stats(self):
+        with self._lock:
+            counters = {
+                'triggered': self.triggered,
+                'coalesced': self.coalesced,
+                'failed': self.failed,
+                'in_flight': len(self._in_flight),
+            }
+        counters['latency'] = self.latency.stats()
+        return counters
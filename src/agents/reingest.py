@@ -0,0 +1,122 @@
+import logging
+import mmap
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from settings import CHANNEL, KEYRING_FILE, REINGEST_WORKERS, REINGEST_SHARD_RECORDS
+from src.clients.capture import capture_files, iter_records, load_index
+from src.clients.db_client import DB
+from src.clients.ingest_queue import IngestQueue, WriteRecorder
+from src.mesh.keyring import Keyring
+from src.mesh.packet.context import MessageContext
+from src.mesh.packet.handler import process_message
+from src.utils import ensure_aes_key
+
+# Per-process state of reingest workers, set by _init_worker
+_worker_keyring = None
+_worker_filter = None
+_worker_maps = {}
+
+
+def _init_worker(key, keyring_file, packet_filter, debug):
+    global _worker_keyring, _worker_filter
+    DB.reset_after_fork()
+    # Per-packet handler logs from every worker would drown the progress output
+    logging.getLogger().setLevel(logging.DEBUG if debug else logging.WARNING)
+    _worker_keyring = Keyring.for_channel(CHANNEL, key, keyring_file)
+    _worker_filter = packet_filter
+
+
+def _mapped(path):
+    buf = _worker_maps.get(path)
+    if buf is None:
+        with open(path, 'rb') as f:
+            buf = _worker_maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return buf
+
+
+def reingest_shard(path, start, count, record_all=False):
+    """
+    Parse, decrypt and handle `count` capture records starting at byte offset `start`.
+    Runs in a worker process; returns the recorded DB writes and the shard's counters.
+    """
+    writer = WriteRecorder()
+    decrypted, failed = _worker_keyring.decrypted, 0
+    for record in iter_records(_mapped(path), start, count):
+        try:
+            ctx = MessageContext(record.topic, record.payload, record.received_at).parse()
+            if ctx.packet is not None or record_all:
+                process_message(ctx, _worker_keyring, packet_filter=_worker_filter, writer=writer, record_all=record_all)
+        except Exception as e:
+            failed += 1
+            logging.debug(f"[Reingest] Error handling record in {path}: {e}")
+    return writer.items, {'records': count, 'decrypted': _worker_keyring.decrypted - decrypted, 'failed': failed}
+
+
+class Reingester:
+    """
+    Re-decodes capture files on a process pool and bulk-loads the results.
+
+    Capture files are cut into shards of `shard_records` records with their sidecar offset
+    index. Workers map the files themselves and parse, decrypt and handle their shards on
+    payloads sliced straight out of the mapping, recording DB writes instead of performing
+    them. The parent applies each shard's writes in file order as one ingest_batch
+    transaction, so node updates resolve the same way as in a sequential replay.
+    """
+    def __init__(self, key=None, debug=False, keyring_file=None, workers=REINGEST_WORKERS, shard_records=REINGEST_SHARD_RECORDS):
+        self.key = ensure_aes_key(key)
+        self.debug = debug
+        self.keyring_file = keyring_file or KEYRING_FILE
+        self.workers = max(1, workers)
+        self.shard_records = max(1, shard_records)
+        self.counters = {'shards': 0, 'records': 0, 'decrypted': 0, 'failed': 0, 'writes': 0}
+
+    def shards(self, paths):
+        """(file, start offset, record count) for every shard of the capture files, in order."""
+        shards = []
+        for path in paths:
+            for file in capture_files(path) or [path]:
+                offsets = load_index(file)
+                for i in range(0, len(offsets), self.shard_records):
+                    shards.append((file, offsets[i], min(self.shard_records, len(offsets) - i)))
+        return shards
+
+    def _merge(self, result, ingest):
+        items, counters = result
+        ingest.write(items)
+        self.counters['shards'] += 1
+        self.counters['writes'] += len(items)
+        for name, value in counters.items():
+            self.counters[name] += value
+
+    def run(self, paths, packet_filter=None, record_all=False):
+        shards = self.shards(paths)
+        total = sum(count for _, _, count in shards)
+        logging.info(f"[Reingest] {total} records in {len(shards)} shards, {self.workers} workers")
+        DB.prepare_ingest()
+        ingest = IngestQueue(DB)
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker,
+            initargs=(self.key, self.keyring_file, packet_filter, self.debug)
+        )
+        # Keep a couple of shards per worker in flight while the parent merges in order
+        pending = deque()
+        window = self.workers * 2
+        started = time.monotonic()
+        try:
+            for shard in shards:
+                pending.append(executor.submit(reingest_shard, *shard, record_all))
+                if len(pending) >= window:
+                    self._merge(pending.popleft().result(), ingest)
+                    logging.info(f"[Reingest] {self.counters['records']}/{total} records")
+            while pending:
+                self._merge(pending.popleft().result(), ingest)
+        except KeyboardInterrupt:
+            logging.info("Reingester: Interrupted.")
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            elapsed = time.monotonic() - started
+            logging.info(f"[Reingest] {self.counters} in {elapsed:.2f}s ({self.counters['records'] / elapsed if elapsed else 0:.0f} records/s)")
+            logging.info(f"[Ingest] {ingest.stats()}")
+            logging.info(f"[ACK] {DB.acks.stats()}")
+        return self.counters
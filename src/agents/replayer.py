@@ -0,0 +1,37 @@
+import logging
+import time
+from src.agents.sniffer import Sniffer
+from src.clients.capture import read_captures
+from src.mesh.packet.handler import filtered_on_message_factory
+
+class Replayer(Sniffer):
+    """
+    Feeds capture files through the sniffer's on_message pipeline instead of a broker.
+    Stored timestamps are the recorded receive times, so a replay rebuilds the same DB rows.
+    """
+    def replay(self, paths, callback=None, packet_filter=None, record_all=False, realtime=False, speed=1.0):
+        self.ingest.start()
+        self.packet_filter = packet_filter
+        handler = filtered_on_message_factory(
+            callback=callback, key=self.keyring, writer=self.ingest, packet_filter=packet_filter, record_all=record_all
+        )
+        count = 0
+        started = time.monotonic()
+        first_ts = None
+        try:
+            for record in read_captures(paths):
+                if realtime:
+                    # Keep the recorded spacing between messages (scaled by speed)
+                    first_ts = record.received_at if first_ts is None else first_ts
+                    delay = (record.received_at - first_ts) / speed - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+                handler(None, None, record)
+                count += 1
+        except KeyboardInterrupt:
+            logging.info("Replayer: Interrupted.")
+        finally:
+            elapsed = time.monotonic() - started
+            logging.info(f"[Replay] {count} messages in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f} msg/s)")
+            self.close()
+        return count
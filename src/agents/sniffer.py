@@ -1,42 +1,64 @@
 import logging
 import time
 from src.clients.mqtt_client import connect_and_get_client, disconnect_client
-from settings import MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, ROOT_TOPIC, CHANNEL, BROADCAST_MAC, CLIENT_ID
+from settings import MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, ROOT_TOPIC, CHANNEL, BROADCAST_MAC, CLIENT_ID, KEYRING_FILE
 from src.utils import set_topic, ensure_aes_key
 from src.mesh.packet.handler import filtered_on_message_factory
+from src.clients.db_client import DB
+from src.clients.ingest_queue import IngestQueue
+from src.mesh.keyring import Keyring
 
 class Sniffer:
     """Encapsulates listen mode logic for Meshtastic MQTT packets."""
-    def __init__(self, key=None, debug=False):
+    def __init__(self, key=None, debug=False, keyring_file=None):
         self.key = ensure_aes_key(key)
+        # The configured key is indexed under CHANNEL and also tried on any other channel,
+        # extra keys come from the keyring file
+        self.keyring = Keyring.for_channel(CHANNEL, self.key, keyring_file or KEYRING_FILE)
         self.debug = debug
         self.mqtt_client = None
         self.publish_topic = set_topic(BROADCAST_MAC, ROOT_TOPIC, CHANNEL)
+        DB.prepare_ingest()
+        self.ingest = IngestQueue(DB)
+        self.packet_filter = None
 
     def close(self):
         if self.mqtt_client:
             disconnect_client(self.mqtt_client, self.debug)
             self.mqtt_client = None
+        # Stop receiving first, then make sure every queued write reaches the DB
+        self.ingest.close()
+        logging.info(f"[NodeRegistry] {DB.nodes.stats()}")
+        logging.info(f"[ACK] {DB.acks.stats()}")
+        logging.info(f"[Keyring] {self.keyring.stats()}")
+        if self.packet_filter:
+            logging.info(f"[Filter] {self.packet_filter.stats()}")
 
     def sniff(
             self,
             node_id=None,
             callback=None,
-            enabled_portnums=None
+            enabled_portnums=None,
+            packet_filter=None,
+            record_all=False
     ):
+        self.ingest.start()
+        self.packet_filter = packet_filter
         self.mqtt_client = connect_and_get_client(
             MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, self.key, self.debug, lambda: None, self.publish_topic, CLIENT_ID
         )
-        topic = f"{ROOT_TOPIC}#"
+        topic = packet_filter.topic if packet_filter and packet_filter.topic else f"{ROOT_TOPIC}#"
         self.mqtt_client.client.subscribe(topic)
         logging.info(f"Sniffer: Subscribed to {topic} for node {node_id}.")
         self.mqtt_client.client.on_message = filtered_on_message_factory(
-            node_id=node_id, callback=callback, enabled_portnums=enabled_portnums, key=self.key
+            node_id=node_id, callback=callback, enabled_portnums=enabled_portnums, key=self.keyring, writer=self.ingest,
+            packet_filter=packet_filter, record_all=record_all
         )
         try:
             while True:
                 time.sleep(0.5)
         except KeyboardInterrupt:
             logging.info("Sniffer: Exiting node sniff.")
-        self.close()
+        finally:
+            self.close()
 
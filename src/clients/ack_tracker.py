@@ -0,0 +1,114 @@
+import threading
+from collections import OrderedDict
+from settings import ACK_TTL_SECONDS, ACK_TRACKER_SIZE
+from src.utils import LatencyHistogram
+
+# Mesh ACKs take from a fraction of a second to the whole retransmission window
+ACK_BUCKETS_MS = (100, 250, 500, 1000, 2000, 5000, 10000, 20000, 30000, 60000, 120000)
+
+
+class AckTracker:
+    """
+    In-memory table of stored packets waiting for an ACK, keyed by packet id.
+
+    A want_ack packet is tracked with the id of its node_packet row and the time it was first
+    heard; a copy heard again through another gateway points the entry to the newest row.
+    resolve() pops the entry an ACK answers and returns the row and the response time,
+    leaving the DB update to the caller so ACKs can be written in batches. An ACK it misses
+    (expired, evicted, or for a packet another process stored) is looked up in the DB by the
+    caller, which reports a match with recovered_from_db().
+
+    Time follows the ACKs' receive timestamps rather than the wall clock, so replays and
+    reingests expire entries like live traffic: entries more than `ttl` seconds older than
+    the newest ACK seen are dropped, and the oldest ones beyond `capacity`. Only ACKs move
+    the clock, so a batch that tracks all its packets before resolving its ACKs expires
+    nothing early.
+    """
+    def __init__(self, ttl=ACK_TTL_SECONDS, capacity=ACK_TRACKER_SIZE):
+        self.ttl = ttl
+        self.capacity = max(1, capacity)
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._clock = None
+        self.latency = LatencyHistogram(ACK_BUCKETS_MS)
+        self.tracked = 0
+        self.resolved = 0
+        self.unmatched = 0
+        self.recovered = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def track(self, packet_id, row_id, sent_at):
+        """Wait for the ACK of packet_id, stored in row `row_id` and heard at `sent_at` (epoch seconds)."""
+        with self._lock:
+            entry = self._pending.get(packet_id)
+            if entry is not None:
+                entry[0] = row_id
+                return
+            self._pending[packet_id] = [row_id, sent_at]
+            self.tracked += 1
+            while len(self._pending) > self.capacity:
+                self._pending.popitem(last=False)
+                self.evictions += 1
+
+    def resolve(self, request_id, acked_at):
+        """Return (row_id, response time in seconds) for the packet ACKed by request_id, or None if none is waiting."""
+        with self._lock:
+            self._advance(acked_at)
+            entry = self._pending.pop(request_id, None)
+            if entry is None:
+                self.unmatched += 1
+                return None
+            self.resolved += 1
+        row_id, sent_at = entry
+        response_time = max(0.0, acked_at - sent_at)
+        self.latency.record(response_time)
+        return row_id, response_time
+
+    def recovered_from_db(self, response_time):
+        """Count an ACK resolve() missed that matched a stored packet, answered after `response_time` seconds."""
+        with self._lock:
+            self.recovered += 1
+        self.latency.record(response_time)
+
+    def warm(self, packets):
+        """Track (packet_id, row_id, sent_at) tuples, oldest first, e.g. the unACKed packets of a reopened DB."""
+        for packet_id, row_id, sent_at in packets:
+            self.track(packet_id, row_id, sent_at)
+        with self._lock:
+            self.tracked = 0
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._clock = None
+
+    def stats(self):
+        with self._lock:
+            counters = {
+                'pending': len(self._pending),
+                'tracked': self.tracked,
+                'resolved': self.resolved,
+                'unmatched': self.unmatched,
+                'recovered': self.recovered,
+                'expired': self.expired,
+                'evictions': self.evictions,
+            }
+        counters['response_time'] = self.latency.stats()
+        return counters
+
+    def _advance(self, now):
+        # Entries are in arrival order, so the expired ones are at the front
+        if self._clock is not None and now <= self._clock:
+            return
+        self._clock = now
+        cutoff = now - self.ttl
+        while self._pending:
+            _, sent_at = next(iter(self._pending.values()))
+            if sent_at >= cutoff:
+                break
+            self._pending.popitem(last=False)
+            self.expired += 1
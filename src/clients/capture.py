@@ -0,0 +1,220 @@
+import glob
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from settings import CAPTURE_ROTATE_MB, CAPTURE_FSYNC_SECONDS
+
+# File header: magic + format version
+FILE_HEADER = struct.Struct('<6sH')
+MAGIC = b'SFTCAP'
+VERSION = 1
+# Record header: receive time (unix seconds), topic length, payload length; followed by topic and payload
+RECORD_HEADER = struct.Struct('<dHI')
+# Sidecar index (<capture>.idx): magic, version, size of the indexed capture file; followed by uint64 record offsets
+INDEX_HEADER = struct.Struct('<6sHQ')
+INDEX_MAGIC = b'SFTIDX'
+
+
+class CaptureRecord:
+    """One captured MQTT message. Has the topic/payload attributes handlers read from paho messages."""
+    __slots__ = ('topic', 'payload', 'received_at')
+
+    def __init__(self, topic, payload, received_at):
+        self.topic = topic
+        self.payload = payload
+        self.received_at = received_at
+
+
+def rotated_path(path, index):
+    """capture.sfcap -> capture.0001.sfcap for index 1 (index 0 is the path itself)."""
+    if index == 0:
+        return path
+    stem, suffix = os.path.splitext(path)
+    return f"{stem}.{index:04d}{suffix}"
+
+
+def capture_files(path):
+    """Return a capture file followed by its rotated continuations, in order."""
+    stem, suffix = os.path.splitext(path)
+    rotated = sorted(glob.glob(f"{glob.escape(stem)}.[0-9][0-9][0-9][0-9]{glob.escape(suffix)}"))
+    return ([path] if os.path.exists(path) else []) + rotated
+
+
+def next_rotation(path):
+    """Index of the next file of a capture (see rotated_path): one past the last existing one, gaps included."""
+    files = capture_files(path)
+    if not files:
+        return 0
+    if files[-1] == path:
+        return 1
+    stem, suffix = os.path.splitext(path)
+    return int(files[-1][len(stem) + 1:len(files[-1]) - len(suffix)]) + 1
+
+
+class CaptureWriter:
+    """
+    Appends raw MQTT messages to a length-prefixed capture file.
+
+    Writes are buffered; the file is fsynced every `fsync_interval` seconds and on close,
+    and a new file (see rotated_path) is started once the current one exceeds `rotate_bytes`.
+    """
+    def __init__(self, path, rotate_bytes=CAPTURE_ROTATE_MB * 1024 * 1024, fsync_interval=CAPTURE_FSYNC_SECONDS):
+        self.path = path
+        self.rotate_bytes = rotate_bytes
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._index = next_rotation(path)
+        self._file = None
+        self._size = 0
+        self._last_sync = time.monotonic()
+        self.records = 0
+        self.bytes = 0
+        self._open_next()
+
+    def _open_next(self):
+        if self._file:
+            self._sync()
+            self._file.close()
+        current = rotated_path(self.path, self._index)
+        # Never truncate a capture file that appeared meanwhile, e.g. from another writer
+        while os.path.exists(current):
+            self._index += 1
+            current = rotated_path(self.path, self._index)
+        self._index += 1
+        # An index left by an earlier file of the same name would describe other records
+        if os.path.exists(index_path(current)):
+            os.remove(index_path(current))
+        self._file = open(current, 'xb')
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self._size = FILE_HEADER.size
+        logging.info(f"[Capture] Writing to {current}")
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def write(self, topic, payload, received_at=None):
+        topic_bytes = topic.encode('utf-8')
+        record = RECORD_HEADER.pack(time.time() if received_at is None else received_at, len(topic_bytes), len(payload))
+        with self._lock:
+            if self._size >= self.rotate_bytes:
+                self._open_next()
+            self._file.write(record)
+            self._file.write(topic_bytes)
+            self._file.write(payload)
+            written = RECORD_HEADER.size + len(topic_bytes) + len(payload)
+            self._size += written
+            self.records += 1
+            self.bytes += written
+            if time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._sync()
+                self._file.close()
+                self._file = None
+        logging.info(f"[Capture] Closed after {self.records} records ({self.bytes} bytes)")
+
+
+def read_capture(path):
+    """Yield the CaptureRecords of one capture file; a truncated last record is skipped."""
+    with open(path, 'rb') as f:
+        magic, version = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a capture file (version {VERSION})")
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if not header:
+                return
+            if len(header) < RECORD_HEADER.size:
+                logging.warning(f"[Capture] Truncated record header at the end of {path}")
+                return
+            received_at, topic_len, payload_len = RECORD_HEADER.unpack(header)
+            body = f.read(topic_len + payload_len)
+            if len(body) < topic_len + payload_len:
+                logging.warning(f"[Capture] Truncated record at the end of {path}")
+                return
+            yield CaptureRecord(body[:topic_len].decode('utf-8'), body[topic_len:], received_at)
+
+
+def read_captures(paths):
+    """Yield the records of several capture files (and their rotated continuations) in order."""
+    for path in paths:
+        for file in capture_files(path) or [path]:
+            yield from read_capture(file)
+
+
+def index_path(path):
+    return f"{path}.idx"
+
+
+def _check_header(buf, path):
+    if len(buf) < FILE_HEADER.size:
+        raise ValueError(f"{path} is not a capture file (version {VERSION})")
+    magic, version = FILE_HEADER.unpack_from(buf)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a capture file (version {VERSION})")
+
+
+def build_index(path):
+    """
+    Walk the record headers of a capture file and return the offsets of its complete records,
+    writing them to the sidecar index so later readers can skip the walk.
+    """
+    offsets = array('Q')
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        _check_header(buf, path)
+        size = len(buf)
+        pos = FILE_HEADER.size
+        while pos + RECORD_HEADER.size <= size:
+            _, topic_len, payload_len = RECORD_HEADER.unpack_from(buf, pos)
+            end = pos + RECORD_HEADER.size + topic_len + payload_len
+            if end > size:
+                break
+            offsets.append(pos)
+            pos = end
+    if pos != size:
+        logging.warning(f"[Capture] Ignoring truncated record at the end of {path}")
+    try:
+        with open(index_path(path), 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, VERSION, size))
+            offsets.tofile(f)
+    except OSError as e:
+        logging.warning(f"[Capture] Could not write index for {path}: {e}")
+    return offsets
+
+
+def load_index(path):
+    """Return the record offsets of a capture file from its sidecar index, rebuilding a missing or stale one."""
+    try:
+        with open(index_path(path), 'rb') as f:
+            magic, version, size = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            if magic == INDEX_MAGIC and version == VERSION and size == os.path.getsize(path):
+                offsets = array('Q')
+                offsets.frombytes(f.read())
+                return offsets
+    except (OSError, struct.error):
+        pass
+    return build_index(path)
+
+
+def iter_records(buf, start, count):
+    """
+    Yield `count` CaptureRecords from a mapped capture file starting at byte offset `start`.
+    Payloads are memoryview slices of `buf`, so nothing is copied until they are parsed.
+    """
+    view = memoryview(buf)
+    pos = start
+    for _ in range(count):
+        received_at, topic_len, payload_len = RECORD_HEADER.unpack_from(buf, pos)
+        topic_start = pos + RECORD_HEADER.size
+        payload_start = topic_start + topic_len
+        pos = payload_start + payload_len
+        yield CaptureRecord(str(view[topic_start:payload_start], 'utf-8'), view[payload_start:pos], received_at)
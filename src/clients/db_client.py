@@ -1,14 +1,96 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func, literal, literal_column, insert, delete, select, inspect, bindparam, case
 from sqlalchemy.orm import sessionmaker, Session
+from datetime import datetime, timedelta
 import threading
+import time
 import os
-from src.utils import num_to_id, num_to_mac
-from settings import CHANNEL, KEY
-from src.models import Node, Channel, channel_node_association, Base, NodeModel, ChannelModel
+from src.utils import num_to_id, num_to_mac, id_to_num, mac_to_num
+from settings import CHANNEL, KEY, DB_AUTO_MIGRATE, DB_URL, DB_RETENTION_DAYS, DB_PRUNE_INTERVAL
+from src.models import Node, NodePacket, Channel, channel_node_association, Base, NodeModel, ChannelModel, PacketRollup, ROLLUP_MINUTE, ROLLUP_HOUR, ROLLUP_DAY, ROLLUP_PERIODS
+from src.clients.node_registry import NodeRegistry, MISS
+from src.clients.ack_tracker import AckTracker
+from src.clients import db_migrations, db_storage
 from pydantic import ValidationError
 import logging
 
-DB_URL = 'sqlite:///meshtastic_nodes.db'
+# strftime formats truncating a stored timestamp to its rollup bucket, in SQLAlchemy's DateTime format
+ROLLUP_BUCKET_FORMATS = {
+    ROLLUP_MINUTE: '%Y-%m-%d %H:%M:00.000000',
+    ROLLUP_HOUR: '%Y-%m-%d %H:00:00.000000',
+    ROLLUP_DAY: '%Y-%m-%d 00:00:00.000000',
+}
+# date_trunc() units of the rollup buckets on PostgreSQL, which stores real timestamps
+ROLLUP_BUCKET_UNITS = {ROLLUP_MINUTE: 'minute', ROLLUP_HOUR: 'hour', ROLLUP_DAY: 'day'}
+# Longest window read from each rollup level; longer ones (and all time) use daily buckets
+ROLLUP_WINDOWS = ((ROLLUP_MINUTE, timedelta(hours=6)), (ROLLUP_HOUR, timedelta(days=7)))
+ROLLUP_KEY = ['period', 'bucket', 'channel_id', 'node_id', 'packet_type']
+# Packets deleted per transaction when pruning, so ingest can run in between
+PRUNE_CHUNK_ROWS = 20000
+
+def _bucket_expression(dialect_name, period, column):
+    """SQL truncating `column` to the start of its rollup bucket."""
+    if dialect_name == 'sqlite':
+        return func.strftime(ROLLUP_BUCKET_FORMATS[period], column)
+    return func.date_trunc(literal_column(f"'{ROLLUP_BUCKET_UNITS[period]}'"), column)
+
+def _bucket_start(timestamp, period):
+    if period == ROLLUP_DAY:
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    # Shorter periods divide an hour, so the bucket only depends on the minutes and seconds
+    return timestamp - timedelta(seconds=(timestamp.minute * 60 + timestamp.second) % period, microseconds=timestamp.microsecond)
+
+# Node columns an update may set; the identity columns and freeze are handled on their own
+NODE_FIELDS = tuple(column.name for column in Node.__table__.columns if column.name not in ('id', 'node_number', 'node_mac', 'node_id', 'freeze'))
+NODE_FIELD_TYPES = {name: Node.__table__.c[name].type.python_type for name in NODE_FIELDS}
+
+def _node_upsert_statement(engine):
+    """
+    INSERT ... ON CONFLICT(node_number) DO UPDATE for _node_params rows: null fields keep the
+    stored value (COALESCE), a frozen node only takes a new freeze value, freeze is kept when
+    not given. node_mac and node_id follow from node_number, so node_number alone identifies a node.
+    """
+    table = Node.__table__
+    stmt = db_storage.upsert_insert(engine, table).values(
+        node_number=bindparam('node_number'),
+        node_mac=bindparam('node_mac'),
+        node_id=bindparam('node_id'),
+        freeze=func.coalesce(bindparam('set_freeze'), False),
+        **{name: bindparam(f'set_{name}') for name in NODE_FIELDS},
+    )
+    frozen = table.c.freeze.is_(True)
+    set_ = {name: case((frozen, table.c[name]), else_=func.coalesce(stmt.excluded[name], table.c[name])) for name in NODE_FIELDS}
+    set_['freeze'] = func.coalesce(bindparam('set_freeze'), table.c.freeze)
+    return stmt.on_conflict_do_update(index_elements=[table.c.node_number], set_=set_)
+
+def _node_params(node_number, freeze=None, **fields):
+    """Bind parameters of the node upsert; values get their column's type, as they read back from the DB."""
+    params = {'node_number': node_number, 'node_mac': num_to_mac(node_number), 'node_id': num_to_id(node_number), 'set_freeze': freeze}
+    for name in NODE_FIELDS:
+        value = fields.get(name)
+        if value is not None and not isinstance(value, NODE_FIELD_TYPES[name]):
+            value = NODE_FIELD_TYPES[name](value)
+        params[f'set_{name}'] = value
+    return params
+
+def _retention_cutoff(days):
+    """Start of the oldest day kept by a `days` retention (None: keep everything)."""
+    if days <= 0:
+        return None
+    return _bucket_start(datetime.now() - timedelta(days=days), ROLLUP_DAY)
+
+def _rollup_horizons(now):
+    """Oldest bucket still read at each minute and hourly rollup level (see ROLLUP_WINDOWS)."""
+    # One bucket of margin for a window starting mid-bucket
+    return {period: _bucket_start(now - longest, period) - timedelta(seconds=period) for period, longest in ROLLUP_WINDOWS}
+
+def _rollup_period(since):
+    """Coarsest rollup level that still resolves a window starting at `since` (None: all time)."""
+    if since is not None:
+        window = datetime.now() - since
+        for period, longest in ROLLUP_WINDOWS:
+            if window <= longest:
+                return period
+    return ROLLUP_DAY
 
 class DBClient:
     _instance = None
@@ -22,11 +104,29 @@ class DBClient:
                     cls._instance._init_db()
         return cls._instance
 
-    def _init_db(self):
-        self._engine = create_engine(DB_URL, echo=False, connect_args={"check_same_thread": False})
+    def _init_db(self, url=DB_URL):
+        self._url = url
+        self._engine = create_engine(url, echo=False, **db_storage.engine_options(url))
         self._SessionLocal = sessionmaker(bind=self._engine)
+        # Queries get their own pool of read-only connections, so they never wait for the write
+        # lock; with a WAL profile they also never block the writer, in this process or another
+        self._read_engine = create_engine(url, echo=False, **db_storage.engine_options(url, readonly=True))
+        self._ReadSessionLocal = sessionmaker(bind=self._read_engine)
+        if self._engine.dialect.name == 'sqlite':
+            pragmas = db_storage.storage_pragmas()
+            db_storage.set_pragmas(self._engine, pragmas)
+            db_storage.set_pragmas(self._read_engine, db_storage.reader_pragmas(pragmas))
+        self._node_upsert = _node_upsert_statement(self._engine)
+        self._node_upsert_returning = self._node_upsert.returning(*Node.__table__.c)
+        existing = inspect(self._engine).has_table(NodePacket.__tablename__)
         Base.metadata.create_all(bind=self._engine)
         self._db_lock = threading.RLock()
+        if not existing:
+            db_migrations.stamp(self._engine)
+        elif db_migrations.pending(self._engine):
+            # Only the ingest modes upgrade on their own (prepare_ingest); a migration may rewrite node_packet
+            upgrade = "it is upgraded when an ingest mode starts, or run `db migrate`" if DB_AUTO_MIGRATE else "run `db migrate`"
+            logging.warning(f"[Migration] Database schema is at version {self.schema_version()}, expected {db_migrations.SCHEMA_VERSION}; {upgrade}")
         # Ensure default channel exists
         with self._db_lock:
             db = self.get_session()
@@ -39,10 +139,115 @@ class DBClient:
                     db.commit()
             finally:
                 db.close()
+        self.nodes = NodeRegistry()
+        self._warm_node_registry()
+        self._acks = None
+        self._next_prune = 0.0
+        self._pruned = 0
+        if not db_migrations.pending(self._engine):
+            if self._rollups_missing():
+                logging.warning("[Rollup] The stored packets have no rollups yet; they are built when an ingest mode starts, or run `db rollup rebuild`")
+
+    def schema_version(self):
+        return db_migrations.schema_version(self._engine)
+
+    def migrate(self):
+        """Bring an existing database to the current schema (see db_migrations). Returns the versions applied."""
+        with self._db_lock:
+            return db_migrations.upgrade(self._engine)
+
+    def prepare_ingest(self):
+        """
+        Ready the database for a mode that stores packets: apply the pending migrations when
+        DB_AUTO_MIGRATE is set, and build the rollups of packets stored before they existed.
+        Only ingest modes call it, so other commands never wait for either.
+        """
+        if DB_AUTO_MIGRATE:
+            self.migrate()
+        if not db_migrations.pending(self._engine) and self._rollups_missing():
+            logging.info("[Rollup] Building packet rollups from the stored packets...")
+            logging.info(f"[Rollup] {self.rebuild_rollups()} rollup rows built")
+
+    def _rollups_missing(self):
+        """Whether the database has packets from before the rollups existed."""
+        db = self.get_read_session()
+        try:
+            return db.query(PacketRollup.period).first() is None and db.query(NodePacket.id).first() is not None
+        finally:
+            db.close()
+
+    def _warm_node_registry(self):
+        """Preload the most recently seen nodes into the node registry."""
+        with self._db_lock:
+            db = self.get_session()
+            try:
+                nodes = db.query(Node).order_by(Node.last_seen.desc()).limit(self.nodes.capacity).all()
+                self.nodes.warm(NodeModel.model_validate(node) for node in nodes)
+            except ValidationError as e:
+                logging.warning(f"[NodeRegistry] Could not warm node registry: {e}")
+            finally:
+                db.close()
+        logging.debug(f"[NodeRegistry] Warmed with {len(self.nodes)} nodes")
+
+    @property
+    def acks(self):
+        """
+        The pending-ACK tracker. Only the ingest paths need it, so it is built on first use, warmed
+        with the stored packets still waiting for an ACK (once the schema is current).
+        """
+        if self._acks is None:
+            with self._db_lock:
+                if self._acks is None:
+                    acks = AckTracker()
+                    if not db_migrations.pending(self._read_engine):
+                        self._warm_ack_tracker(acks)
+                    self._acks = acks
+        return self._acks
+
+    def _warm_ack_tracker(self, acks):
+        """
+        Track the stored packets still waiting for an ACK within the TTL of the newest packet.
+        Reads through the read-only pool: the first use may come from inside a write transaction,
+        and a new writer connection would wait for its lock.
+        """
+        db = self.get_read_session()
+        try:
+            newest = db.query(func.max(NodePacket.timestamp)).scalar()
+            if newest is None:
+                return
+            waiting = db.query(NodePacket.packet_id, NodePacket.id, NodePacket.timestamp).filter(
+                NodePacket.timestamp >= newest - timedelta(seconds=acks.ttl),
+                NodePacket.success.is_(False),
+                NodePacket.packet_id.isnot(None),
+            ).order_by(NodePacket.timestamp, NodePacket.id)
+            acks.warm((packet_id, row_id, timestamp.timestamp()) for packet_id, row_id, timestamp in waiting)
+        finally:
+            db.close()
+        logging.debug(f"[ACK] Warmed the ACK tracker with {len(acks)} waiting packets")
 
     def get_session(self) -> Session:
         return self._SessionLocal()
 
+    def get_read_session(self) -> Session:
+        """A session on a read-only connection; it needs no _db_lock and sees the last committed writes."""
+        return self._ReadSessionLocal()
+
+    def close(self):
+        """Close the pooled connections of both engines."""
+        self._engine.dispose()
+        self._read_engine.dispose()
+
+    def reset_after_fork(self):
+        """Drop the connections and lock state inherited from the parent; call first thing in a forked worker."""
+        self._engine.dispose(close=False)
+        self._read_engine.dispose(close=False)
+        self._db_lock = threading.RLock()
+
+    def _merge_node_update(self, params):
+        """Apply an upsert's written values (_node_params) to the node registry."""
+        fields = {name: params[f'set_{name}'] for name in NODE_FIELDS if params[f'set_{name}'] is not None}
+        self.nodes.merge(params['node_number'], fields, params['set_freeze'])
+
     def add_or_update_node(
             self,
             node_number,
@@ -67,148 +272,125 @@ class DBClient:
             snr=None,
             last_seen=None,
             freeze=None,
+            return_model=False,
     ):
-        node_mac = num_to_mac(node_number)
-        node_id = num_to_id(node_number)
+        """
+        Insert or update a node in one statement (see _node_upsert_statement); only non-null
+        fields are written and a frozen node only accepts changes to `freeze`. Returns the stored
+        NodeModel with return_model=True, otherwise None, sparing the read-back and validation.
+        """
+        params = _node_params(
+            node_number,
+            freeze=freeze,
+            short_name=short_name,
+            long_name=long_name,
+            lat=lat,
+            lon=lon,
+            alt=alt,
+            hw_model=hw_model,
+            pubkey=pubkey,
+            battery_level=battery_level,
+            voltage=voltage,
+            channel_utilization=channel_utilization,
+            air_util_tx=air_util_tx,
+            uptime_seconds=uptime_seconds,
+            temperature=temperature,
+            relative_humidity=relative_humidity,
+            barometric_pressure=barometric_pressure,
+            gas_resistance=gas_resistance,
+            iaq=iaq,
+            rssi=rssi,
+            snr=snr,
+            last_seen=last_seen,
+        )
         with self._db_lock:
             db = self.get_session()
             try:
-                node = db.query(Node).filter((Node.node_number == node_number) | (Node.node_mac == node_mac) | (Node.node_id == node_id)).first()
-                if not node:
-                    node = Node(
-                        node_number=node_number,
-                        node_mac=node_mac,
-                        node_id=node_id,
-                        short_name=short_name,
-                        long_name=long_name,
-                        lat=lat,
-                        lon=lon,
-                        alt=alt,
-                        hw_model=hw_model,
-                        pubkey=pubkey,
-                        battery_level=battery_level,
-                        voltage=voltage,
-                        channel_utilization=channel_utilization,
-                        air_util_tx=air_util_tx,
-                        uptime_seconds=uptime_seconds,
-                        temperature=temperature,
-                        relative_humidity=relative_humidity,
-                        barometric_pressure=barometric_pressure,
-                        gas_resistance=gas_resistance,
-                        iaq=iaq,
-                        rssi=rssi,
-                        snr=snr,
-                        last_seen=last_seen,
-                        freeze=freeze if freeze is not None else False
-                    )
-                    db.add(node)
-                else:
-                    # If freeze is True, only allow updating freeze field
-                    if getattr(node, 'freeze', False):
-                        if freeze is not None:
-                            setattr(node, 'freeze', freeze)
-                        db.commit()
-                        db.refresh(node)
-                        try:
-                            node_model = NodeModel.model_validate(node)
-                        except ValidationError as e:
-                            raise ValueError(f"Node data validation failed: {e}")
-                        return node_model
-                    # If freeze is being set/unset, allow it
-                    if freeze is not None:
-                        setattr(node, 'freeze', freeze)
-                    if node_mac is not None:
-                        node.node_mac = node_mac
-                    if node_number is not None:
-                        node.node_number = node_number
-                    if node_id is not None:
-                        node.node_id = node_id
-                    if short_name is not None:
-                        node.short_name = short_name
-                    if long_name is not None:
-                        node.long_name = long_name
-                    if lat is not None:
-                        node.lat = lat
-                    if lon is not None:
-                        node.lon = lon
-                    if alt is not None:
-                        node.alt = alt
-                    if hw_model is not None:
-                        node.hw_model = hw_model
-                    if pubkey is not None:
-                        node.pubkey = pubkey
-                    if temperature is not None:
-                        node.temperature = temperature
-                    if relative_humidity is not None:
-                        node.relative_humidity = relative_humidity
-                    if barometric_pressure is not None:
-                        node.barometric_pressure = barometric_pressure
-                    if voltage is not None:
-                        node.voltage = voltage
-                    if battery_level is not None:
-                        node.battery_level = battery_level
-                    if channel_utilization is not None:
-                        node.channel_utilization = channel_utilization
-                    if air_util_tx is not None:
-                        node.air_util_tx = air_util_tx
-                    if uptime_seconds is not None:
-                        node.uptime_seconds = uptime_seconds
-                    if gas_resistance is not None:
-                        node.gas_resistance = gas_resistance
-                    if iaq is not None:
-                        node.iaq = iaq
-                    if rssi is not None:
-                        node.rssi = rssi
-                    if snr is not None:
-                        node.snr = snr
-                    if last_seen is not None:
-                        node.last_seen = last_seen
+                if not return_model:
+                    db.execute(self._node_upsert, params)
+                    db.commit()
+                    self._merge_node_update(params)
+                    return None
+                row = db.execute(self._node_upsert_returning, params).one()
                 db.commit()
-                db.refresh(node)
                 try:
-                    node_model = NodeModel.model_validate(node)
+                    node_model = NodeModel.model_validate(dict(row._mapping))
                 except ValidationError as e:
                     raise ValueError(f"Node data validation failed: {e}")
+                self.nodes.put(node_model)
                 return node_model
             finally:
                 db.close()
 
     def get_node(self, node_number):
+        node = self.nodes.get(node_number)
+        if node is not MISS:
+            return node
+        # Filled under the write lock, so a concurrent update cannot be overwritten by the row read before it
         with self._db_lock:
             db = self.get_session()
             try:
                 node = db.query(Node).filter_by(node_number=node_number).first()
                 if node:
                     try:
-                        return NodeModel.model_validate(node)
+                        node_model = NodeModel.model_validate(node)
                     except ValidationError as e:
                         raise ValueError(f"Node data validation failed: {e}")
+                    self.nodes.put(node_model)
+                    return node_model
+                self.nodes.put_missing(node_number)
                 return None
             finally:
                 db.close()
 
+    def get_node_by_id(self, node_id):
+        """Get a node by its node_id (!abcd1234), served from the node registry when possible."""
+        node = self.nodes.get_by_id(node_id)
+        if node is not MISS:
+            return node
+        try:
+            return self.get_node(id_to_num(node_id))
+        except ValueError:
+            return None
+
+    def get_node_by_mac(self, node_mac):
+        """Get a node by its MAC address, served from the node registry when possible."""
+        node = self.nodes.get_by_mac(node_mac)
+        if node is not MISS:
+            return node
+        try:
+            return self.get_node(mac_to_num(node_mac))
+        except ValueError:
+            return None
+
     def get_all_nodes(self):
-        with self._db_lock:
-            db = self.get_session()
-            try:
-                nodes = db.query(Node).all()
-                node_list = [NodeModel.model_validate(node) for node in nodes]
-                # Fix: sort with None last_seen as empty string, so all are comparable
-                def safe_last_seen(x):
-                    return x.last_seen if x.last_seen is not None else ''
-                node_list.sort(key=safe_last_seen, reverse=True)
-                return node_list
-            finally:
-                db.close()
+        db = self.get_read_session()
+        try:
+            nodes = db.query(Node).all()
+            node_list = [NodeModel.model_validate(node) for node in nodes]
+            # Fix: sort with None last_seen as empty string, so all are comparable
+            def safe_last_seen(x):
+                return x.last_seen if x.last_seen is not None else ''
+            node_list.sort(key=safe_last_seen, reverse=True)
+            return node_list
+        finally:
+            db.close()
 
     def delete_database(self):
-        """Delete the SQLite database file and reinitialize the engine."""
+        """Delete the SQLite database file (or drop the tables on a server) and reinitialize the engine."""
         with self._db_lock:
-            self._engine.dispose()
-            db_path = DB_URL.replace('sqlite:///', '')
-            if os.path.exists(db_path):
-                os.remove(db_path)
-            self._init_db()
+            if self._engine.dialect.name != 'sqlite':
+                Base.metadata.drop_all(bind=self._engine)
+                db_migrations.version_table.drop(self._engine, checkfirst=True)
+            self.close()
+            self.nodes.clear()
+            if self._engine.dialect.name == 'sqlite':
+                db_path = self._engine.url.database
+                # A WAL database also has its write-ahead log and shared-memory index
+                for path in (db_path, f'{db_path}-wal', f'{db_path}-shm'):
+                    if os.path.exists(path):
+                        os.remove(path)
+            self._init_db(self._url)
 
     def set_freeze(self, node_id, freeze: bool):
         """
@@ -231,9 +413,11 @@ class DBClient:
                     db.commit()
                     db.refresh(node)
                     try:
-                        return NodeModel.model_validate(node)
+                        node_model = NodeModel.model_validate(node)
                     except ValidationError as e:
                         raise ValueError(f"Node data validation failed: {e}")
+                    self.nodes.put(node_model)
+                    return node_model
                 return None
             finally:
                 db.close()
@@ -243,16 +427,34 @@ class DBClient:
         Resolve short and long names for a node by its node_number.
         Returns a tuple of (short_name, long_name).
         """
+        node = self.get_node(node_number)
+        if node:
+            return node.short_name, node.long_name
+        return None, None
 
-        with self._db_lock:
-            db = self.get_session()
-            try:
-                node = db.query(Node).filter_by(node_number=node_number).first()
-                if node:
-                    return node.short_name, node.long_name
-                return None, None
-            finally:
-                db.close()
+    def _upsert_channel(self, db: Session, channel_num, channel_id=None, member_node_ids=None, aes_key=None):
+        """
+        Apply a channel update inside an open session without committing it.
+        New member nodes are added; existing members are never removed.
+        """
+        channel = db.query(Channel).filter(Channel.channel_num == channel_num).first()
+        if not channel:
+            channel = Channel(channel_num=channel_num, channel_id=channel_id)
+            db.add(channel)
+        else:
+            if channel_id is not None:
+                channel.channel_id = channel_id
+        if aes_key is not None:
+            channel.aes_key = aes_key
+        if member_node_ids is not None:
+            # Only add new members, do not remove existing ones
+            existing_members = set(n.node_id for n in channel.member_nodes) if channel.member_nodes else set()
+            new_members = set(member_node_ids)
+            if not new_members.issubset(existing_members):
+                all_members = existing_members.union(new_members)
+                nodes = db.query(Node).filter(Node.node_id.in_(all_members)).all()
+                channel.member_nodes = nodes
+        return channel
 
     def add_or_update_channel(self, channel_num, channel_id=None, member_node_ids=None, aes_key=None):
         """
@@ -262,22 +464,7 @@ class DBClient:
         with self._db_lock:
             db = self.get_session()
             try:
-                channel = db.query(Channel).filter(Channel.channel_num == channel_num).first()
-                if not channel:
-                    channel = Channel(channel_num=channel_num, channel_id=channel_id)
-                    db.add(channel)
-                else:
-                    if channel_id is not None:
-                        channel.channel_id = channel_id
-                if aes_key is not None:
-                    channel.aes_key = aes_key
-                if member_node_ids is not None:
-                    # Only add new members, do not remove existing ones
-                    existing_members = set(n.node_id for n in channel.member_nodes) if channel.member_nodes else set()
-                    new_members = set(member_node_ids)
-                    all_members = existing_members.union(new_members)
-                    nodes = db.query(Node).filter(Node.node_id.in_(all_members)).all()
-                    channel.member_nodes = nodes
+                channel = self._upsert_channel(db, channel_num, channel_id=channel_id, member_node_ids=member_node_ids, aes_key=aes_key)
                 db.commit()
                 db.refresh(channel)
                 member_node_ids_out = [n.node_id for n in channel.member_nodes] if channel.member_nodes else []
@@ -286,110 +473,486 @@ class DBClient:
                 db.close()
 
     def get_channel(self, channel_num):
+        db = self.get_read_session()
+        try:
+            channel = db.query(Channel).filter_by(channel_num=channel_num).first()
+            if channel:
+                member_node_ids = [n.node_id for n in channel.member_nodes] if channel.member_nodes else []
+                return ChannelModel(channel_num=channel.channel_num, channel_id=channel.channel_id, aes_key=channel.aes_key, member_nodes=member_node_ids)
+            return None
+        finally:
+            db.close()
+
+    def get_all_channels(self):
+        db = self.get_read_session()
+        try:
+            channels = db.query(Channel).all()
+            return [ChannelModel(channel_num=c.channel_num, channel_id=c.channel_id, aes_key=c.aes_key, member_nodes=[n.node_id for n in c.member_nodes] if c.member_nodes else []) for c in channels]
+        finally:
+            db.close()
+
+    @staticmethod
+    def _packet_values(from_node_id, gateway_node_id, to_node_id, packet_type=None, rssi=None, snr=None, payload_size=None, success=None, response_time=None, timestamp=None, channel_id=None, packet_id=None, rx_rssi=None, rx_snr=None, rx_time=None, hop_start=None, hop_limit=None, want_ack=None):
+        """
+        Column values of a new node_packet row.
+        Only sets success=False if want_ack is True. Otherwise, success is None.
+        """
+        # Only set success=False if want_ack is True
+        if want_ack is not None:
+            if want_ack:
+                success_val = False if success is None else success
+            else:
+                success_val = None
+        else:
+            success_val = success
+        return dict(
+            from_node_id=from_node_id,
+            gateway_node_id=gateway_node_id,
+            to_node_id=to_node_id,
+            packet_type=packet_type,
+            rssi=rssi,
+            snr=snr,
+            payload_size=payload_size,
+            success=success_val,
+            response_time=response_time,
+            timestamp=timestamp or datetime.now(),
+            channel_id=channel_id,
+            packet_id=packet_id,
+            rx_rssi=rx_rssi,
+            rx_snr=rx_snr,
+            rx_time=rx_time,
+            hop_start=hop_start,
+            hop_limit=hop_limit
+        )
+
+    @staticmethod
+    def _waits_for_ack(row):
+        return row['success'] is False and bool(row['packet_id'])
+
+    def _insert_packets(self, db: Session, rows, with_ids=False):
+        """
+        Insert node_packet rows (_packet_values) inside an open session, as one executemany
+        (multi-row INSERTs where the driver supports them) instead of an ORM flush per packet.
+        Rows get their 'id' when with_ids is set or some row waits for an ACK, which needs it.
+        """
+        if not rows:
+            return
+        table = NodePacket.__table__
+        if with_ids or any(self._waits_for_ack(row) for row in rows):
+            ids = db.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows).scalars().all()
+            for row, row_id in zip(rows, ids):
+                row['id'] = row_id
+        else:
+            db.execute(insert(table), rows)
+
+    def add_node_packet(self, from_node_id, gateway_node_id, to_node_id, **kwargs):
+        """
+        Guarda un nuevo paquete de nodo en la base de datos.
+        Only sets success=False if want_ack is True. Otherwise, success is None.
+        Returns the id of the new row.
+        """
+        row = self._packet_values(from_node_id, gateway_node_id, to_node_id, **kwargs)
         with self._db_lock:
             db = self.get_session()
             try:
-                channel = db.query(Channel).filter_by(channel_num=channel_num).first()
-                if channel:
-                    member_node_ids = [n.node_id for n in channel.member_nodes] if channel.member_nodes else []
-                    return ChannelModel(channel_num=channel.channel_num, channel_id=channel.channel_id, aes_key=channel.aes_key, member_nodes=member_node_ids)
-                return None
+                self._insert_packets(db, [row], with_ids=True)
+                self._rollup_packets(db, [row])
+                self._track_acks([row])
+                db.commit()
+                return row['id']
             finally:
                 db.close()
 
-    def get_all_channels(self):
-        with self._db_lock:
-            db = self.get_session()
+    def get_node_packet(self, node_id: str, limit: int = 100):
+        """
+        Devuelve los paquetes del nodo dado (por node_id tipo !abcd1234), ordenados por timestamp descendente.
+        Incluye paquetes donde el nodo es emisor o receptor.
+        """
+        db = self.get_read_session()
+        try:
+            # One index seek per direction instead of an OR over both columns
+            packets = {}
+            for column in (NodePacket.from_node_id, NodePacket.to_node_id):
+                for packet in db.query(NodePacket).filter(column == node_id).order_by(NodePacket.timestamp.desc()).limit(limit):
+                    packets[packet.id] = packet
+            return sorted(packets.values(), key=lambda packet: packet.timestamp, reverse=True)[:limit]
+        finally:
+            db.close()
+
+    def get_recent_packets(self, limit: int = 1000):
+        """Newest packets of all nodes, by timestamp descending."""
+        db = self.get_read_session()
+        try:
+            return db.query(NodePacket).order_by(NodePacket.timestamp.desc()).limit(limit).all()
+        finally:
+            db.close()
+
+    def iter_packet_chunks(self, columns, since=None, chunk_rows=10000):
+        """
+        Yield the node_packet rows (tuples of `columns`), optionally from `since` on, in id order
+        and in lists of up to `chunk_rows`. Each chunk is a keyset query in its own short read
+        transaction, so a long export neither holds a snapshot nor keeps the WAL from checkpointing.
+        """
+        table = NodePacket.__table__
+        selected = [table.c.id] + [table.c[name] for name in columns]
+        last_id = 0
+        if since is not None:
+            db = self.get_read_session()
+            try:
+                # Ids follow the ingest order: seek to the first packet of the range through the timestamp index
+                first_id = db.execute(select(func.min(table.c.id)).where(table.c.timestamp >= since)).scalar()
+            finally:
+                db.close()
+            if first_id is None:
+                return
+            last_id = first_id - 1
+        while True:
+            query = select(*selected).where(table.c.id > last_id)
+            if since is not None:
+                query = query.where(table.c.timestamp >= since)
+            db = self.get_read_session()
             try:
-                channels = db.query(Channel).all()
-                return [ChannelModel(channel_num=c.channel_num, channel_id=c.channel_id, aes_key=c.aes_key, member_nodes=[n.node_id for n in c.member_nodes] if c.member_nodes else []) for c in channels]
+                rows = db.execute(query.order_by(table.c.id).limit(chunk_rows)).all()
             finally:
                 db.close()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [row[1:] for row in rows]
+            if len(rows) < chunk_rows:
+                return
+
+    def _rollup_packets(self, db: Session, rows):
+        """Add new node_packet rows to the rollups inside an open session, in the same transaction as their insert."""
+        if not rows:
+            return
+        totals = {}
+        for row in rows:
+            channel_id = row['channel_id'] or ''
+            node_id = row['from_node_id'] or ''
+            packet_type = row['packet_type'] or '-'
+            size = row['payload_size'] or 0
+            for period in ROLLUP_PERIODS:
+                key = (period, _bucket_start(row['timestamp'], period), channel_id, node_id, packet_type)
+                total = totals.get(key)
+                if total is None:
+                    totals[key] = [1, size]
+                else:
+                    total[0] += 1
+                    total[1] += size
+        stmt = db_storage.upsert_insert(self._engine, PacketRollup)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=ROLLUP_KEY,
+            set_={'packets': PacketRollup.packets + stmt.excluded.packets, 'bytes': PacketRollup.bytes + stmt.excluded.bytes},
+        )
+        db.execute(stmt, [dict(zip(ROLLUP_KEY, key), packets=count, bytes=size) for key, (count, size) in totals.items()])
 
-    def add_node_packet(self, from_node_id, gateway_node_id, to_node_id, packet_type=None, rssi=None, snr=None, payload_size=None, success=None, response_time=None, timestamp=None, channel_id=None, packet_id=None, rx_rssi=None, rx_snr=None, rx_time=None, hop_start=None, hop_limit=None, want_ack=None):
+    def rebuild_rollups(self):
         """
-        Guarda un nuevo paquete de nodo en la base de datos.
-        Only sets success=False if want_ack is True. Otherwise, success is None.
+        Recompute the rollups from the stored packets, from the first day that still has packets
+        on: the rollups of days whose packets were pruned are kept. Minute and hourly rollups are
+        only built as far back as they are read. Returns the number of rollup rows.
         """
-        from src.models import NodePacket
-        from datetime import datetime
         with self._db_lock:
             db = self.get_session()
             try:
-                # Only set success=False if want_ack is True
-                if want_ack is not None:
-                    if want_ack:
-                        success_val = False if success is None else success
-                    else:
-                        success_val = None
-                else:
-                    success_val = success
-                packet = NodePacket(
-                    from_node_id=from_node_id,
-                    gateway_node_id=gateway_node_id,
-                    to_node_id=to_node_id,
-                    packet_type=packet_type,
-                    rssi=rssi,
-                    snr=snr,
-                    payload_size=payload_size,
-                    success=success_val,
-                    response_time=response_time,
-                    timestamp=timestamp or datetime.now(),
-                    channel_id=channel_id,
-                    packet_id=packet_id,
-                    rx_rssi=rx_rssi,
-                    rx_snr=rx_snr,
-                    rx_time=rx_time,
-                    hop_start=hop_start,
-                    hop_limit=hop_limit
-                )
-                db.add(packet)
+                oldest = db.query(func.min(NodePacket.timestamp)).scalar()
+                if oldest is None:
+                    return db.query(PacketRollup).count()
+                since = _bucket_start(oldest, ROLLUP_DAY)
+                horizons = _rollup_horizons(datetime.now())
+                db.query(PacketRollup).filter(PacketRollup.bucket >= since).delete(synchronize_session=False)
+                for period in ROLLUP_PERIODS:
+                    period_since = max(since, horizons.get(period, since))
+                    bucket = _bucket_expression(self._engine.dialect.name, period, NodePacket.timestamp)
+                    # Inline constants: PostgreSQL does not match GROUP BY expressions that differ in bound parameters
+                    channel_id = func.coalesce(NodePacket.channel_id, literal_column("''"))
+                    node_id = func.coalesce(NodePacket.from_node_id, literal_column("''"))
+                    packet_type = func.coalesce(NodePacket.packet_type, literal_column("'-'"))
+                    totals = db.query(
+                        literal(period), bucket, channel_id, node_id, packet_type,
+                        func.count(), func.coalesce(func.sum(NodePacket.payload_size), 0),
+                    ).filter(NodePacket.timestamp >= period_since).group_by(bucket, channel_id, node_id, packet_type)
+                    db.execute(insert(PacketRollup).from_select(ROLLUP_KEY + ['packets', 'bytes'], totals))
                 db.commit()
-                db.refresh(packet)
-                return packet
+                return db.query(PacketRollup).count()
+            except Exception:
+                db.rollback()
+                raise
             finally:
                 db.close()
 
-    def get_node_packet(self, node_id: str, limit: int = 100):
+    def prune(self, days=DB_RETENTION_DAYS):
         """
-        Devuelve los paquetes del nodo dado (por node_id tipo !abcd1234), ordenados por timestamp descendente.
-        Incluye paquetes donde el nodo es emisor o receptor.
+        Apply the retention policy: delete the raw packets from days older than `days` (0 keeps
+        them) and the minute and hourly rollups older than the windows they are read for. Daily
+        rollups are kept, so all-time channel stats survive the packets. Packets are deleted in
+        chunks, releasing the write lock in between. Returns {'packets': n, 'rollups': n}.
         """
-        from src.models import Node, NodePacket
-        from sqlalchemy import or_
+        deleted = {'packets': 0, 'rollups': 0}
+        cutoff = _retention_cutoff(days)
+        if cutoff is not None:
+            while True:
+                count = self._prune_packets(cutoff)
+                deleted['packets'] += count
+                if count < PRUNE_CHUNK_ROWS:
+                    break
+        deleted['rollups'] = self._prune_rollups()
+        return deleted
+
+    def _prune_packets(self, cutoff, limit=PRUNE_CHUNK_ROWS):
+        """Delete up to `limit` of the oldest packets before `cutoff` in one transaction. Returns how many."""
+        table = NodePacket.__table__
+        oldest = select(table.c.id).where(table.c.timestamp < cutoff).order_by(table.c.timestamp).limit(limit)
         with self._db_lock:
             db = self.get_session()
             try:
-                node = db.query(Node).filter(Node.node_id == node_id).first()
-                if not node:
-                    return []
-                packets = db.query(NodePacket).filter(
-                    or_(NodePacket.from_node_id == node.id, NodePacket.to_node_id == node.id)
-                ).order_by(NodePacket.timestamp.desc()).limit(limit).all()
-                return packets
+                count = db.execute(delete(table).where(table.c.id.in_(oldest))).rowcount
+                db.commit()
+                return count
             finally:
                 db.close()
 
-    def mark_packet_success_by_ack(self, request_id):
+    def _prune_rollups(self):
+        """Delete the minute and hourly rollups no window reads any more (see ROLLUP_WINDOWS). Returns how many."""
+        with self._db_lock:
+            db = self.get_session()
+            try:
+                count = 0
+                for period, horizon in _rollup_horizons(datetime.now()).items():
+                    count += db.query(PacketRollup).filter(PacketRollup.period == period, PacketRollup.bucket < horizon).delete(synchronize_session=False)
+                db.commit()
+                return count
+            finally:
+                db.close()
+
+    def _maybe_prune(self):
+        """
+        Retention while ingesting, every DB_PRUNE_INTERVAL seconds: with DB_RETENTION_DAYS, one
+        chunk of expired packets per batch until none is left, then the expired rollups, which
+        expire whatever the packet retention.
+        """
+        if time.monotonic() < self._next_prune:
+            return
+        cutoff = _retention_cutoff(DB_RETENTION_DAYS)
+        if cutoff is not None:
+            count = self._prune_packets(cutoff)
+            self._pruned += count
+            if count >= PRUNE_CHUNK_ROWS:
+                return
+        rollups = self._prune_rollups()
+        if self._pruned:
+            logging.info(f"[Retention] Deleted {self._pruned} packets from before {cutoff:%Y-%m-%d} and {rollups} expired rollup rows")
+        elif rollups:
+            logging.info(f"[Retention] Deleted {rollups} expired rollup rows")
+        self._pruned = 0
+        self._next_prune = time.monotonic() + DB_PRUNE_INTERVAL
+
+    def compact(self, full=False):
+        """
+        Return the space of deleted rows to the filesystem and refresh the planner statistics.
+
+        SQLite databases with incremental auto_vacuum (created under a WAL profile) are compacted
+        online, a few MB per transaction between writes. Others need `full` once: a VACUUM that
+        rewrites the file, blocks writers meanwhile and switches it to incremental auto_vacuum.
+        On PostgreSQL, runs VACUUM (FULL with `full`) ANALYZE. Returns (bytes before, bytes after).
+        """
+        if self._engine.dialect.name != 'sqlite':
+            # VACUUM cannot run inside a transaction
+            with self._engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                before = db_storage.database_size(conn)
+                conn.exec_driver_sql('VACUUM FULL ANALYZE' if full else 'VACUUM ANALYZE')
+                return before, db_storage.database_size(conn)
+        with self._engine.connect() as conn:
+            before = db_storage.database_size(conn)
+            incremental = conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() == 2
+            if full:
+                with self._db_lock:
+                    conn.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+                    conn.exec_driver_sql('VACUUM')
+            elif incremental:
+                while conn.exec_driver_sql('PRAGMA freelist_count').scalar():
+                    with self._db_lock:
+                        conn.exec_driver_sql(f'PRAGMA incremental_vacuum({db_storage.COMPACT_STEP_PAGES})')
+            else:
+                logging.warning("[Compact] The database was not created with incremental auto_vacuum; run `db compact --full` once to switch it")
+            conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+            conn.exec_driver_sql('PRAGMA optimize')
+            return before, db_storage.database_size(conn)
+
+    def get_channel_activity(self, since=None):
+        """
+        Packets and bytes per channel id since `since` (all time if None), read from the
+        coarsest rollup level that fits the window, so the window is counted in whole buckets.
+        Returns {channel_id: {'packets': n, 'bytes': n}}.
+        """
+        period = _rollup_period(since)
+        db = self.get_read_session()
+        try:
+            query = db.query(PacketRollup.channel_id, func.sum(PacketRollup.packets), func.sum(PacketRollup.bytes)).filter(
+                PacketRollup.period == period, PacketRollup.channel_id != ''
+            )
+            if since is not None:
+                query = query.filter(PacketRollup.bucket >= _bucket_start(since, period))
+            return {channel_id: {'packets': packets, 'bytes': size} for channel_id, packets, size in query.group_by(PacketRollup.channel_id)}
+        finally:
+            db.close()
+
+    def get_channel_breakdown(self, channel_id):
+        """
+        All-time packets and bytes of a channel per (sender, packet type), read from the daily
+        rollups. Returns (node_id, short_name, long_name, packet_type, packets, bytes) tuples;
+        names are None for senders missing from the nodes table.
+        """
+        db = self.get_read_session()
+        try:
+            totals = db.query(
+                PacketRollup.node_id.label('node_id'),
+                PacketRollup.packet_type.label('packet_type'),
+                func.sum(PacketRollup.packets).label('packets'),
+                func.sum(PacketRollup.bytes).label('bytes'),
+            ).filter(PacketRollup.period == ROLLUP_DAY, PacketRollup.channel_id == channel_id).group_by(
+                PacketRollup.node_id, PacketRollup.packet_type
+            ).subquery()
+            rows = db.query(
+                totals.c.node_id, Node.short_name, Node.long_name, totals.c.packet_type, totals.c.packets, totals.c.bytes
+            ).outerjoin(Node, Node.node_id == totals.c.node_id)
+            return [tuple(row) for row in rows]
+        finally:
+            db.close()
+
+    def get_node_activity(self, since, node_id=None):
+        """
+        Per-node packet counts since `since`, aggregated in SQL: packets sent and received and,
+        for each direction, how many were ACKed (success=True) or not (success=False).
+        Only nodes in the nodes table are returned, optionally just `node_id`.
+        Returns {node_id: dict(short_name, long_name, packets_from, success_from, fail_from, packets_to, success_to, fail_to)}.
         """
-        Mark the NodePacket with packet_id=request_id as success=True, regardless of node_id.
+        activity = {}
+        db = self.get_read_session()
+        try:
+            # One GROUP BY per direction, driven by the nodes table so each node is a range
+            # lookup on the (node, timestamp, success) index instead of a sort of the window
+            for direction, column in (('from', NodePacket.from_node_id), ('to', NodePacket.to_node_id)):
+                rows = db.query(
+                    Node.node_id,
+                    Node.short_name,
+                    Node.long_name,
+                    func.count(),
+                    func.sum(case((NodePacket.success.is_(True), 1), else_=0)),
+                    func.sum(case((NodePacket.success.is_(False), 1), else_=0)),
+                ).join(NodePacket, column == Node.node_id).filter(NodePacket.timestamp >= since)
+                if node_id:
+                    rows = rows.filter(Node.node_id == node_id)
+                for row_node_id, short_name, long_name, packets, success, fail in rows.group_by(Node.id):
+                    metrics = activity.setdefault(row_node_id, {
+                        'short_name': short_name, 'long_name': long_name,
+                        'packets_from': 0, 'success_from': 0, 'fail_from': 0,
+                        'packets_to': 0, 'success_to': 0, 'fail_to': 0,
+                    })
+                    metrics[f'packets_{direction}'] = packets
+                    metrics[f'success_{direction}'] = success or 0
+                    metrics[f'fail_{direction}'] = fail or 0
+            return activity
+        finally:
+            db.close()
+
+    def _track_acks(self, rows):
+        """Hand new node_packet rows that wait for an ACK, inserted with their ids, to the ACK tracker."""
+        for row in rows:
+            if self._waits_for_ack(row):
+                self.acks.track(row['packet_id'], row['id'], row['timestamp'].timestamp())
+
+    def _apply_acks(self, db: Session, acks):
+        """
+        Resolve ACKs (mark_packet_success_by_ack kwargs) and mark the matched packets as
+        success=True with their response time, in one statement inside an open session.
+        The ACK tracker answers most of them; an ACK it misses (expired, evicted, or for a packet
+        stored by another process) falls back to the newest stored packet with that packet_id
+        that is not ACKed yet, one seek on ix_node_packet_packet_id.
+        Returns the number of ACKs that matched a waiting packet.
+        """
+        table = NodePacket.__table__
+        resolved = []
+        for ack in acks:
+            acked_at = ack.get('acked_at') or time.time()
+            match = self.acks.resolve(ack['request_id'], acked_at)
+            if match is None:
+                match = self._find_unacked_packet(db, ack['request_id'], acked_at, [row['row_id'] for row in resolved])
+                if match is None:
+                    logging.debug(f"[ACK-DEBUG] No packet waiting for an ACK with packet_id={ack['request_id']}")
+                    continue
+                self.acks.recovered_from_db(match[1])
+            row_id, response_time = match
+            resolved.append({'row_id': row_id, 'ack_response_time': response_time})
+        if resolved:
+            db.execute(
+                table.update().where(table.c.id == bindparam('row_id')).values(success=True, response_time=bindparam('ack_response_time')),
+                resolved,
+            )
+        return len(resolved)
+
+    @staticmethod
+    def _find_unacked_packet(db: Session, request_id, acked_at, skip_ids=()):
+        """(row id, response time) of the newest packet `request_id` not ACKed yet, leaving out `skip_ids` (already matched in this batch), or None."""
+        table = NodePacket.__table__
+        query = select(table.c.id, table.c.timestamp).where(table.c.packet_id == request_id, table.c.success.isnot(True))
+        if skip_ids:
+            query = query.where(table.c.id.not_in(skip_ids))
+        row = db.execute(query.order_by(table.c.timestamp.desc()).limit(1)).first()
+        if row is None:
+            return None
+        return row.id, max(0.0, acked_at - row.timestamp.timestamp())
+
+    def mark_packet_success_by_ack(self, request_id, acked_at=None):
+        """
+        Mark the packet waiting for the ACK request_id (any node) as success=True, with the time
+        between the packet and its ACK (received at `acked_at`, epoch seconds) as response_time.
+        The packet may have been stored by another process (see _apply_acks).
         Returns True if a packet was updated, False otherwise.
         """
-        from src.models import NodePacket
         with self._db_lock:
             db = self.get_session()
             try:
-                query = db.query(NodePacket).filter(NodePacket.packet_id == request_id)
-                candidates = query.order_by(NodePacket.timestamp.desc()).all()
-                logging.debug(f"[ACK-DEBUG] Candidates for packet_id={request_id}: {[p.id for p in candidates]}")
-                packet = candidates[0] if candidates else None
-                if packet:
-                    packet.success = True
+                updated = self._apply_acks(db, [dict(request_id=request_id, acked_at=acked_at)]) > 0
+                if updated:
                     db.commit()
-                    return True
-                return False
+                return updated
+            finally:
+                db.close()
+
+    def ingest_batch(self, nodes=None, packets=None, channels=None, acks=None):
+        """
+        Apply a batch of queued writes in a single transaction.
+        nodes: list of add_or_update_node kwargs, packets: list of add_node_packet kwargs,
+        channels: list of add_or_update_channel kwargs, acks: list of mark_packet_success_by_ack kwargs.
+        Writes are applied in that order so packets and ACKs in the same batch see each other.
+        Returns the number of ACKs that matched a stored packet.
+        """
+        matched_acks = 0
+        with self._db_lock:
+            db = self.get_session()
+            try:
+                node_params = [_node_params(**node_kwargs) for node_kwargs in nodes or ()]
+                if node_params:
+                    db.execute(self._node_upsert, node_params)
+                inserted = [self._packet_values(**packet_kwargs) for packet_kwargs in packets or ()]
+                self._insert_packets(db, inserted)
+                self._rollup_packets(db, inserted)
+                for channel_kwargs in channels or ():
+                    self._upsert_channel(db, **channel_kwargs)
+                self._track_acks(inserted)
+                matched_acks = self._apply_acks(db, acks or ())
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
             finally:
                 db.close()
+        for params in node_params:
+            self._merge_node_update(params)
+        self._maybe_prune()
+        return matched_acks
 
     @staticmethod
     def update_channel_membership_callback(packet, decoded_data, portnum, from_node_id, to_node_id, **kwargs):
@@ -0,0 +1,117 @@
+import logging
+from sqlalchemy import inspect, MetaData, Table, Column, Integer
+from sqlalchemy.schema import CreateTable, CreateIndex
+from src.models import NodePacket
+
+
+def _node_references(conn):
+    """
+    node_packet: store every node reference as a !abcd1234 node id and add the lookup indexes.
+
+    The node columns were declared as integer ids of `nodes` but the handler wrote node ids,
+    and gateways as DB ids or 0 when unknown. Integer references are resolved through `nodes`
+    (kept as text when no node matches), a 0 gateway becomes NULL. SQLite cannot change a
+    column type in place, so the table is rebuilt.
+    """
+    old_columns = {column['name'] for column in inspect(conn).get_columns('node_packet')}
+    conn.exec_driver_sql('ALTER TABLE node_packet RENAME TO node_packet_v0')
+    for (name,) in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'node_packet_v0' AND sql IS NOT NULL").all():
+        conn.exec_driver_sql(f'DROP INDEX "{name}"')
+    table = NodePacket.__table__
+    conn.execute(CreateTable(table))
+    node_ref = "CASE WHEN typeof({0}) = 'integer' THEN COALESCE((SELECT node_id FROM nodes WHERE nodes.id = {0}), CAST({0} AS TEXT)) ELSE {0} END"
+    gateway_ref = "CASE WHEN {0} = 0 OR {0} = '' THEN NULL ELSE " + node_ref + " END"
+    columns, values = [], []
+    for column in table.columns:
+        if column.name not in old_columns:
+            continue
+        columns.append(column.name)
+        if column.name in ('from_node_id', 'to_node_id'):
+            values.append(node_ref.format(column.name))
+        elif column.name == 'gateway_node_id':
+            values.append(gateway_ref.format(column.name))
+        else:
+            values.append(column.name)
+    conn.exec_driver_sql(f"INSERT INTO node_packet ({', '.join(columns)}) SELECT {', '.join(values)} FROM node_packet_v0 ORDER BY id")
+    conn.exec_driver_sql('DROP TABLE node_packet_v0')
+    for index in table.indexes:
+        conn.execute(CreateIndex(index))
+    # Rollups are keyed by sender node id; empty ones are rebuilt when an ingest mode starts
+    conn.exec_driver_sql('DELETE FROM packet_rollup')
+
+
+# (version, description, migration); a database at user_version N runs the migrations above N in order
+MIGRATIONS = [
+    (1, 'node ids in node_packet, lookup indexes', _node_references),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+# SQLite keeps the version in its user_version header field; other backends, supported from
+# version 1 on, in a one-row table
+BACKEND_FIRST_VERSION = 1
+version_table = Table('schema_version', MetaData(), Column('version', Integer, nullable=False))
+# How long a process waits for the SQLite write lock while another one may be migrating (ms)
+MIGRATION_LOCK_WAIT_MS = 600000
+
+
+def _read_version(conn):
+    if conn.dialect.name == 'sqlite':
+        return conn.exec_driver_sql('PRAGMA user_version').scalar()
+    if not inspect(conn).has_table(version_table.name):
+        return BACKEND_FIRST_VERSION
+    return conn.execute(version_table.select()).scalar()
+
+
+def _write_version(conn, version):
+    if conn.dialect.name == 'sqlite':
+        conn.exec_driver_sql(f'PRAGMA user_version = {int(version)}')
+        return
+    version_table.create(conn, checkfirst=True)
+    conn.execute(version_table.delete())
+    conn.execute(version_table.insert().values(version=version))
+
+
+def schema_version(engine):
+    with engine.connect() as conn:
+        return _read_version(conn)
+
+
+def stamp(engine, version=SCHEMA_VERSION):
+    """Record `version` without running migrations, for a database created with the current schema."""
+    with engine.connect() as conn:
+        _write_version(conn, version)
+        conn.commit()
+
+
+def pending(engine):
+    current = schema_version(engine)
+    return [migration for migration in MIGRATIONS if migration[0] > current]
+
+
+def upgrade(engine):
+    """
+    Run the pending migrations, each in its own transaction. Returns the versions applied, which
+    leaves out those another process applied meanwhile.
+    """
+    applied = []
+    for version, description, migration in pending(engine):
+        with engine.connect() as conn:
+            if conn.dialect.name == 'sqlite':
+                # pysqlite only opens transactions before DML; open one explicitly so DDL rolls back too.
+                # Wait for a migration running in another process instead of failing as locked
+                timeout = conn.exec_driver_sql('PRAGMA busy_timeout').scalar()
+                conn.exec_driver_sql(f'PRAGMA busy_timeout = {MIGRATION_LOCK_WAIT_MS}')
+                try:
+                    conn.exec_driver_sql('BEGIN IMMEDIATE')
+                finally:
+                    conn.exec_driver_sql(f'PRAGMA busy_timeout = {timeout}')
+            # Checked again under the write lock: the version read before may be stale
+            if _read_version(conn) >= version:
+                conn.rollback()
+                continue
+            logging.info(f"[Migration] Upgrading the database to version {version}: {description}...")
+            migration(conn)
+            _write_version(conn, version)
+            conn.commit()
+        applied.append(version)
+        logging.info(f"[Migration] Database at version {version}")
+    return applied
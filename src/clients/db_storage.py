@@ -0,0 +1,107 @@
+import re
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects import postgresql, sqlite
+from settings import DB_PROFILE, DB_PRAGMAS, DB_POOL_SIZE, DB_MAX_OVERFLOW
+
+# INSERT constructs with ON CONFLICT DO UPDATE (and `excluded`), per supported backend
+UPSERT_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+# SQLite pragmas set on every new connection, per storage profile:
+#   legacy    rollback journal, readers and the writer block each other (SQLite's defaults)
+#   durable   WAL, every commit synced to disk
+#   balanced  WAL, synced at checkpoints: a power loss may drop the last commits, never corrupts
+#   fast      WAL, never synced, larger cache and memory map: for captures that can be re-ingested
+# Apart from legacy, new databases use incremental auto_vacuum so `db compact` can run online
+STORAGE_PROFILES = {
+    'legacy': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'durable': {'auto_vacuum': 'INCREMENTAL', 'journal_mode': 'WAL', 'synchronous': 'FULL', 'cache_size': -65536, 'temp_store': 'MEMORY'},
+    'balanced': {'auto_vacuum': 'INCREMENTAL', 'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -65536, 'mmap_size': 268435456, 'temp_store': 'MEMORY'},
+    'fast': {'auto_vacuum': 'INCREMENTAL', 'journal_mode': 'WAL', 'synchronous': 'OFF', 'cache_size': -262144, 'mmap_size': 1073741824, 'temp_store': 'MEMORY'},
+}
+# Only meaningful on the connection that writes
+WRITER_PRAGMAS = ('auto_vacuum', 'journal_mode', 'synchronous')
+# Free pages returned to the filesystem per step of an online compaction (4 MB of 4 KB pages)
+COMPACT_STEP_PAGES = 1024
+_PRAGMA_VALUE = re.compile(r'^-?[\w.]+$')
+
+
+def backend(url):
+    """Backend name of a database URL, if it is one DBClient supports."""
+    url = make_url(url)
+    name = url.get_backend_name()
+    if name not in UPSERT_INSERTS:
+        raise ValueError(f"unsupported database backend {name!r} in DB_URL (expected one of {', '.join(UPSERT_INSERTS)})")
+    if name == 'sqlite' and url.database in (None, '', ':memory:'):
+        raise ValueError("DB_URL must name a SQLite file: an in-memory database is not shared between connections")
+    return name
+
+
+def engine_options(url, readonly=False):
+    """create_engine() keyword arguments for the writer or the read-only engine of `url`."""
+    name = backend(url)
+    options = {'pool_size': DB_POOL_SIZE, 'max_overflow': DB_MAX_OVERFLOW}
+    if name == 'sqlite':
+        options['connect_args'] = {'check_same_thread': False}
+    else:
+        # Server connections may be dropped while idle in the pool
+        options['pool_pre_ping'] = True
+        if readonly:
+            options['connect_args'] = {'options': '-c default_transaction_read_only=on'}
+    return options
+
+
+def upsert_insert(engine, table):
+    """INSERT for `table` supporting on_conflict_do_update() on the engine's backend."""
+    return UPSERT_INSERTS[engine.dialect.name](table)
+
+
+def database_size(conn):
+    """Bytes used by the database: the SQLite file without its WAL, or the PostgreSQL database."""
+    if conn.dialect.name == 'sqlite':
+        return conn.exec_driver_sql('PRAGMA page_count').scalar() * conn.exec_driver_sql('PRAGMA page_size').scalar()
+    return conn.exec_driver_sql('SELECT pg_database_size(current_database())').scalar()
+
+
+def parse_pragmas(spec):
+    """Parse "pragma=value,..." into a {pragma: value} dict."""
+    pragmas = {}
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, value = part.partition('=')
+        name, value = name.strip().lower(), value.strip()
+        if not name.isidentifier() or not _PRAGMA_VALUE.match(value):
+            raise ValueError(f"invalid pragma {part!r} in DB_PRAGMAS (expected pragma=value)")
+        pragmas[name] = value
+    return pragmas
+
+
+def storage_pragmas(profile=DB_PROFILE, overrides=DB_PRAGMAS):
+    """Pragmas of a storage profile with the "pragma=value,..." overrides applied."""
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"unknown storage profile {profile!r} (expected one of {', '.join(STORAGE_PROFILES)})")
+    return {**STORAGE_PROFILES[profile], **parse_pragmas(overrides)}
+
+
+def reader_pragmas(pragmas):
+    """Pragmas for read-only connections: the tuning ones, and no writes allowed."""
+    readers = {name: value for name, value in pragmas.items() if name not in WRITER_PRAGMAS}
+    readers['query_only'] = 'ON'
+    return readers
+
+
+def set_pragmas(engine, pragmas):
+    """Run the pragmas on each connection the engine opens."""
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
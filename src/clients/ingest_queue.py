@@ -0,0 +1,238 @@
+import logging
+import queue
+import threading
+import time
+from sqlalchemy.exc import OperationalError
+from settings import INGEST_QUEUE_SIZE, INGEST_BATCH_SIZE, INGEST_FLUSH_MS, INGEST_PUT_TIMEOUT, INGEST_RETRIES, INGEST_RETRY_MS
+
+_STOP = object()
+# ingest_batch argument of each recorded write
+BATCH_ARGS = {'node': 'nodes', 'packet': 'packets', 'channel': 'channels', 'ack': 'acks'}
+
+
+class WriteRecorder:
+    """
+    The write subset of DBClient (add_or_update_node, add_node_packet, add_or_update_channel,
+    mark_packet_success_by_ack), recording each call as an ingest item instead of writing it.
+    On its own it collects the items in `items`, e.g. in worker processes whose writes are
+    applied by the parent through IngestQueue.write.
+    """
+    def __init__(self):
+        self.items = []
+
+    def add_or_update_node(self, node_number, **kwargs):
+        self._put(('node', dict(node_number=node_number, **kwargs)))
+
+    def add_node_packet(self, from_node_id, gateway_node_id, to_node_id, **kwargs):
+        self._put(('packet', dict(from_node_id=from_node_id, gateway_node_id=gateway_node_id, to_node_id=to_node_id, **kwargs)))
+
+    def add_or_update_channel(self, channel_num, channel_id=None, member_node_ids=None, aes_key=None):
+        self._put(('channel', dict(channel_num=channel_num, channel_id=channel_id, member_node_ids=member_node_ids, aes_key=aes_key)))
+
+    def mark_packet_success_by_ack(self, request_id, acked_at=None):
+        """Record the ACK; returns None because the match is only known at flush time."""
+        self._put(('ack', dict(request_id=request_id, acked_at=acked_at)))
+        return None
+
+    def _put(self, item):
+        self.items.append(item)
+
+
+class IngestQueue(WriteRecorder):
+    """
+    Write-behind buffer for sniffer DB writes.
+
+    A WriteRecorder that enqueues the recorded DBClient write calls. A background thread flushes queued writes through DBClient.ingest_batch in one
+    transaction every `batch_size` writes or `flush_interval` seconds.
+
+    A batch failing with an OperationalError (e.g. "database is locked") is retried `retries`
+    times, `retry_delay` seconds apart and doubling; after that it is dropped. Any other error
+    is taken as a write the DB rejects: the batch is written again one write at a time, so
+    only the writes that fail are dropped.
+    """
+    def __init__(self, db, batch_size=INGEST_BATCH_SIZE, flush_interval=INGEST_FLUSH_MS / 1000, max_size=INGEST_QUEUE_SIZE, put_timeout=INGEST_PUT_TIMEOUT,
+                 retries=INGEST_RETRIES, retry_delay=INGEST_RETRY_MS / 1000):
+        self._db = db
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retries = max(0, retries)
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=max_size)
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'dropped': 0,
+            'blocked': 0,
+            'failed': 0,
+            'retries': 0,
+            'batches': 0,
+            'high_watermark': 0,
+            'flush_seconds': 0.0,
+        }
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self, timeout=None):
+        """Flush everything still queued and stop the writer thread."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+        else:
+            self.flush()
+        self._thread = None
+        logging.info(f"[Ingest] Closed: {self.stats()}")
+
+    def flush(self):
+        """Synchronously write everything queued so far (for callers that drive flushing themselves)."""
+        self._flush(self._drain())
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['depth'] = self._queue.qsize()
+        return stats
+
+    def write(self, items):
+        """Synchronously write items recorded elsewhere (see WriteRecorder) as one coalesced batch."""
+        self._bump('enqueued', len(items))
+        self._flush(items)
+
+    # --- internals ---
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._bump('blocked')
+            try:
+                self._queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                dropped = self._bump('dropped')
+                if dropped == 1 or dropped % 1000 == 0:
+                    logging.warning(f"[Ingest] Queue full, dropped {dropped} writes so far")
+                return
+        self._bump('enqueued')
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            if depth > self._stats['high_watermark']:
+                self._stats['high_watermark'] = depth
+
+    def _bump(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+            return self._stats[name]
+
+    def _drain(self):
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items
+            if item is not _STOP:
+                items.append(item)
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                batch.extend(self._drain())
+                self._flush(batch)
+                return
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+                deadline = None
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        nodes = {}
+        packets = []
+        channels = {}
+        acks = []
+        for op, payload in batch:
+            if op == 'node':
+                # Coalesce repeated updates of the same node, later non-null values win
+                merged = nodes.setdefault(payload['node_number'], {})
+                merged.update({k: v for k, v in payload.items() if v is not None or k not in merged})
+            elif op == 'packet':
+                packets.append(payload)
+            elif op == 'channel':
+                merged = channels.setdefault(payload['channel_num'], dict(payload, member_node_ids=None))
+                if payload['channel_id'] is not None:
+                    merged['channel_id'] = payload['channel_id']
+                if payload['aes_key'] is not None:
+                    merged['aes_key'] = payload['aes_key']
+                if payload['member_node_ids'] is not None:
+                    members = merged['member_node_ids'] or []
+                    members.extend(m for m in payload['member_node_ids'] if m not in members)
+                    merged['member_node_ids'] = members
+            elif op == 'ack':
+                acks.append(payload)
+        started = time.monotonic()
+        try:
+            matched = self._ingest(nodes=list(nodes.values()), packets=packets, channels=list(channels.values()), acks=acks)
+        except OperationalError as e:
+            self._bump('failed', len(batch))
+            logging.error(f"[Ingest] Failed to flush batch of {len(batch)} writes after {self.retries} retries: {e}")
+            return
+        except Exception as e:
+            logging.warning(f"[Ingest] Failed to flush batch of {len(batch)} writes, writing them one at a time: {e}")
+            matched, failed = self._flush_each(batch)
+        else:
+            failed = 0
+        if matched:
+            logging.info(f"[ACK] Marked {matched} packet(s) as success=True")
+        with self._stats_lock:
+            self._stats['flushed'] += len(batch) - failed
+            self._stats['batches'] += 1
+            self._stats['flush_seconds'] += time.monotonic() - started
+        logging.debug(f"[Ingest] Flushed {len(batch)} writes ({len(nodes)} nodes, {len(packets)} packets, {len(channels)} channels, {len(acks)} acks)")
+
+    def _flush_each(self, batch):
+        """Write the items of a failed batch one per transaction, in queue order. Returns (ACKs matched, writes dropped)."""
+        matched = failed = 0
+        for op, payload in batch:
+            try:
+                matched += self._ingest(**{BATCH_ARGS[op]: [payload]})
+            except Exception as e:
+                failed += 1
+                logging.error(f"[Ingest] Dropped {op} write {payload}: {e}")
+        self._bump('failed', failed)
+        return matched, failed
+
+    def _ingest(self, **writes):
+        """DBClient.ingest_batch, retrying on an OperationalError with a doubling delay."""
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                return self._db.ingest_batch(**writes)
+            except OperationalError as e:
+                if attempt == self.retries:
+                    raise
+                self._bump('retries')
+                logging.warning(f"[Ingest] Write failed ({e.orig}), retrying in {delay * 1000:.0f} ms")
+                time.sleep(delay)
+                delay *= 2
@@ -0,0 +1,255 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.reasoncodes import ReasonCode
+from settings import (
+    LOCAL_BROKER_QUEUE_SIZE, LOCAL_BROKER_CAPTURE, LOCAL_TRAFFIC_RATE, LOCAL_TRAFFIC_NODES,
+    LOCAL_TRAFFIC_MIX, LOCAL_TRAFFIC_ENCRYPTED_RATIO
+)
+from src.clients.capture import CaptureWriter
+from src.mesh.traffic import SyntheticTraffic, paced
+from src.utils import topic_matches
+
+# MQTT_BROKER value selecting the in-process broker
+LOCAL_BROKER_HOST = 'local'
+
+_CONNECT = object()
+_DISCONNECT = object()
+_STOP = object()
+
+
+class LocalClient:
+    """
+    Stand-in for paho.mqtt.client.Client attached to the in-process LocalBroker.
+
+    Implements the part of the paho API MqttBrokerClient and its users rely on. Like paho's
+    network loop, a per-client thread started by loop_start() runs the on_connect,
+    on_disconnect and on_message callbacks; messages that do not fit in its queue are dropped.
+    """
+    def __init__(self, broker, client_id=''):
+        self.broker = broker
+        self.client_id = client_id
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=broker.queue_size)
+        self._thread = None
+        self._connected = False
+        self._mid = 0
+
+    # Connection options have no meaning in-process
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def tls_set(self, *args, **kwargs):
+        pass
+
+    def tls_insecure_set(self, value):
+        pass
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    def connect(self, host=LOCAL_BROKER_HOST, port=1883, keepalive=60, **kwargs):
+        self.broker.connect(self)
+        self._connected = True
+        self._queue.put(_CONNECT)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def disconnect(self, *args, **kwargs):
+        if self._connected:
+            self._connected = False
+            self.broker.disconnect(self)
+            self._queue.put(_DISCONNECT)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name=f'local-mqtt-{self.client_id}', daemon=True)
+            self._thread.start()
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_stop(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._thread = None
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def is_connected(self):
+        return self._connected
+
+    def subscribe(self, topic, qos=0, **kwargs):
+        self.broker.subscribe(self, topic)
+        return mqtt.MQTT_ERR_SUCCESS, self._next_mid()
+
+    def unsubscribe(self, topic, **kwargs):
+        self.broker.unsubscribe(self, topic)
+        return mqtt.MQTT_ERR_SUCCESS, self._next_mid()
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        info = mqtt.MQTTMessageInfo(self._next_mid())
+        if not self._connected:
+            info.rc = mqtt.MQTT_ERR_NO_CONN
+            return info
+        self.broker.publish(topic, payload or b'', self.client_id)
+        return info
+
+    def deliver(self, message):
+        """Queue a message for on_message; returns False if the queue is full and it was dropped."""
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _next_mid(self):
+        self._mid += 1
+        return self._mid
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            try:
+                if item is _CONNECT:
+                    if self.on_connect:
+                        self.on_connect(self, None, mqtt.ConnectFlags(False), ReasonCode(PacketTypes.CONNACK, 'Success'), None)
+                elif item is _DISCONNECT:
+                    if self.on_disconnect:
+                        self.on_disconnect(self, None, mqtt.DisconnectFlags(False), ReasonCode(PacketTypes.DISCONNECT, 'Normal disconnection'), None)
+                elif self.on_message:
+                    self.on_message(self, None, item)
+            except Exception as e:
+                logging.error(f"[LocalBroker] Callback of {self.client_id} failed: {e}")
+
+
+class LocalBroker:
+    """
+    In-process stand-in for an MQTT broker, selected with MQTT_BROKER=local.
+
+    Routes every publish to the subscribed LocalClients (subscription patterns are matched
+    once per topic and cached), optionally writes everything published to a capture file,
+    and can feed synthetic traffic at a fixed rate. `taps` are called with
+    (client_id, topic, payload, published_at) on every publish, e.g. by load tests that
+    time spoof reactions.
+    """
+    def __init__(self, queue_size=LOCAL_BROKER_QUEUE_SIZE, capture_path=LOCAL_BROKER_CAPTURE):
+        self.queue_size = queue_size
+        self.capture_path = capture_path
+        self.taps = []
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self._routes = {}
+        self._capture = None
+        self._traffic_thread = None
+        self._traffic_stop = threading.Event()
+        self._started = False
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def client(self, client_id=''):
+        return LocalClient(self, client_id)
+
+    def _start(self):
+        # First connection: open the capture file and start the configured synthetic traffic
+        atexit.register(self.close)
+        if self.capture_path:
+            self._capture = CaptureWriter(self.capture_path)
+            self.taps.append(lambda client_id, topic, payload, published_at: self._capture.write(topic, payload))
+        if LOCAL_TRAFFIC_RATE > 0:
+            traffic = SyntheticTraffic(nodes=LOCAL_TRAFFIC_NODES, mix=LOCAL_TRAFFIC_MIX, encrypted_ratio=LOCAL_TRAFFIC_ENCRYPTED_RATIO)
+            self.start_traffic(traffic, LOCAL_TRAFFIC_RATE)
+
+    def connect(self, client):
+        with self._lock:
+            self._subscriptions.setdefault(client, set())
+            start = not self._started
+            self._started = True
+        if start:
+            self._start()
+
+    def disconnect(self, client):
+        with self._lock:
+            self._subscriptions.pop(client, None)
+            self._routes.clear()
+
+    def subscribe(self, client, pattern):
+        with self._lock:
+            self._subscriptions.setdefault(client, set()).add(pattern)
+            self._routes.clear()
+
+    def unsubscribe(self, client, pattern):
+        with self._lock:
+            self._subscriptions.get(client, set()).discard(pattern)
+            self._routes.clear()
+
+    def _route(self, topic):
+        clients = self._routes.get(topic)
+        if clients is None:
+            clients = self._routes[topic] = tuple(
+                client for client, patterns in self._subscriptions.items()
+                if any(topic_matches(pattern, topic) for pattern in patterns)
+            )
+        return clients
+
+    def publish(self, topic, payload, client_id=None):
+        payload = bytes(payload)
+        message = mqtt.MQTTMessage(topic=topic.encode('utf-8'))
+        message.payload = payload
+        message.timestamp = time.monotonic()
+        with self._lock:
+            for tap in self.taps:
+                tap(client_id, topic, payload, message.timestamp)
+            self.published += 1
+            for client in self._route(topic):
+                if client.deliver(message):
+                    self.delivered += 1
+                else:
+                    self.dropped += 1
+        return message
+
+    def start_traffic(self, traffic, rate, count=None):
+        """Publish messages from `traffic` (an iterable of (topic, payload)) at `rate` per second on a feeder thread."""
+        self.stop_traffic()
+        self._traffic_stop.clear()
+        self._traffic_thread = threading.Thread(target=self._feed, args=(traffic, rate, count), name='local-traffic', daemon=True)
+        self._traffic_thread.start()
+        logging.info(f"[LocalBroker] Feeding synthetic traffic at {rate:g} msg/s")
+
+    def _feed(self, traffic, rate, count):
+        for topic, payload in paced(traffic, rate, count, self._traffic_stop):
+            self.publish(topic, payload, 'local-traffic')
+
+    def stop_traffic(self):
+        if self._traffic_thread is not None:
+            self._traffic_stop.set()
+            self._traffic_thread.join()
+            self._traffic_thread = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': len(self._subscriptions),
+                'subscriptions': sum(len(patterns) for patterns in self._subscriptions.values()),
+                'published': self.published,
+                'delivered': self.delivered,
+                'dropped': self.dropped,
+            }
+
+    def close(self):
+        self.stop_traffic()
+        if self._capture:
+            self._capture.close()
+            self._capture = None
+
+
+LOCAL_BROKER = LocalBroker()
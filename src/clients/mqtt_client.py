@@ -1,5 +1,6 @@
 import paho.mqtt.client as mqtt
 import ssl
+from src.clients.local_broker import LOCAL_BROKER, LOCAL_BROKER_HOST
 
 class MqttBrokerClient:
     def __init__(self, broker, port, username, password, client_id="", on_connect=None, tls=False, ca_certs=None):
@@ -9,7 +10,11 @@ class MqttBrokerClient:
         self.password = password
         self.tls = tls
         self.ca_certs = ca_certs
-        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, clean_session=True, userdata=None)
+        if broker == LOCAL_BROKER_HOST:
+            # In-process broker stand-in for load tests without a network broker
+            self.client = LOCAL_BROKER.client(client_id)
+        else:
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, clean_session=True, userdata=None)
         if on_connect:
             self.client.on_connect = on_connect
         self.tls_configured = False
@@ -42,6 +47,8 @@ class MqttBrokerClient:
         if self.is_connected():
             self.client.disconnect()
             self.connected = False
+        # Wait for the network thread so no on_message callback is still running
+        self.client.loop_stop()
         if debug:
             print("Client Disconnected")
 
@@ -49,7 +56,7 @@ class MqttBrokerClient:
         return self.client.is_connected() if self.client else False
 
     def publish(self, topic, payload):
-        self.client.publish(topic, payload)
+        return self.client.publish(topic, payload)
 
     def set_on_connect(self, on_connect):
         self.client.on_connect = on_connect
@@ -0,0 +1,110 @@
+import threading
+from collections import OrderedDict
+from settings import NODE_CACHE_SIZE
+from src.utils import id_to_num, mac_to_num
+
+# Returned by lookups when the registry knows nothing about a node
+MISS = object()
+
+
+class NodeRegistry:
+    """
+    Process-wide LRU cache of NodeModel objects in front of DBClient lookups.
+
+    Entries are keyed by node_number. node_id (!abcd1234) and node_mac are derived
+    from the node_number, so lookups by either resolve to the same entry.
+    A cached None records that the node is known to be absent from the DB.
+    """
+    def __init__(self, capacity=NODE_CACHE_SIZE):
+        self.capacity = max(1, capacity)
+        self._nodes = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def get(self, node_number):
+        """Return the cached NodeModel, None if known to be absent, or MISS."""
+        with self._lock:
+            node = self._nodes.get(node_number, MISS)
+            if node is MISS:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._nodes.move_to_end(node_number)
+            return node
+
+    def get_by_id(self, node_id):
+        try:
+            return self.get(id_to_num(node_id))
+        except ValueError:
+            return MISS
+
+    def get_by_mac(self, node_mac):
+        try:
+            return self.get(mac_to_num(node_mac))
+        except ValueError:
+            return MISS
+
+    def put(self, node):
+        """Cache (or refresh) a NodeModel."""
+        self._store(node.node_number, node)
+
+    def put_missing(self, node_number):
+        """Remember that node_number has no row in the DB."""
+        self._store(node_number, None)
+
+    def merge(self, node_number, fields, freeze=None):
+        """
+        Apply a node upsert to the cached entry without reading the row back.
+        `fields` holds the non-null values written; as in SQL, a frozen node only takes `freeze`.
+        Uncached nodes stay uncached, and a node cached as absent is dropped so the next lookup loads it.
+        """
+        with self._lock:
+            node = self._nodes.get(node_number, MISS)
+            if node is MISS:
+                return
+            if node is None:
+                del self._nodes[node_number]
+                return
+            update = {} if node.freeze else dict(fields)
+            if freeze is not None:
+                update['freeze'] = freeze
+            if update:
+                self._nodes[node_number] = node.model_copy(update=update)
+
+    def invalidate(self, node_number):
+        with self._lock:
+            self._nodes.pop(node_number, None)
+
+    def clear(self):
+        with self._lock:
+            self._nodes.clear()
+
+    def warm(self, nodes):
+        """Load NodeModels without touching the hit/miss counters."""
+        for node in nodes:
+            self.put(node)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._nodes),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def _store(self, node_number, node):
+        with self._lock:
+            self._nodes[node_number] = node
+            self._nodes.move_to_end(node_number)
+            while len(self._nodes) > self.capacity:
+                self._nodes.popitem(last=False)
+                self.evictions += 1
@@ -0,0 +1,211 @@
+import logging
+import os
+from src.models import Node
+
+# Packet history exported to columnar files: <archive>/node_packet/day=YYYY-MM-DD/part-N.parquet,
+# plus <archive>/nodes.parquet and <archive>/channels.parquet snapshots
+PACKETS_DIR = 'node_packet'
+NODES_FILE = 'nodes.parquet'
+CHANNELS_FILE = 'channels.parquet'
+# node_packet rows read per query and converted per record batch
+EXPORT_CHUNK_ROWS = 100000
+# Node ids, packet types and channel ids repeat on every row: stored as dictionary indexes
+DICTIONARY_COLUMNS = ('from_node_id', 'gateway_node_id', 'to_node_id', 'packet_type', 'channel_id')
+PACKET_COLUMNS = (
+    'timestamp', 'from_node_id', 'gateway_node_id', 'to_node_id', 'packet_type', 'rssi', 'snr', 'payload_size',
+    'success', 'response_time', 'channel_id', 'packet_id', 'rx_rssi', 'rx_snr', 'rx_time', 'hop_start', 'hop_limit',
+)
+
+# LoRa settings of the Meshtastic modem presets, by their default channel name:
+# bandwidth (Hz), spreading factor, coding rate denominator (4/5 .. 4/8)
+MODEM_PRESETS = {
+    'ShortTurbo': (500000, 7, 5),
+    'ShortFast': (250000, 7, 5),
+    'ShortSlow': (250000, 8, 5),
+    'MediumFast': (250000, 9, 5),
+    'MediumSlow': (250000, 10, 5),
+    'LongFast': (250000, 11, 5),
+    'LongModerate': (125000, 11, 8),
+    'LongSlow': (125000, 12, 8),
+    'VLongSlow': (62500, 12, 8),
+}
+PREAMBLE_SYMBOLS = 16
+# Meshtastic packet header sent before the payload
+MESH_HEADER_BYTES = 16
+# Reported signal quantiles per node
+QUANTILES = (0.1, 0.5, 0.9)
+
+
+def _arrow():
+    """pyarrow, imported on first use: only the archive commands need it."""
+    try:
+        import pyarrow
+        import pyarrow.acero
+        import pyarrow.compute
+        import pyarrow.csv
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet export and analysis need pyarrow, which is not installed (pip install pyarrow)") from e
+    return pyarrow
+
+
+def _packet_schema(pa):
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    types = {
+        'timestamp': pa.timestamp('us'), 'rssi': pa.float64(), 'snr': pa.float64(), 'payload_size': pa.int32(),
+        'success': pa.bool_(), 'response_time': pa.float64(), 'packet_id': pa.int64(), 'rx_rssi': pa.float64(),
+        'rx_snr': pa.float64(), 'rx_time': pa.int64(), 'hop_start': pa.int8(), 'hop_limit': pa.int8(),
+    }
+    fields = [(name, dictionary if name in DICTIONARY_COLUMNS else types[name]) for name in PACKET_COLUMNS]
+    return pa.schema(fields + [('day', pa.date32())])
+
+
+def _partitioning(pa):
+    return pa.dataset.partitioning(pa.schema([('day', pa.date32())]), flavor='hive')
+
+
+def _packet_batches(pa, schema, chunks):
+    """Record batches of node_packet row chunks, with their day partition column."""
+    for rows in chunks:
+        arrays = []
+        for field, values in zip(schema, zip(*rows)):
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, field.type))
+        arrays.append(pa.compute.cast(arrays[0], pa.date32()))
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _write_table(pa, table, path):
+    """Replace a Parquet file, never leaving a partial one behind."""
+    partial = f'{path}.partial'
+    pa.parquet.write_table(table, partial)
+    os.replace(partial, path)
+
+
+def export_archive(db, path, since=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Stream the packets of `db` (a DBClient), from `since` on if given, into day partitions of
+    Parquet files under `path`, then snapshot its nodes and channels. Each day exported replaces
+    that day in the archive; other days are kept, so the archive can hold more history than the
+    retention policy leaves in the DB. Returns {'packets': n, 'nodes': n, 'channels': n}.
+    """
+    pa = _arrow()
+    os.makedirs(path, exist_ok=True)
+    schema = _packet_schema(pa)
+    counts = {'packets': 0}
+
+    def chunks():
+        for rows in db.iter_packet_chunks(PACKET_COLUMNS, since=since, chunk_rows=chunk_rows):
+            counts['packets'] += len(rows)
+            yield rows
+
+    # The writer keeps one file open per day and groups the rows of a day in large row groups
+    pa.dataset.write_dataset(
+        _packet_batches(pa, schema, chunks()), os.path.join(path, PACKETS_DIR), schema=schema, format='parquet',
+        partitioning=_partitioning(pa), basename_template='part-{i}.parquet', existing_data_behavior='delete_matching',
+        min_rows_per_group=chunk_rows,
+    )
+    nodes = [node.model_dump() for node in db.get_all_nodes()]
+    node_types = {int: pa.int64(), float: pa.float64(), bool: pa.bool_(), str: pa.string()}
+    node_schema = pa.schema([(column.name, node_types[column.type.python_type]) for column in Node.__table__.columns])
+    _write_table(pa, pa.Table.from_pylist(nodes, schema=node_schema), os.path.join(path, NODES_FILE))
+    channels = [channel.model_dump() for channel in db.get_all_channels()]
+    channel_schema = pa.schema([('channel_num', pa.int64()), ('channel_id', pa.string()), ('aes_key', pa.string()), ('member_nodes', pa.list_(pa.string()))])
+    _write_table(pa, pa.Table.from_pylist(channels, schema=channel_schema), os.path.join(path, CHANNELS_FILE))
+    counts.update(nodes=len(nodes), channels=len(channels))
+    return counts
+
+
+def _airtime_expression(pc, preset):
+    """
+    Estimated time on air (seconds) of each packet, from its payload size plus the mesh header,
+    with the LoRa time-on-air formula of the preset (explicit header, CRC on).
+    """
+    bandwidth, spreading_factor, coding_rate = MODEM_PRESETS[preset]
+    symbol_time = 2 ** spreading_factor / bandwidth
+    low_data_rate = 1 if symbol_time > 0.016 else 0
+    air_bytes = pc.add(pc.coalesce(pc.field('payload_size'), 0), MESH_HEADER_BYTES)
+    numerator = pc.add(pc.multiply(air_bytes, 8.0), 28 + 16 - 4 * spreading_factor)
+    blocks = pc.ceil(pc.divide(numerator, 4 * (spreading_factor - 2 * low_data_rate)))
+    symbols = pc.add(pc.multiply(pc.max_element_wise(blocks, 0.0), coding_rate), 8)
+    return pc.add(pc.multiply(symbols, symbol_time), (PREAMBLE_SYMBOLS + 4.25) * symbol_time)
+
+
+def analyze_archive(path, since=None, node_id=None, channel_id=None, preset='LongFast'):
+    """
+    Per sending node statistics over the packets of an archive: packets, bytes, estimated airtime,
+    rx RSSI/SNR mean and quantiles (see QUANTILES), and hops taken. The files are scanned in
+    batches by a streaming aggregation, and only the days from `since` on are read. Returns a
+    pyarrow Table with one row per node, by packets descending.
+    """
+    pa = _arrow()
+    pc = pa.compute
+    acero = pa.acero
+    packets_path = os.path.join(path, PACKETS_DIR)
+    if not os.path.isdir(packets_path):
+        raise FileNotFoundError(f"no exported packets in {path} (run `db export` first)")
+    dataset = pa.dataset.dataset(packets_path, format='parquet', partitioning=_partitioning(pa))
+    conditions = []
+    if since is not None:
+        conditions.append(pc.field('day') >= pa.scalar(since.date(), pa.date32()))
+        conditions.append(pc.field('timestamp') >= pa.scalar(since, pa.timestamp('us')))
+    if node_id:
+        conditions.append(pc.field('from_node_id').cast(pa.string()) == node_id)
+    if channel_id:
+        conditions.append(pc.field('channel_id').cast(pa.string()) == channel_id)
+    row_filter = None
+    for condition in conditions:
+        row_filter = condition if row_filter is None else row_filter & condition
+    # Hops are only known when the sender set hop_start
+    hops = pc.if_else(pc.field('hop_start') > 0, pc.subtract(pc.field('hop_start'), pc.field('hop_limit')), pa.scalar(None, pa.int8()))
+    quantiles = pc.TDigestOptions(q=list(QUANTILES))
+    columns = ['timestamp', 'from_node_id', 'channel_id', 'payload_size', 'rx_rssi', 'rx_snr', 'hop_start', 'hop_limit']
+    # The scan only uses the filter to skip partitions and row groups: rows are filtered after it
+    steps = [acero.Declaration('scan', acero.ScanNodeOptions(dataset, columns=columns, filter=row_filter))]
+    if row_filter is not None:
+        steps.append(acero.Declaration('filter', acero.FilterNodeOptions(row_filter)))
+    steps.append(acero.Declaration('project', acero.ProjectNodeOptions(
+        [pc.field('from_node_id').cast(pa.string()), pc.field('payload_size'), _airtime_expression(pc, preset), pc.field('rx_rssi'), pc.field('rx_snr'), hops],
+        ['node_id', 'bytes', 'airtime', 'rssi', 'snr', 'hops'],
+    )))
+    steps.append(acero.Declaration('aggregate', acero.AggregateNodeOptions([
+        ([], 'hash_count_all', None, 'packets'),
+        ('bytes', 'hash_sum', None, 'bytes'),
+        ('airtime', 'hash_sum', None, 'airtime_s'),
+        ('rssi', 'hash_mean', None, 'rssi_mean'),
+        ('rssi', 'hash_tdigest', quantiles, 'rssi_q'),
+        ('snr', 'hash_mean', None, 'snr_mean'),
+        ('snr', 'hash_tdigest', quantiles, 'snr_q'),
+        ('hops', 'hash_mean', None, 'hops_mean'),
+        ('hops', 'hash_max', None, 'hops_max'),
+    ], keys=['node_id'])))
+    stats = acero.Declaration.from_sequence(steps).to_table()
+    result = {name: stats[name] for name in ('node_id', 'packets', 'bytes', 'airtime_s')}
+    for signal in ('rssi', 'snr'):
+        result[f'{signal}_mean'] = stats[f'{signal}_mean']
+        for index, q in enumerate(QUANTILES):
+            result[f'{signal}_p{round(q * 100)}'] = pc.list_element(stats[f'{signal}_q'], index)
+    result['hops_mean'] = stats['hops_mean']
+    result['hops_max'] = stats['hops_max']
+    stats = pa.table(result)
+    nodes_path = os.path.join(path, NODES_FILE)
+    if os.path.exists(nodes_path):
+        names = pa.parquet.read_table(nodes_path, columns=['node_id', 'short_name', 'long_name'])
+        stats = stats.join(names, 'node_id', join_type='left outer')
+        stats = stats.select(['node_id', 'short_name', 'long_name'] + list(result)[1:])
+    else:
+        logging.warning(f"[Archive] {nodes_path} not found, node names left out")
+    return stats.sort_by([('packets', 'descending'), ('node_id', 'ascending')])
+
+
+def write_result(table, path):
+    """Write an analysis result as CSV (.csv) or Parquet (any other extension)."""
+    pa = _arrow()
+    if path.lower().endswith('.csv'):
+        pa.csv.write_csv(table, path)
+    else:
+        pa.parquet.write_table(table, path)
+
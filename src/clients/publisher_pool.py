@@ -0,0 +1,126 @@
+import logging
+import threading
+from settings import MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, CLIENT_ID, PUBLISH_CONNECT_TIMEOUT
+from src.clients.mqtt_client import MqttBrokerClient
+
+
+class PooledPublisher:
+    """
+    Long-lived MQTT connection used only for publishing.
+
+    paho's network loop reconnects on its own after a drop (with backoff set by
+    reconnect_delay_set); `ready` tracks the connection state so callers wait on an
+    Event instead of polling is_connected().
+    """
+    def __init__(self, broker, port, publish_topic, client_id):
+        self.publish_topic = publish_topic
+        tls = port == 8883
+        self.mqtt_client = MqttBrokerClient(
+            broker=broker,
+            port=port,
+            username=MQTT_USERNAME,
+            password=MQTT_PASSWORD,
+            client_id=client_id,
+            tls=tls,
+            ca_certs="cacert.pem" if tls else None
+        )
+        self.ready = threading.Event()
+        self.published = 0
+        self.connects = 0
+        client = self.mqtt_client.client
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.reconnect_delay_set(min_delay=1, max_delay=30)
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            logging.error(f"[Publisher] Connection to {self.mqtt_client.broker} refused: {reason_code}")
+            return
+        self.connects += 1
+        self.ready.set()
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self.ready.clear()
+        if reason_code.is_failure:
+            logging.warning(f"[Publisher] Disconnected from {self.mqtt_client.broker} ({reason_code}), reconnecting")
+
+    def start(self):
+        self.mqtt_client.connect()
+
+    def wait(self, timeout):
+        return self.ready.wait(timeout)
+
+    # Same interface as MqttBrokerClient, so it can be passed to the crafter send_* helpers
+    def is_connected(self):
+        return self.ready.is_set()
+
+    def publish(self, topic, payload):
+        self.mqtt_client.publish(topic, payload)
+        self.published += 1
+
+    def close(self):
+        self.mqtt_client.disconnect()
+        self.ready.clear()
+
+
+class PublisherPool:
+    """
+    Persistent publisher connections keyed by (broker, port, publish topic).
+
+    The publish topic carries the gateway node, so each spoofed gateway gets its own
+    connection and bursts, reactive triggers and send commands reuse it instead of
+    paying a TCP/TLS handshake per packet.
+    """
+    def __init__(self, broker=MQTT_BROKER, port=MQTT_PORT, connect_timeout=PUBLISH_CONNECT_TIMEOUT):
+        self.broker = broker
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self._publishers = {}
+        self._lock = threading.Lock()
+
+    def _client_id(self):
+        # Brokers drop an existing session when a second one reuses its client id, so
+        # publishers never share the sniffer's CLIENT_ID (empty lets the broker pick one)
+        return f"{CLIENT_ID}-pub{len(self._publishers) + 1}" if CLIENT_ID else ""
+
+    def get(self, publish_topic, timeout=None):
+        """
+        Return the connected publisher for publish_topic, opening it on first use.
+        Waits up to `timeout` seconds for the connection; returns None if it is not up.
+        """
+        timeout = self.connect_timeout if timeout is None else timeout
+        key = (self.broker, self.port, publish_topic)
+        with self._lock:
+            publisher = self._publishers.get(key)
+            if publisher is None:
+                publisher = PooledPublisher(self.broker, self.port, publish_topic, self._client_id())
+                try:
+                    publisher.start()
+                except Exception as e:
+                    logging.error(f"[Publisher] Could not connect to {self.broker}:{self.port}: {e}")
+                    return None
+                self._publishers[key] = publisher
+        if not publisher.wait(timeout):
+            logging.error(f"[Publisher] Not connected to {self.broker}:{self.port} after {timeout} seconds!")
+            return None
+        return publisher
+
+    def close(self):
+        with self._lock:
+            publishers = list(self._publishers.values())
+            self._publishers.clear()
+        for publisher in publishers:
+            publisher.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'connections': len(self._publishers),
+                'connected': sum(p.is_connected() for p in self._publishers.values()),
+                'published': sum(p.published for p in self._publishers.values()),
+                'reconnects': sum(max(0, p.connects - 1) for p in self._publishers.values()),
+            }
+
+
+# Shared by the spoofer, send mode and reactive threads
+PUBLISHERS = PublisherPool()
@@ -0,0 +1,32 @@
+import logging
+from datetime import datetime, timedelta
+from src.clients import packet_archive
+from src.utils import print_table
+
+HEADERS = {
+    'node_id': 'Node ID', 'short_name': 'Short Name', 'long_name': 'Long Name', 'packets': 'Packets', 'bytes': 'Bytes',
+    'airtime_s': 'Airtime (s)', 'rssi_mean': 'RSSI Mean', 'rssi_p10': 'RSSI P10', 'rssi_p50': 'RSSI P50', 'rssi_p90': 'RSSI P90',
+    'snr_mean': 'SNR Mean', 'snr_p10': 'SNR P10', 'snr_p50': 'SNR P50', 'snr_p90': 'SNR P90', 'hops_mean': 'Hops Mean', 'hops_max': 'Hops Max',
+}
+
+
+def handle_analyze_mode(args):
+    """Per-node packet statistics over a `db export` archive; never opens the live DB."""
+    since = (datetime.now() - timedelta(days=args.days)).replace(hour=0, minute=0, second=0, microsecond=0) if args.days else None
+    try:
+        stats = packet_archive.analyze_archive(args.archive, since=since, node_id=args.node, channel_id=args.channel, preset=args.preset)
+    except (ImportError, FileNotFoundError) as e:
+        logging.error(str(e))
+        return
+    if args.output:
+        packet_archive.write_result(stats, args.output)
+        logging.info(f"Wrote the statistics of {stats.num_rows} nodes to {args.output}")
+    sort_col = args.sort.lower().replace(' ', '_')
+    if sort_col not in stats.column_names:
+        sort_col = 'packets'
+    stats = stats.sort_by([(sort_col, 'descending')]).slice(0, args.limit)
+    rows = [{name: round(value, 2) if isinstance(value, float) else value for name, value in row.items()} for row in stats.to_pylist()]
+    if not rows:
+        logging.info("No packets found in the archive" + (" for this selection" if args.node or args.channel or since else ""))
+        return
+    print_table(rows, headers=[HEADERS.get(name, name) for name in stats.column_names])
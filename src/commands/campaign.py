@@ -0,0 +1,30 @@
+import logging
+from src.agents.campaign import Campaign, load_targets_file, load_targets_db
+from src.agents.spoofer import Spoofer
+
+def handle_campaign_mode(args):
+    if not args.targets and not args.from_db:
+        logging.error("Campaign needs --targets <file> and/or --from-db.")
+        return
+    if not args.interval > 0:
+        logging.error("--interval must be positive.")
+        return
+    if not 0 <= args.jitter < 1:
+        logging.error("--jitter must be at least 0 and below 1.")
+        return
+    spoofer = Spoofer()
+    defaults = dict(mode=args.target_mode, interval=args.interval, to_node=args.to_node, gateway_node=args.gateway_node)
+    targets = []
+    if args.targets:
+        targets.extend(load_targets_file(args.targets, spoofer=spoofer, **defaults))
+    if args.from_db:
+        known = {t.node_number for t in targets}
+        targets.extend(t for t in load_targets_db(args.limit, spoofer=spoofer, **defaults) if t.node_number not in known)
+    if not targets:
+        logging.error("No campaign targets loaded.")
+        return
+    campaign = Campaign(targets, burst=args.burst, period=args.period, jitter=args.jitter, spoofer=spoofer)
+    try:
+        campaign.run()
+    finally:
+        campaign.close()
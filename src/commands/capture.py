@@ -0,0 +1,13 @@
+from src.agents.capturer import Capturer
+from settings import CAPTURE_ROTATE_MB, CAPTURE_FSYNC_SECONDS
+
+def handle_capture_mode(args):
+    """Record raw broker traffic to a capture file until interrupted."""
+    rotate_mb = args.rotate_mb or CAPTURE_ROTATE_MB
+    capturer = Capturer(
+        args.output,
+        debug=getattr(args, 'debug', False),
+        rotate_bytes=rotate_mb * 1024 * 1024,
+        fsync_interval=args.fsync_seconds if args.fsync_seconds is not None else CAPTURE_FSYNC_SECONDS,
+    )
+    capturer.capture(topic=args.topic)
@@ -3,8 +3,14 @@ import ast
 import time
 from datetime import datetime, timedelta
 from src.clients.db_client import DB
+from src.clients import packet_archive
 from src.utils import hw_num_to_model, print_table
-from src.models import NodePacket, Node
+
+
+def _success_rate(success, fail):
+    """ACKed share of the packets that asked for an ACK, '-' when none did."""
+    total = success + fail
+    return f"{int(round((success / total) * 100))}%" if total else '-'
 
 
 def handle_db_mode(args):
@@ -167,35 +173,24 @@ def handle_db_mode(args):
                 logging.info(f"Set {column} to {value} for node {node_id}")
             elif args.nodes_action == 'packet':
                 node_id = getattr(args, 'node_id', None)
-                with db._db_lock:
-                    session = db.get_session()
-                    try:
-                        if node_id:
-                            packets = db.get_node_packet(node_id)
-                        else:
-                            packets = session.query(NodePacket).order_by(NodePacket.timestamp.desc()).limit(1000).all()
-                        # Preload gateway node_id mapping
-                        gateway_ids = {}
-                        gateway_dbids = set(pkt.gateway_node_id for pkt in packets if pkt.gateway_node_id)
-                        if gateway_dbids:
-                            nodes = session.query(Node).filter(Node.id.in_(gateway_dbids)).all()
-                            gateway_ids = {n.id: n.node_id for n in nodes}
-                    finally:
-                        session.close()
+                if node_id:
+                    packets = db.get_node_packet(node_id)
+                else:
+                    packets = db.get_recent_packets()
                 if not packets:
                     print("No packet found" + (f" for node {node_id}" if node_id else ""))
                     return
                 packet_table = []
                 for pkt in packets:
-                    gateway_node_id_str = gateway_ids.get(pkt.gateway_node_id, str(pkt.gateway_node_id) if pkt.gateway_node_id else '-')
                     packet_table.append({
                         'timestamp': pkt.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
                         'from_node_id': pkt.from_node_id,
-                        'gateway_node_id': gateway_node_id_str,
+                        'gateway_node_id': pkt.gateway_node_id or '-',
                         'to_node_id': pkt.to_node_id,
                         'packet_type': pkt.packet_type,
                         'payload_size': pkt.payload_size,
                         'success': pkt.success,
+                        'response_time': round(pkt.response_time, 2) if pkt.response_time is not None else None,
                         'channel_id': pkt.channel_id,
                         'packet_id': pkt.packet_id,
                         'rx_rssi': pkt.rx_rssi,
@@ -219,6 +214,8 @@ def handle_db_mode(args):
                     'size': 'payload_size',
                     'payload_size': 'payload_size',
                     'success': 'success',
+                    'response time': 'response_time',
+                    'response_time': 'response_time',
                     'channel id': 'channel_id',
                     'channel_id': 'channel_id',
                     'packet id': 'packet_id',
@@ -240,192 +237,39 @@ def handle_db_mode(args):
                 # Show recents at the bottom if sorting by timestamp
                 reverse_sort = sort_col_key != 'timestamp'
                 packet_table.sort(key=lambda x: (x[sort_col_key] if x[sort_col_key] is not None else '' if isinstance(x[sort_col_key], str) else float('-inf')), reverse=reverse_sort)
-                print_table(packet_table, headers=['Timestamp', 'From', 'Gateway', 'To', 'Type', 'Size', 'Success', 'Channel ID', 'Packet ID', 'RX RSSI', 'RX SNR', 'RX Time', 'Hop Start', 'Hop Limit'])
+                print_table(packet_table, headers=['Timestamp', 'From', 'Gateway', 'To', 'Type', 'Size', 'Success', 'Response Time', 'Channel ID', 'Packet ID', 'RX RSSI', 'RX SNR', 'RX Time', 'Hop Start', 'Hop Limit'])
             elif args.nodes_action == 'activity':
-                # --- ACTIVITY TABLE LOGIC ---
                 minutes = getattr(args, 'minutes', None)
                 node_id_filter = getattr(args, 'node_id', None)
                 if minutes is None:
                     print("Debes especificar el número de minutos para el cálculo de métricas.")
                     return
-                with db._db_lock:
-                    session = db.get_session()
-                    try:
-                        time_limit = datetime.now() - timedelta(minutes=int(minutes))
-                        query = session.query(NodePacket).filter(NodePacket.timestamp >= time_limit)
-                        if node_id_filter:
-                            node = session.query(Node).filter(Node.node_id == node_id_filter).first()
-                            if not node:
-                                print(f"Node {node_id_filter} not found.")
-                                return
-                            query = query.filter(
-                                (NodePacket.from_node_id == node.node_id) | (NodePacket.to_node_id == node.node_id)
-                            )
-                        packets = query.all()
-                        # --- Build metrics for all nodes ---
-                        metrics = {}
-                        for pkt in packets:
-                            # For both sender and receiver, count packets and successes/fails
-                            for direction, node_id in [('from', pkt.from_node_id), ('to', pkt.to_node_id)]:
-                                if node_id is None:
-                                    continue
-                                node_obj = session.query(Node).filter(Node.node_id == node_id).first()
-                                if not node_obj:
-                                    continue
-                                if node_id not in metrics:
-                                    metrics[node_id] = {
-                                        'packets_from': 0,
-                                        'packets_to': 0,
-                                        'success_from': 0,
-                                        'fail_from': 0,
-                                        'success_to': 0,
-                                        'fail_to': 0,
-                                        'short_name': node_obj.short_name if node_obj else '-',
-                                        'long_name': node_obj.long_name if node_obj else '-',
-                                    }
-                                if direction == 'from':
-                                    metrics[node_id]['packets_from'] += 1
-                                    if pkt.success is True:
-                                        metrics[node_id]['success_from'] += 1
-                                    elif pkt.success is False:
-                                        metrics[node_id]['fail_from'] += 1
-                                elif direction == 'to':
-                                    metrics[node_id]['packets_to'] += 1
-                                    if pkt.success is True:
-                                        metrics[node_id]['success_to'] += 1
-                                    elif pkt.success is False:
-                                        metrics[node_id]['fail_to'] += 1
-                        # --- Table for all nodes ---
-                        if not node_id_filter:
-                            activity_table = []
-                            for node_id, data in metrics.items():
-                                packets_from = data['packets_from']
-                                packets_to = data['packets_to']
-                                # Calculate success rates, ignoring None values for success
-                                success_from_count = data['success_from']
-                                fail_from_count = data.get('fail_from', 0)
-                                total_from = success_from_count + fail_from_count
-                                if total_from:
-                                    success_rate_from = f"{int(round((success_from_count / total_from) * 100))}%"
-                                else:
-                                    success_rate_from = '-'
-
-                                success_to_count = data['success_to']
-                                fail_to_count = data.get('fail_to', 0)
-                                total_to = success_to_count + fail_to_count
-                                if total_to:
-                                    success_rate_to = f"{int(round((success_to_count / total_to) * 100))}%"
-                                else:
-                                    success_rate_to = '-'
-
-                                activity_table.append({
-                                    'Node ID': node_id,
-                                    'Short Name': data['short_name'],
-                                    'Long Name': data['long_name'],
-                                    'Packets From': packets_from,
-                                    'Packets To': packets_to,
-                                    'Success Rate From': success_rate_from,
-                                    'Success Rate To': success_rate_to,
-                                })
-                            sort_col = getattr(args, 'sort', None) or 'Packets From'
-                            sort_col_key = sort_col.lower().replace(' ', '_')
-                            valid_keys = {k.lower().replace(' ', '_'): k for k in activity_table[0].keys()}
-                            if sort_col_key not in valid_keys:
-                                sort_col_key = 'packets_from'
-                            real_key = valid_keys[sort_col_key]
-                            activity_table.sort(key=lambda x: (x[real_key] if x[real_key] is not None else float('-inf')), reverse=True)
-                            print_table(activity_table, headers=['Node ID', 'Short Name', 'Long Name', 'Packets From', 'Packets To', 'Success Rate From', 'Success Rate To'])
-                        # --- Table for single node ---
-                        else:
-                            node_id = node_id_filter
-                            data = metrics.get(node_id)
-                            if not data:
-                                print(f"No activity found for node {node_id}")
-                                return
-                            packets_from = data['packets_from']
-                            packets_to = data['packets_to']
-                            # For single node
-                            success_from_count = data['success_from']
-                            fail_from_count = data.get('fail_from', 0)
-                            total_from = success_from_count + fail_from_count
-                            if total_from:
-                                success_rate_from = f"{int(round((success_from_count / total_from) * 100))}%"
-                            else:
-                                success_rate_from = '-'
-
-                            success_to_count = data['success_to']
-                            fail_to_count = data.get('fail_to', 0)
-                            total_to = success_to_count + fail_to_count
-                            if total_to:
-                                success_rate_to = f"{int(round((success_to_count / total_to) * 100))}%"
-                            else:
-                                success_rate_to = '-'
-
-                            single_node_activity_table = [{
-                                'Node ID': node_id,
-                                'Short Name': data['short_name'],
-                                'Long Name': data['long_name'],
-                                'Packets From': packets_from,
-                                'Packets To': packets_to,
-                                'Success Rate From': success_rate_from,
-                                'Success Rate To': success_rate_to,
-                            }]
-                            print_table(single_node_activity_table, headers=['Node ID', 'Short Name', 'Long Name', 'Packets From', 'Packets To', 'Success Rate From', 'Success Rate To'])
-                    finally:
-                        session.close()
-            # --- ACTIVITY TABLE LOGIC ---
-            elif args.nodes_action == 'activity':
-                # For all nodes: show Packets From, Packets To, Success Rate From, Success Rate To
-                def get_activity_stats(node_id):
-                    # Returns (packets_from, packets_to, success_rate_from, success_rate_to)
-                    packets_from = DB.count_packets(from_node_id=node_id)
-                    packets_to = DB.count_packets(to_node_id=node_id)
-                    success_from = DB.count_packets(from_node_id=node_id, success=True)
-                    success_to = DB.count_packets(to_node_id=node_id, success=True)
-                    success_rate_from = (success_from / packets_from) if packets_from else 0.0
-                    success_rate_to = (success_to / packets_to) if packets_to else 0.0
-                    return packets_from, packets_to, success_rate_from, success_rate_to
-
-                # For all nodes activity table
-                activity_table = []
-                for node in nodes:
-                    packets_from, packets_to, success_rate_from, success_rate_to = get_activity_stats(node.node_id)
-                    activity_table.append({
-                        'Node ID': node.node_id,
-                        'Packets From': packets_from,
-                        'Packets To': packets_to,
-                        'Success Rate From': f"{success_rate_from:.2%}",
-                        'Success Rate To': f"{success_rate_to:.2%}",
-                        'Short Name': node.short_name,
-                        'Long Name': node.long_name,
-                    })
-                print_table(activity_table, headers=['Node ID', 'Packets From', 'Packets To', 'Success Rate From', 'Success Rate To', 'Short Name', 'Long Name'])
-            # --- SINGLE NODE ACTIVITY LOGIC ---
-            elif args.nodes_action == 'activity':
-                node_id = args.node_id
-                node = None
-                try:
-                    node_number = int(node_id)
-                    node = db.get_node(node_number)
-                except ValueError:
-                    for n in db.get_all_nodes():
-                        if n.node_mac == node_id:
-                            node = n
-                            break
-                if not node:
-                    logging.info(f"Node not found: {node_id}")
+                if node_id_filter and not db.get_node_by_id(node_id_filter):
+                    print(f"Node {node_id_filter} not found.")
                     return
-                # Para una sola nodo: usar el mismo cálculo que para todos, pero mostrar solo uno
-                packets_from, packets_to, success_rate_from, success_rate_to = DB.get_activity_stats(node_id)
-                single_node_activity_table = [{
-                    'Packets From': packets_from,
-                    'Packets To': packets_to,
-                    'Success Rate From': f"{success_rate_from:.2%}",
-                    'Success Rate To': f"{success_rate_to:.2%}",
-                    'Short Name': node.short_name,
-                    'Long Name': node.long_name,
-                }]
-                print_table(single_node_activity_table, headers=['Packets From', 'Packets To', 'Success Rate From', 'Success Rate To', 'Short Name', 'Long Name'])
+                time_limit = datetime.now() - timedelta(minutes=int(minutes))
+                metrics = db.get_node_activity(time_limit, node_id=node_id_filter)
+                if node_id_filter and node_id_filter not in metrics:
+                    print(f"No activity found for node {node_id_filter}")
+                    return
+                activity_table = [{
+                    'Node ID': node_id,
+                    'Short Name': data['short_name'],
+                    'Long Name': data['long_name'],
+                    'Packets From': data['packets_from'],
+                    'Packets To': data['packets_to'],
+                    'Success Rate From': _success_rate(data['success_from'], data['fail_from']),
+                    'Success Rate To': _success_rate(data['success_to'], data['fail_to']),
+                } for node_id, data in metrics.items()]
+                if activity_table:
+                    sort_col = getattr(args, 'sort', None) or 'Packets From'
+                    sort_col_key = sort_col.lower().replace(' ', '_')
+                    valid_keys = {k.lower().replace(' ', '_'): k for k in activity_table[0].keys()}
+                    if sort_col_key not in valid_keys:
+                        sort_col_key = 'packets_from'
+                    real_key = valid_keys[sort_col_key]
+                    activity_table.sort(key=lambda x: (x[real_key] if x[real_key] is not None else float('-inf')), reverse=True)
+                    print_table(activity_table, headers=['Node ID', 'Short Name', 'Long Name', 'Packets From', 'Packets To', 'Success Rate From', 'Success Rate To'])
         elif getattr(args, 'db_action', None) == 'channels':
             if args.channels_action == 'list':
                 channels = db.get_all_channels()
@@ -441,36 +285,22 @@ def handle_db_mode(args):
                 if channel_table:
                     print_table(channel_table, headers=['Channel Number', 'Channel ID', 'AES Key', 'Members'])
             elif args.channels_action == 'activity':
-                # Show channel table with Packets and Bytes columns
-                channels = db.get_all_channels()
+                # Show channel table with Packets and Bytes columns, read from the rollups
+                minutes = getattr(args, 'minutes', None)
+                since = datetime.now() - timedelta(minutes=minutes) if minutes else None
+                channel_stats = db.get_channel_activity(since)
                 channel_table = []
-                with db._db_lock:
-                    session = db.get_session()
-                    try:
-                        # Get all packets, group by channel_id
-                        packets = session.query(NodePacket).all()
-                        channel_stats = {}
-                        for pkt in packets:
-                            if pkt.channel_id is None:
-                                continue
-                            if pkt.channel_id not in channel_stats:
-                                channel_stats[pkt.channel_id] = {'packets': 0, 'bytes': 0}
-                            channel_stats[pkt.channel_id]['packets'] += 1
-                            if pkt.payload_size:
-                                channel_stats[pkt.channel_id]['bytes'] += pkt.payload_size
-                        for channel in channels:
-                            members_count = len(channel.member_nodes) if channel.member_nodes else 0
-                            stats = channel_stats.get(channel.channel_id, {'packets': 0, 'bytes': 0})
-                            channel_table.append({
-                                'channel_num': channel.channel_num,
-                                'channel_id': channel.channel_id,
-                                'aes_key': channel.aes_key,
-                                'members': members_count,
-                                'packets': stats['packets'],
-                                'bytes': stats['bytes']
-                            })
-                    finally:
-                        session.close()
+                for channel in db.get_all_channels():
+                    members_count = len(channel.member_nodes) if channel.member_nodes else 0
+                    stats = channel_stats.get(channel.channel_id, {'packets': 0, 'bytes': 0})
+                    channel_table.append({
+                        'channel_num': channel.channel_num,
+                        'channel_id': channel.channel_id,
+                        'aes_key': channel.aes_key,
+                        'members': members_count,
+                        'packets': stats['packets'],
+                        'bytes': stats['bytes']
+                    })
                 if channel_table:
                     print_table(channel_table, headers=['Channel Number', 'Channel ID', 'AES Key', 'Members', 'Packets', 'Bytes'])
             elif args.channels_action == 'show':
@@ -484,22 +314,16 @@ def handle_db_mode(args):
                     logging.info(f"Channel not found: {channel_id}")
                     return
                 members_count = len(channel.member_nodes) if channel.member_nodes else 0
-                # --- Enhanced channel stats ---
-                with db._db_lock:
-                    session = db.get_session()
-                    try:
-                        packets = session.query(NodePacket).filter(NodePacket.channel_id == channel.channel_id).all()
-                        total_sent_packets = len(packets)
-                        total_sent_bytes = sum(pkt.payload_size or 0 for pkt in packets)
-                        # Packet count by types
-                        type_counts = {}
-                        for pkt in packets:
-                            t = pkt.packet_type or '-'
-                            type_counts[t] = type_counts.get(t, 0) + 1
-                        # Packet ratio by types
-                        type_ratios = {t: (count / total_sent_packets if total_sent_packets else 0) for t, count in type_counts.items()}
-                    finally:
-                        session.close()
+                # --- Enhanced channel stats, from the rollups ---
+                breakdown = db.get_channel_breakdown(channel.channel_id)
+                total_sent_packets = sum(row[4] for row in breakdown)
+                total_sent_bytes = sum(row[5] for row in breakdown)
+                # Packet count by types
+                type_counts = {}
+                for _, _, _, t, count, _ in breakdown:
+                    type_counts[t] = type_counts.get(t, 0) + count
+                # Packet ratio by types
+                type_ratios = {t: (count / total_sent_packets if total_sent_packets else 0) for t, count in type_counts.items()}
                 # Prepare main channel info table
                 channel_info = [{
                     'channel_num': channel.channel_num,
@@ -516,29 +340,15 @@ def handle_db_mode(args):
                     node_type_counts = {}
                     node_type_totals = {}
                     node_names = {}
-                    for pkt in packets:
-                        node_id = pkt.from_node_id
-                        if node_id is None:
+                    for node_id, short_name, long_name, t, count, _ in breakdown:
+                        if not node_id:
                             continue
-                        t = pkt.packet_type or '-'
                         if node_id not in node_type_counts:
                             node_type_counts[node_id] = {}
                             node_type_totals[node_id] = 0
-                            # Fetch node short/long name
-                            node_obj = None
-                            try:
-                                with db._db_lock:
-                                    session2 = db.get_session()
-                                    node_obj = session2.query(Node).filter(Node.node_id == node_id).first()
-                                    session2.close()
-                            except Exception:
-                                node_obj = None
-                            node_names[node_id] = {
-                                'short_name': node_obj.short_name if node_obj else '-',
-                                'long_name': node_obj.long_name if node_obj else '-'
-                            }
-                        node_type_counts[node_id][t] = node_type_counts[node_id].get(t, 0) + 1
-                        node_type_totals[node_id] += 1
+                            node_names[node_id] = {'short_name': short_name or '-', 'long_name': long_name or '-'}
+                        node_type_counts[node_id][t] = node_type_counts[node_id].get(t, 0) + count
+                        node_type_totals[node_id] += count
                     # Build node table
                     node_rows = []
                     all_types = sorted(type_counts.keys())
@@ -572,6 +382,31 @@ def handle_db_mode(args):
                     # Sort type_count_table by Count descending
                     type_count_table.sort(key=lambda x: x['Count'], reverse=True)
                     print_table(type_count_table, headers=['Packet Type', 'Count', 'Ratio'])
+        elif getattr(args, 'db_action', None) == 'rollup':
+            if args.rollup_action == 'rebuild':
+                logging.info("Rebuilding packet rollups from the stored packets...")
+                logging.info(f"Rollups rebuilt: {db.rebuild_rollups()} rows")
+        elif getattr(args, 'db_action', None) == 'migrate':
+            applied = db.migrate()
+            if applied:
+                logging.info(f"Database migrated to version {applied[-1]}")
+            else:
+                logging.info(f"Database schema is up to date (version {db.schema_version()})")
+        elif getattr(args, 'db_action', None) == 'prune':
+            deleted = db.prune(args.days)
+            logging.info(f"Deleted {deleted['packets']} packets and {deleted['rollups']} expired rollup rows")
+        elif getattr(args, 'db_action', None) == 'compact':
+            before, after = db.compact(full=args.full)
+            logging.info(f"Database compacted: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+        elif getattr(args, 'db_action', None) == 'export':
+            # Whole days, from the same cutoff as `db prune --days`
+            since = (datetime.now() - timedelta(days=args.days)).replace(hour=0, minute=0, second=0, microsecond=0) if args.days else None
+            try:
+                exported = packet_archive.export_archive(db, args.output, since=since, chunk_rows=args.chunk_rows)
+            except ImportError as e:
+                logging.error(str(e))
+                return
+            logging.info(f"Exported {exported['packets']} packets, {exported['nodes']} nodes and {exported['channels']} channels to {args.output}")
         elif getattr(args, 'db_action', None) == 'delete':
             logging.info("Deleting the database...")
             db.delete_database()
@@ -0,0 +1,20 @@
+from src.agents.generator import TrafficGenerator
+from settings import CAPTURE_ROTATE_MB, CAPTURE_FSYNC_SECONDS, LOCAL_TRAFFIC_NODES, LOCAL_TRAFFIC_MIX, LOCAL_TRAFFIC_ENCRYPTED_RATIO
+
+def handle_generate_mode(args):
+    """Emit synthetic mesh traffic to a capture file or, without --output, to the broker."""
+    generator = TrafficGenerator(
+        nodes=args.nodes or LOCAL_TRAFFIC_NODES,
+        mix=args.mix or LOCAL_TRAFFIC_MIX,
+        encrypted_ratio=args.encrypted_ratio if args.encrypted_ratio is not None else LOCAL_TRAFFIC_ENCRYPTED_RATIO,
+        seed=args.seed,
+        debug=getattr(args, 'debug', False),
+    )
+    if args.output:
+        count = args.count if args.count is not None or args.duration is not None else 100000
+        generator.to_capture(
+            args.output, args.rate, count=count, duration=args.duration,
+            rotate_bytes=CAPTURE_ROTATE_MB * 1024 * 1024, fsync_interval=CAPTURE_FSYNC_SECONDS,
+        )
+    else:
+        generator.to_broker(args.rate, count=args.count, duration=args.duration)
@@ -0,0 +1,14 @@
+from src.agents.reingest import Reingester
+from src.commands.sniffer import build_packet_filter
+from settings import KEY, REINGEST_WORKERS, REINGEST_SHARD_RECORDS
+
+def handle_reingest_mode(args):
+    """Re-decode capture files in parallel and load the results into the DB."""
+    reingester = Reingester(
+        key=getattr(args, 'key', None) or KEY,
+        debug=getattr(args, 'debug', False),
+        keyring_file=args.keyring,
+        workers=args.workers or REINGEST_WORKERS,
+        shard_records=args.shard_records or REINGEST_SHARD_RECORDS,
+    )
+    reingester.run(args.files, packet_filter=build_packet_filter(args), record_all=args.record_all)
@@ -0,0 +1,18 @@
+import logging
+from src.agents.replayer import Replayer
+from src.commands.sniffer import build_packet_filter
+from settings import KEY
+
+def handle_replay_mode(args):
+    """Replay capture files through the sniffer pipeline into the DB."""
+    if args.speed <= 0:
+        logging.error("--speed must be greater than 0.")
+        return
+    replayer = Replayer(key=getattr(args, 'key', None) or KEY, debug=getattr(args, 'debug', False), keyring_file=args.keyring)
+    replayer.replay(
+        args.files,
+        packet_filter=build_packet_filter(args),
+        record_all=args.record_all,
+        realtime=args.realtime,
+        speed=args.speed,
+    )
@@ -1,9 +1,8 @@
-import time
 import logging
 from src.mesh.packet.crafter import send_position, send_message, send_node_info
-from src.clients.mqtt_client import connect_and_get_client, disconnect_client
+from src.clients.publisher_pool import PUBLISHERS
 from src.utils import set_topic, hw_model_to_num
-from settings import MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, ROOT_TOPIC, CHANNEL, KEY, DEBUG, CLIENT_ID
+from settings import ROOT_TOPIC, CHANNEL, KEY, DEBUG
 
 global_message_id = None
 
@@ -13,11 +12,8 @@ def handle_send_mode(args):
         import random
         global_message_id = random.getrandbits(32)
     publish_topic = set_topic(args.gateway_node, ROOT_TOPIC, CHANNEL)
-    mqtt_client = connect_and_get_client(
-        MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, KEY, DEBUG, lambda: None, publish_topic, CLIENT_ID
-    )
-    time.sleep(1)
-    if mqtt_client and mqtt_client.is_connected():
+    mqtt_client = PUBLISHERS.get(publish_topic)
+    if mqtt_client:
         if args.send_type == 'position':
             logging.info("Sending position...")
             send_position(
@@ -40,4 +36,4 @@ def handle_send_mode(args):
                 global_message_id, args.from_node, publish_topic, mqtt_client, DEBUG
             )
         global_message_id += 1
-    disconnect_client(mqtt_client, DEBUG)
+    PUBLISHERS.close()
@@ -1,10 +1,12 @@
 import logging
 from meshtastic.protobuf import portnums_pb2
 from src.agents.sniffer import Sniffer
-from src.clients.db_client import update_channel_membership_callback
+from src.agents.async_sniffer import AsyncSniffer
+from src.mesh.packet.filters import PacketFilter
+from settings import KEY, SNIFFER_WORKERS, SNIFFER_WORKER_MODE
 
-def handle_sniffer_mode(args):
-    """Start sniffer with selected portnums from argparse args."""
+def build_packet_filter(args):
+    """Build the PacketFilter for the portnum and header filter flags of argparse args."""
     portnums = []
     if getattr(args, 'text', False):
         portnums.append(portnums_pb2.TEXT_MESSAGE_APP)
@@ -18,6 +20,8 @@ def handle_sniffer_mode(args):
         portnums.extend([portnums_pb2.TRACEROUTE_APP, portnums_pb2.ROUTING_APP])
     if getattr(args, 'telemetry', False):
         portnums.append(portnums_pb2.TELEMETRY_APP)
+    # Undecodable packets have no portnum, keep them only when no portnum was selected
+    keep_undecoded = not portnums
     if not portnums:
         portnums = [
             portnums_pb2.TEXT_MESSAGE_APP,
@@ -28,5 +32,27 @@ def handle_sniffer_mode(args):
             portnums_pb2.ROUTING_APP,
             portnums_pb2.TELEMETRY_APP
         ]
-    sniffer = Sniffer(key=getattr(args, 'key', None), debug=getattr(args, 'debug', False))
-    sniffer.sniff(enabled_portnums=portnums, callback=update_channel_membership_callback)
+    return PacketFilter(
+        from_ids=getattr(args, 'from_node', None),
+        to_ids=getattr(args, 'to_node', None),
+        channel_hashes=getattr(args, 'channel_hash', None),
+        gateway_ids=getattr(args, 'gateway_node', None),
+        topic=getattr(args, 'topic', None),
+        portnums=portnums,
+        keep_undecoded=keep_undecoded,
+    )
+
+def handle_sniffer_mode(args):
+    """Start sniffer with selected portnums from argparse args."""
+    packet_filter = build_packet_filter(args)
+    sniffer_kwargs = dict(key=getattr(args, 'key', None) or KEY, debug=getattr(args, 'debug', False), keyring_file=getattr(args, 'keyring', None))
+    if getattr(args, 'async_mode', False):
+        sniffer = AsyncSniffer(
+            workers=args.workers or SNIFFER_WORKERS,
+            worker_mode=args.worker_mode or SNIFFER_WORKER_MODE,
+            **sniffer_kwargs
+        )
+    else:
+        sniffer = Sniffer(**sniffer_kwargs)
+    # Channel membership is recorded by the handler through the sniffer's ingest queue
+    sniffer.sniff(packet_filter=packet_filter, record_all=getattr(args, 'record_all', False))
@@ -29,21 +29,24 @@ def handle_spoofer_mode(args):
         pubkey=getattr(args, 'pubkey', None),
         gateway_node=getattr(args, 'gateway_node', BROADCAST_MAC),
     )
-    if spoof_mode == 'reactive':
-        spoofer.spoof_reactive(**kwargs, burst=burst, period=period)
-    elif spoof_mode == 'periodic':
-        interval = getattr(args, 'interval', 60)
-        try:
-            interval = int(interval)
-        except (TypeError, ValueError):
-            interval = 60
-        spoofer.spoof_periodic(**kwargs, burst=burst, period=period, interval=interval)
-    elif spoof_mode == 'hybrid':
-        interval = getattr(args, 'interval', 60)
-        try:
-            interval = int(interval)
-        except (TypeError, ValueError):
-            interval = 60
-        spoofer.spoof_hybrid(**kwargs, burst=burst, period=period, interval=interval)
-    else:
-        spoofer.spoof_node(**kwargs, burst=burst, period=period)
+    try:
+        if spoof_mode == 'reactive':
+            spoofer.spoof_reactive(**kwargs, burst=burst, period=period)
+        elif spoof_mode == 'periodic':
+            interval = getattr(args, 'interval', 60)
+            try:
+                interval = int(interval)
+            except (TypeError, ValueError):
+                interval = 60
+            spoofer.spoof_periodic(**kwargs, burst=burst, period=period, interval=interval)
+        elif spoof_mode == 'hybrid':
+            interval = getattr(args, 'interval', 60)
+            try:
+                interval = int(interval)
+            except (TypeError, ValueError):
+                interval = 60
+            spoofer.spoof_hybrid(**kwargs, burst=burst, period=period, interval=interval)
+        else:
+            spoofer.spoof_node(**kwargs, burst=burst, period=period)
+    finally:
+        spoofer.close()
@@ -1,35 +1,79 @@
 import base64
+from functools import lru_cache
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
-from src.utils import generate_hash, ensure_aes_key
+from src.utils import xor_hash, ensure_aes_key
 from meshtastic.protobuf import mesh_pb2
 import logging
 
+
+class ChannelCrypto:
+    """
+    Crypto context for one (channel name, PSK) pair.
+    Holds the decoded key bytes, a reusable AES algorithm object and the channel hash,
+    so per-packet work is limited to building the CTR nonce and running the cipher.
+    """
+    __slots__ = ('channel', 'key', 'key_bytes', 'algorithm', 'channel_hash')
+
+    def __init__(self, channel, key):
+        self.channel = channel
+        self.key = ensure_aes_key(key)
+        padded_key = self.key.ljust(len(self.key) + ((4 - (len(self.key) % 4)) % 4), '=')
+        replaced_key = padded_key.replace('-', '+').replace('_', '/')
+        self.key_bytes = base64.b64decode(replaced_key.encode('ascii'))
+        # An empty key means the channel is not encrypted
+        self.algorithm = algorithms.AES(self.key_bytes) if self.key_bytes else None
+        self.channel_hash = xor_hash(channel.encode('utf-8')) ^ xor_hash(self.key_bytes) if channel is not None else None
+
+    def __repr__(self):
+        return f"ChannelCrypto(channel={self.channel!r}, hash={self.channel_hash})"
+
+    @staticmethod
+    def nonce(packet_id, from_node):
+        return packet_id.to_bytes(8, "little") + from_node.to_bytes(8, "little")
+
+    def encrypt(self, packet_id, from_node, plaintext: bytes) -> bytes:
+        cipher = Cipher(self.algorithm, modes.CTR(self.nonce(packet_id, from_node)), backend=default_backend())
+        encryptor = cipher.encryptor()
+        return encryptor.update(plaintext) + encryptor.finalize()
+
+    # AES-CTR is symmetric
+    decrypt = encrypt
+
+    def decrypt_packet(self, mp):
+        try:
+            bytes_ = self.decrypt(getattr(mp, "id"), getattr(mp, "from"), getattr(mp, "encrypted"))
+            data = mesh_pb2.Data()
+            data.ParseFromString(bytes_)
+            return data
+        except Exception as e:
+            logging.info(f"[Decrypt] Error: {e}")
+            return None
+
+
+@lru_cache(maxsize=256)
+def get_channel_crypto(channel, key) -> ChannelCrypto:
+    """Return the shared ChannelCrypto for (channel, key), building it on first use."""
+    return ChannelCrypto(channel, key)
+
+
+def _as_crypto(channel, key) -> ChannelCrypto:
+    return key if isinstance(key, ChannelCrypto) else get_channel_crypto(channel, key)
+
+
 def encrypt_message(channel, key, mesh_packet, encoded_message, node_number):
-    key = ensure_aes_key(key)
-    mesh_packet.channel = generate_hash(channel, key)
-    key_bytes = base64.b64decode(key.encode('ascii'))
-    nonce_packet_id = mesh_packet.id.to_bytes(8, "little")
-    nonce_from_node = node_number.to_bytes(8, "little")
-    nonce = nonce_packet_id + nonce_from_node
-    cipher = Cipher(algorithms.AES(key_bytes), modes.CTR(nonce), backend=default_backend())
-    encryptor = cipher.encryptor()
-    encrypted_bytes = encryptor.update(encoded_message.SerializeToString()) + encryptor.finalize()
-    return encrypted_bytes
-
-def decrypt_packet(mp, key: str):
-    key = ensure_aes_key(key)
+    crypto = _as_crypto(channel, key)
+    mesh_packet.channel = crypto.channel_hash
+    return crypto.encrypt(mesh_packet.id, node_number, encoded_message.SerializeToString())
+
+
+def decrypt_packet(mp, key):
+    """Decrypt a MeshPacket with a base64 PSK string, a ChannelCrypto or a Keyring."""
+    if hasattr(key, 'decrypt_packet'):
+        return key.decrypt_packet(mp)
     try:
-        key_bytes = base64.b64decode(key.encode('ascii'))
-        nonce_packet_id = getattr(mp, "id").to_bytes(8, "little")
-        nonce_from_node = getattr(mp, "from").to_bytes(8, "little")
-        nonce = nonce_packet_id + nonce_from_node
-        cipher = Cipher(algorithms.AES(key_bytes), modes.CTR(nonce), backend=default_backend())
-        decryptor = cipher.decryptor()
-        bytes_ = decryptor.update(getattr(mp, "encrypted")) + decryptor.finalize()
-        data = mesh_pb2.Data()
-        data.ParseFromString(bytes_)
-        return data
+        crypto = get_channel_crypto(None, key)
     except Exception as e:
         logging.info(f"[Decrypt] Error: {e}")
         return None
+    return crypto.decrypt_packet(mp)
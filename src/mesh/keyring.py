@@ -0,0 +1,133 @@
+import logging
+import threading
+from google.protobuf.message import DecodeError
+from meshtastic.protobuf import mesh_pb2, portnums_pb2
+from src.mesh.encryption import ChannelCrypto, get_channel_crypto
+
+_VALID_PORTNUMS = frozenset(v for v in portnums_pb2.PortNum.values() if v != portnums_pb2.UNKNOWN_APP)
+
+
+class Keyring:
+    """
+    Set of channel PSKs indexed by the 1-byte channel hash carried in MeshPacket.channel.
+
+    An encrypted packet is only tried against the keys whose (channel name, PSK) hash
+    matches its channel field, with the last key that worked for that hash tried first.
+    Keys added without a channel name are wildcards, tried only when no indexed key
+    matches. A candidate is accepted only if the plaintext parses as a Data message
+    with a known portnum.
+    """
+    def __init__(self):
+        self._by_hash = {}
+        self._wildcards = []
+        self._memo = {}
+        self._lock = threading.Lock()
+        self.decrypted = 0
+        self.failed = 0
+        self.memo_hits = 0
+        self.attempts = 0
+
+    def __len__(self):
+        return sum(len(c) for c in self._by_hash.values()) + len(self._wildcards)
+
+    def add(self, channel, key):
+        """Add a PSK for a channel name, or a wildcard PSK when channel is None."""
+        crypto = get_channel_crypto(channel, key)
+        if crypto.algorithm is None:
+            return crypto
+        if channel is None:
+            if crypto not in self._wildcards:
+                self._wildcards.append(crypto)
+        else:
+            candidates = self._by_hash.setdefault(crypto.channel_hash, [])
+            if crypto not in candidates:
+                candidates.append(crypto)
+        return crypto
+
+    @classmethod
+    def load(cls, path, keyring=None):
+        """
+        Load keys from a text file, one entry per line:
+            <channel name> <base64 psk>
+            <base64 psk>              (wildcard, tried on any channel)
+        Blank lines and lines starting with '#' are ignored.
+        """
+        keyring = keyring or cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                parts = line.rsplit(None, 1)
+                channel, key = (parts[0], parts[1]) if len(parts) == 2 else (None, parts[0])
+                try:
+                    keyring.add(channel, key)
+                except Exception as e:
+                    logging.warning(f"[Keyring] Skipping invalid key on {path}:{line_no}: {e}")
+        logging.info(f"[Keyring] Loaded {len(keyring)} keys from {path}")
+        return keyring
+
+    @classmethod
+    def for_channel(cls, channel, key, path=None):
+        """
+        Keyring with `key` indexed under `channel` and also tried on any other channel,
+        plus the keys of the keyring file at `path` if given.
+        """
+        keyring = cls()
+        keyring.add(channel, key)
+        keyring.add(None, key)
+        if path:
+            cls.load(path, keyring)
+        return keyring
+
+    def candidates(self, channel_hash):
+        """Yield the keys worth trying for a channel hash, most likely first."""
+        memo = self._memo.get(channel_hash)
+        if memo is not None:
+            yield memo
+        for crypto in self._by_hash.get(channel_hash, ()):
+            if crypto is not memo:
+                yield crypto
+        for crypto in self._wildcards:
+            if crypto is not memo:
+                yield crypto
+
+    def decrypt_packet(self, mp):
+        channel_hash = getattr(mp, 'channel', None)
+        memo = self._memo.get(channel_hash)
+        for crypto in self.candidates(channel_hash):
+            data = self._try_decrypt(crypto, mp)
+            if data is not None:
+                with self._lock:
+                    self.decrypted += 1
+                    if crypto is memo:
+                        self.memo_hits += 1
+                    else:
+                        self._memo[channel_hash] = crypto
+                return data
+        with self._lock:
+            self.failed += 1
+        return None
+
+    def _try_decrypt(self, crypto: ChannelCrypto, mp):
+        with self._lock:
+            self.attempts += 1
+        try:
+            plaintext = crypto.decrypt(getattr(mp, 'id'), getattr(mp, 'from'), getattr(mp, 'encrypted'))
+            data = mesh_pb2.Data()
+            data.ParseFromString(plaintext)
+        except (DecodeError, ValueError, OverflowError):
+            return None
+        if data.portnum not in _VALID_PORTNUMS:
+            return None
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {
+                'keys': len(self),
+                'decrypted': self.decrypted,
+                'failed': self.failed,
+                'memo_hits': self.memo_hits,
+                'attempts': self.attempts,
+            }
@@ -0,0 +1,84 @@
+import time
+from meshtastic.protobuf import mqtt_pb2, portnums_pb2
+from src.utils import num_to_id
+
+_PORTNUM_VALUES = frozenset(portnums_pb2.PortNum.values())
+
+
+class MessageContext:
+    """
+    One MQTT message as it moves through the handler pipeline.
+
+    The ServiceEnvelope is parsed once and the node numbers/ids derived once; filtering,
+    decryption, handling and callbacks all read from here. `timings` records a
+    time.perf_counter() mark per pipeline stage.
+    """
+    __slots__ = (
+        'topic', 'payload', 'received_at', 'timings',
+        'envelope', 'packet', 'decoded',
+        'from_num', 'to_num', 'from_id', 'to_id',
+        'gateway_id', 'channel_id', 'channel_num', 'portnum',
+    )
+
+    def __init__(self, topic, payload, received_at=None):
+        self.topic = topic
+        self.payload = payload
+        # Wall-clock receive time, used for stored timestamps
+        self.received_at = received_at if received_at is not None else time.time()
+        self.timings = {'received': time.perf_counter()}
+        self.envelope = None
+        self.packet = None
+        self.decoded = None
+        self.from_num = None
+        self.to_num = None
+        self.from_id = None
+        self.to_id = None
+        self.gateway_id = None
+        self.channel_id = None
+        self.channel_num = None
+        self.portnum = None
+
+    @classmethod
+    def from_mqtt(cls, msg, received_at=None):
+        # Replayed capture records carry their recorded receive time
+        if received_at is None:
+            received_at = getattr(msg, 'received_at', None)
+        return cls(msg.topic, msg.payload, received_at)
+
+    def parse(self):
+        """Parse the ServiceEnvelope and resolve the packet header fields."""
+        envelope = mqtt_pb2.ServiceEnvelope()
+        envelope.ParseFromString(self.payload)
+        self.envelope = envelope
+        self.gateway_id = envelope.gateway_id
+        self.channel_id = envelope.channel_id  # Human-readable channel name/id
+        if envelope.HasField('packet'):
+            packet = envelope.packet
+            self.packet = packet
+            self.from_num = getattr(packet, 'from')
+            self.to_num = packet.to
+            self.from_id = num_to_id(self.from_num)
+            self.to_id = num_to_id(self.to_num)
+            self.channel_num = packet.channel
+            if packet.HasField('decoded'):
+                self.set_decoded(packet.decoded)
+        self.mark('parsed')
+        return self
+
+    def set_decoded(self, decoded):
+        self.decoded = decoded
+        self.portnum = decoded.portnum
+
+    @property
+    def portnum_name(self):
+        if self.portnum in _PORTNUM_VALUES:
+            return portnums_pb2.PortNum.Name(self.portnum)
+        return self.portnum
+
+    def mark(self, stage):
+        self.timings[stage] = time.perf_counter()
+
+    def elapsed(self, since='received', until=None):
+        """Seconds between two recorded stages (until defaults to now)."""
+        end = self.timings[until] if until else time.perf_counter()
+        return end - self.timings[since]
@@ -2,27 +2,43 @@ from meshtastic.protobuf import mesh_pb2, mqtt_pb2, portnums_pb2
 import time
 import base64
 import re
-from src.utils import generate_hash
-from src.mesh.encryption import encrypt_message
+import struct
+from src.mesh.encryption import ChannelCrypto, get_channel_crypto
 
-def generate_mesh_packet(destination_id, encoded_message, node_number, channel, key, global_message_id, node_name, publish_topic, mqtt_client, debug=False):
+def encode_envelope(destination_id, plaintext, node_number, crypto, packet_id, channel, node_name, encrypted=True):
+    """
+    Build the serialized ServiceEnvelope for an already serialized Data payload.
+    Used directly by callers that keep pre-serialized payloads around, so each send
+    only needs a new packet id and the encryption. With encrypted=False the payload is
+    sent decoded, as gateways uplink unencrypted channels.
+    """
     mesh_packet = mesh_pb2.MeshPacket()
-    mesh_packet.id = global_message_id
+    mesh_packet.id = packet_id
     setattr(mesh_packet, "from", node_number)
     mesh_packet.to = destination_id
     mesh_packet.want_ack = False
-    mesh_packet.channel = generate_hash(channel, key)
+    mesh_packet.channel = crypto.channel_hash
     mesh_packet.hop_limit = 3
     mesh_packet.hop_start = 3
-    if key == "":
-        mesh_packet.decoded.CopyFrom(encoded_message)
+    if crypto.algorithm is None or not encrypted:
+        mesh_packet.decoded.ParseFromString(plaintext)
     else:
-        mesh_packet.encrypted = encrypt_message(channel, key, mesh_packet, encoded_message, node_number)
+        mesh_packet.encrypted = crypto.encrypt(packet_id, node_number, plaintext)
     service_envelope = mqtt_pb2.ServiceEnvelope()
     service_envelope.packet.CopyFrom(mesh_packet)
     service_envelope.channel_id = channel
     service_envelope.gateway_id = node_name
-    payload = service_envelope.SerializeToString()
+    return service_envelope.SerializeToString()
+
+def _crypto_for(channel, key):
+    # key may be a PSK string or a prebuilt ChannelCrypto for this channel
+    return key if isinstance(key, ChannelCrypto) else get_channel_crypto(channel, key)
+
+def generate_mesh_packet(destination_id, encoded_message, node_number, channel, key, global_message_id, node_name, publish_topic, mqtt_client, debug=False):
+    crypto = _crypto_for(channel, key)
+    payload = encode_envelope(
+        destination_id, encoded_message.SerializeToString(), node_number, crypto, global_message_id, channel, node_name
+    )
     if mqtt_client and mqtt_client.is_connected():
         mqtt_client.publish(publish_topic, payload)
     else:
@@ -68,8 +84,18 @@ def send_node_info(destination_mac, want_response, node_mac, channel, key, globa
     if debug: print(f"Sending NodeInfo Packet to {str(destination_mac)}")
     destination_id = int(destination_mac[1:], 16)
     node_number = int(node_mac[1:], 16)
+    encoded_message = build_node_info_data(want_response, node_mac, client_long_name, client_short_name, client_hw_model, client_pubkey)
+    generate_mesh_packet(
+        destination_id, encoded_message, node_number, channel, key, global_message_id, node_name, publish_topic, mqtt_client, debug
+    )
+
+def build_node_info_data(want_response, node_mac, client_long_name, client_short_name, client_hw_model, client_pubkey):
+    """Build the NODEINFO_APP Data message sent by send_node_info."""
+    if not isinstance(node_mac, str):
+        node_mac = f"!{node_mac:08x}"
     user_payload = mesh_pb2.User()
-    setattr(user_payload, "id", node_mac[1:])
+    # Firmware sends the id in its !abcd1234 form
+    setattr(user_payload, "id", node_mac)
     setattr(user_payload, "long_name", client_long_name)
     setattr(user_payload, "short_name", client_short_name)
     setattr(user_payload, "hw_model", client_hw_model)
@@ -82,9 +108,7 @@ def send_node_info(destination_mac, want_response, node_mac, channel, key, globa
     encoded_message.payload = user_payload
     encoded_message.bitfield = 1
     encoded_message.want_response = want_response
-    generate_mesh_packet(
-        destination_id, encoded_message, node_number, channel, key, global_message_id, node_name, publish_topic, mqtt_client, debug
-    )
+    return encoded_message
 
 def send_position(destination_id, lat, lon, alt, node_number, channel, key, global_message_id, node_name, publish_topic, mqtt_client, debug=False):
     # Ensure destination_id and node_number are strings
@@ -93,7 +117,14 @@ def send_position(destination_id, lat, lon, alt, node_number, channel, key, glob
     if not isinstance(node_number, str):
         node_number = f"!{node_number:x}"
     if debug: print(f"Sending Position Packet to {str(destination_id)}")
-    pos_time = int(time.time())
+    encoded_message = build_position_data(lat, lon, alt)
+    generate_mesh_packet(
+        int(destination_id[1:], 16), encoded_message, int(node_number[1:], 16), channel, key, global_message_id, node_name, publish_topic, mqtt_client, debug
+    )
+
+def build_position_data(lat, lon, alt, pos_time=None):
+    """Build the POSITION_APP Data message sent by send_position, timestamped now by default."""
+    pos_time = int(time.time()) if pos_time is None else pos_time
     latitude = int(float(lat) * 1e7)
     longitude = int(float(lon) * 1e7)
     altitude_units = 1 / 3.28084 if 'ft' in str(alt) else 1.0
@@ -109,9 +140,7 @@ def send_position(destination_id, lat, lon, alt, node_number, channel, key, glob
     encoded_message.payload = position_payload
     encoded_message.bitfield = 1
     encoded_message.want_response = True
-    generate_mesh_packet(
-        int(destination_id[1:], 16), encoded_message, int(node_number[1:], 16), channel, key, global_message_id, node_name, publish_topic, mqtt_client, debug
-    )
+    return encoded_message
 
 def send_ack(destination_id, message_id, node_number, channel, key, global_message_id, node_name, publish_topic, mqtt_client, debug=False):
     if debug: print("Sending ACK")
@@ -122,3 +151,146 @@ def send_ack(destination_id, message_id, node_number, channel, key, global_messa
     generate_mesh_packet(
         destination_id, encoded_message, node_number, channel, key, global_message_id, node_name, publish_topic, mqtt_client, debug
     )
+
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+# Wire-format tags of the fields patched per emission
+_TAG_ENVELOPE_PACKET = b"\x0a"   # ServiceEnvelope.packet, length-delimited
+_TAG_PACKET_TO = b"\x15"         # MeshPacket.to, fixed32
+_TAG_PACKET_DECODED = b"\x22"    # MeshPacket.decoded, length-delimited
+_TAG_PACKET_ENCRYPTED = b"\x2a"  # MeshPacket.encrypted, length-delimited
+_TAG_PACKET_ID = b"\x35"         # MeshPacket.id, fixed32
+_TAG_PACKET_RX_TIME = b"\x3d"    # MeshPacket.rx_time, fixed32
+_TAG_PACKET_RX_SNR = b"\x45"     # MeshPacket.rx_snr, float
+_TAG_PACKET_HOP_LIMIT = b"\x48"  # MeshPacket.hop_limit, varint
+_TAG_PACKET_WANT_ACK = b"\x50"   # MeshPacket.want_ack, varint
+_TAG_PACKET_RX_RSSI = b"\x60"    # MeshPacket.rx_rssi, int32 varint
+_TAG_PACKET_HOP_START = b"\x78"  # MeshPacket.hop_start, varint
+_TAG_POSITION_TIME = b"\x25"     # Position.time, fixed32
+_TAG_DATA_PORTNUM = b"\x08"      # Data.portnum, varint
+_TAG_DATA_PAYLOAD = b"\x12"      # Data.payload, length-delimited
+_TAG_DATA_WANT_RESPONSE = b"\x18"  # Data.want_response, varint
+_TAG_DATA_REQUEST_ID = b"\x35"   # Data.request_id, fixed32
+_TAG_DATA_BITFIELD = b"\x48"     # Data.bitfield, varint
+
+
+def encode_data(portnum, payload, want_response=False, request_id=None):
+    """Serialize a Data message directly, for payloads that change on every packet."""
+    parts = [_TAG_DATA_PORTNUM, _varint(portnum), _TAG_DATA_PAYLOAD, _varint(len(payload)), payload]
+    if want_response:
+        parts.append(_TAG_DATA_WANT_RESPONSE + b"\x01")
+    if request_id:
+        parts.append(_TAG_DATA_REQUEST_ID + struct.pack("<I", request_id))
+    parts.append(_TAG_DATA_BITFIELD + b"\x01")
+    return b"".join(parts)
+
+
+def encode_packet_fields(to=None, hop_limit=None, hop_start=None, want_ack=False, rx_time=None, rx_snr=None, rx_rssi=None):
+    """
+    Serialize MeshPacket header fields to append with PacketTemplate.emit(extra=...).
+    A scalar field that appears twice takes its last value, so these override the template's.
+    """
+    parts = []
+    if to is not None:
+        parts.append(_TAG_PACKET_TO + struct.pack("<I", to))
+    if hop_limit is not None:
+        parts.append(_TAG_PACKET_HOP_LIMIT + _varint(hop_limit))
+    if hop_start is not None:
+        parts.append(_TAG_PACKET_HOP_START + _varint(hop_start))
+    if want_ack:
+        parts.append(_TAG_PACKET_WANT_ACK + b"\x01")
+    if rx_time is not None:
+        parts.append(_TAG_PACKET_RX_TIME + struct.pack("<I", int(rx_time)))
+    if rx_snr is not None:
+        parts.append(_TAG_PACKET_RX_SNR + struct.pack("<f", rx_snr))
+    if rx_rssi is not None:
+        # Negative int32 values are sign-extended to a 10 byte varint
+        parts.append(_TAG_PACKET_RX_RSSI + _varint(rx_rssi & 0xFFFFFFFFFFFFFFFF))
+    return b"".join(parts)
+
+
+class PacketTemplate:
+    """
+    Pre-serialized packet for repeated emissions of the same content.
+
+    The Data payload, the invariant MeshPacket header fields and the ServiceEnvelope
+    fields are serialized once. emit() only writes the packet id, patches the position
+    time in place when the payload has one, encrypts and concatenates. Protobuf parsers
+    accept fields in any order, so the patched fields are appended after the invariant
+    ones. The output parses to the same envelope as generate_mesh_packet.
+    """
+    __slots__ = ('destination_id', 'node_number', 'crypto', 'plaintext', 'time_offset', 'packet_prefix', 'envelope_suffix')
+
+    def __init__(self, destination_id, encoded_message, node_number, crypto, channel, node_name, time_offset=None):
+        self.destination_id = destination_id
+        self.node_number = node_number
+        self.crypto = crypto
+        self.plaintext = bytes(encoded_message) if isinstance(encoded_message, (bytes, bytearray)) else encoded_message.SerializeToString()
+        self.time_offset = time_offset
+        mesh_packet = mesh_pb2.MeshPacket()
+        setattr(mesh_packet, "from", node_number)
+        mesh_packet.to = destination_id
+        mesh_packet.want_ack = False
+        mesh_packet.channel = crypto.channel_hash
+        mesh_packet.hop_limit = 3
+        mesh_packet.hop_start = 3
+        self.packet_prefix = mesh_packet.SerializeToString()
+        service_envelope = mqtt_pb2.ServiceEnvelope()
+        service_envelope.channel_id = channel
+        service_envelope.gateway_id = node_name
+        self.envelope_suffix = service_envelope.SerializeToString()
+
+    @classmethod
+    def node_info(cls, destination_id, want_response, node_number, channel, key, node_name, client_long_name, client_short_name, client_hw_model, client_pubkey):
+        data = build_node_info_data(want_response, node_number, client_long_name, client_short_name, client_hw_model, client_pubkey)
+        return cls(destination_id, data, node_number, _crypto_for(channel, key), channel, node_name)
+
+    @classmethod
+    def position(cls, destination_id, lat, lon, alt, node_number, channel, key, node_name):
+        data = build_position_data(lat, lon, alt, pos_time=0)
+        # Re-append the time as a fixed32 at the end of the Position payload so it can be patched in place
+        position = data.payload + _TAG_POSITION_TIME + bytes(4)
+        data.payload = position
+        serialized = data.SerializeToString()
+        time_offset = serialized.index(position) + len(position) - 4
+        return cls(destination_id, serialized, node_number, _crypto_for(channel, key), channel, node_name, time_offset)
+
+    @classmethod
+    def message(cls, destination_id, message_text, node_number, channel, key, node_name):
+        data = mesh_pb2.Data()
+        data.portnum = portnums_pb2.TEXT_MESSAGE_APP
+        data.payload = message_text.encode("utf-8")
+        data.bitfield = 1
+        return cls(destination_id, data, node_number, _crypto_for(channel, key), channel, node_name)
+
+    def emit(self, packet_id, now=None, plaintext=None, extra=b"", encrypted=True):
+        """
+        Return the serialized ServiceEnvelope for packet_id (and the current time).
+        `plaintext` replaces the template's serialized Data for this emission, `extra` holds
+        MeshPacket fields overriding the template's (see encode_packet_fields), and
+        encrypted=False sends the payload decoded.
+        """
+        if plaintext is None:
+            plaintext = self.plaintext
+            if self.time_offset is not None:
+                plaintext = bytearray(plaintext)
+                struct.pack_into("<I", plaintext, self.time_offset, int(time.time() if now is None else now))
+        if self.crypto.algorithm is None or not encrypted:
+            body = _TAG_PACKET_DECODED + _varint(len(plaintext)) + plaintext
+        else:
+            body = _TAG_PACKET_ENCRYPTED + _varint(len(plaintext)) + self.crypto.encrypt(packet_id, self.node_number, bytes(plaintext))
+        packet = b"".join((self.packet_prefix, extra, _TAG_PACKET_ID, struct.pack("<I", packet_id), body))
+        return b"".join((_TAG_ENVELOPE_PACKET, _varint(len(packet)), packet, self.envelope_suffix))
+
+    def publish(self, packet_id, publish_topic, mqtt_client, debug=False):
+        if mqtt_client and mqtt_client.is_connected():
+            mqtt_client.publish(publish_topic, self.emit(packet_id))
+        else:
+            if debug: print("MQTT client not connected, cannot publish message.")
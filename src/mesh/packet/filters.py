@@ -0,0 +1,55 @@
+from src.utils import num_to_id, topic_matches
+
+
+def _as_node_id(node):
+    """Normalize a node given as !abcd1234 or as a node number to a node_id string."""
+    if isinstance(node, str) and node.startswith('!'):
+        return node.lower()
+    return num_to_id(int(node))
+
+
+class PacketFilter:
+    """
+    Decides which packets the sniffer handles.
+
+    Header checks (from/to node, channel hash, gateway, topic) only need the parsed
+    envelope and run before decryption; the portnum check runs right after the payload
+    is decoded. A criterion left as None accepts everything. Packets that cannot be
+    decoded have no portnum and are kept only if `keep_undecoded` is set, which
+    defaults to True when no portnum filter is given.
+    """
+    def __init__(self, from_ids=None, to_ids=None, channel_hashes=None, gateway_ids=None, topic=None, portnums=None, keep_undecoded=None):
+        self.from_ids = frozenset(_as_node_id(n) for n in from_ids) if from_ids else None
+        self.to_ids = frozenset(_as_node_id(n) for n in to_ids) if to_ids else None
+        self.channel_hashes = frozenset(channel_hashes) if channel_hashes else None
+        self.gateway_ids = frozenset(_as_node_id(n) for n in gateway_ids) if gateway_ids else None
+        self.topic = topic
+        self.portnums = frozenset(portnums) if portnums is not None else None
+        self.keep_undecoded = self.portnums is None if keep_undecoded is None else keep_undecoded
+        self.header_dropped = 0
+        self.portnum_dropped = 0
+
+    def accepts_header(self, ctx):
+        if (
+            (self.from_ids is not None and ctx.from_id not in self.from_ids)
+            or (self.to_ids is not None and ctx.to_id not in self.to_ids)
+            or (self.channel_hashes is not None and ctx.channel_num not in self.channel_hashes)
+            or (self.gateway_ids is not None and ctx.gateway_id not in self.gateway_ids)
+            or (self.topic is not None and not topic_matches(self.topic, ctx.topic))
+        ):
+            self.header_dropped += 1
+            return False
+        return True
+
+    def accepts_portnum(self, portnum):
+        """Check a decoded portnum; None means the payload could not be decoded."""
+        if portnum is None:
+            accepted = self.keep_undecoded
+        else:
+            accepted = self.portnums is None or portnum in self.portnums
+        if not accepted:
+            self.portnum_dropped += 1
+        return accepted
+
+    def stats(self):
+        return {'header_dropped': self.header_dropped, 'portnum_dropped': self.portnum_dropped}
@@ -1,10 +1,12 @@
 import logging
 from datetime import datetime
 from typing import Any, Dict, Optional
-from meshtastic.protobuf import mqtt_pb2, mesh_pb2, portnums_pb2, telemetry_pb2
+from meshtastic.protobuf import mesh_pb2, portnums_pb2, telemetry_pb2
 from src.clients.db_client import DB
 from src.mesh.encryption import decrypt_packet
-from src.utils import num_to_id, num_to_mac, id_to_num, hw_num_to_model
+from src.mesh.packet.context import MessageContext
+from src.mesh.packet.filters import PacketFilter
+from src.utils import num_to_mac, id_to_num, hw_num_to_model
 
 def handle_nodeinfo(payload: bytes) -> Dict[str, Any]:
     user = mesh_pb2.User()
@@ -84,42 +86,92 @@ def handle_route_discovery(payload: bytes) -> None:
     except Exception as e:
         logging.warning(f"[RouteDiscovery] failed to decode: {e}")
 
-def handle_routing(payload: bytes) -> None:
+def handle_routing(payload: bytes) -> Optional[mesh_pb2.Routing]:
     routing = mesh_pb2.Routing()
     try:
         routing.ParseFromString(payload)
         logging.info(f"[Routing] routing={routing}")
+        return routing
     except Exception as e:
         logging.warning(f"[Routing] failed to decode: {e}")
+        return None
+
+def _is_ack(routing: Optional[mesh_pb2.Routing]) -> bool:
+    """An ACK is a Routing message carrying error_reason NONE (not a route request or reply)."""
+    return routing is not None and routing.WhichOneof('variant') == 'error_reason' and routing.error_reason == mesh_pb2.Routing.NONE
 
 def handle_other(portnum: int, payload: bytes) -> None:
     logging.info(f"[Other] portnum={portnum} payload={payload}")
 
+def _packet_row(ctx: MessageContext, packet_type, payload_size) -> Dict[str, Any]:
+    """Build the add_node_packet kwargs for the packet carried by ctx."""
+    packet = ctx.packet
+    return dict(
+        from_node_id=ctx.from_id,
+        gateway_node_id=ctx.gateway_id or None,
+        to_node_id=ctx.to_id,
+        packet_type=packet_type,
+        rssi=getattr(packet, 'rssi', None),
+        snr=getattr(packet, 'snr', None),
+        payload_size=payload_size,
+        response_time=None,
+        timestamp=datetime.fromtimestamp(ctx.received_at),
+        channel_id=ctx.channel_id,  # Use the string channel id from the envelope, not the hash
+        packet_id=getattr(packet, 'id', None),
+        rx_rssi=getattr(packet, 'rx_rssi', None),
+        rx_snr=getattr(packet, 'rx_snr', None),
+        rx_time=getattr(packet, 'rx_time', None),
+        hop_start=getattr(packet, 'hop_start', None),
+        hop_limit=getattr(packet, 'hop_limit', None),
+        # Only set success=False if want_ack is True, otherwise leave as None
+        want_ack=getattr(packet, 'want_ack', None),
+    )
+
+def _store_raw_packet(ctx: MessageContext, writer, packet_type: str) -> None:
+    """Save a packet whose payload could not be decoded, with header info only."""
+    packet = ctx.packet
+    writer.add_node_packet(**_packet_row(
+        ctx,
+        packet_type,
+        payload_size=len(packet.encrypted) if packet.encrypted else None,
+    ))
+
+def _last_seen(ctx: MessageContext) -> str:
+    return datetime.fromtimestamp(ctx.received_at).strftime("%Y-%m-%d %H:%M:%S")
+
+def _record_channel_membership(ctx: MessageContext, writer) -> None:
+    writer.add_or_update_channel(channel_num=ctx.channel_num, channel_id=ctx.channel_id, member_node_ids=[ctx.from_id])
+
+def _record_packet(ctx: MessageContext, writer) -> None:
+    """Persist a filtered-out packet's header info (record-all mode), without handling its payload."""
+    packet = ctx.packet
+    _record_channel_membership(ctx, writer)
+    writer.add_or_update_node(node_number=ctx.from_num, last_seen=_last_seen(ctx))
+    if ctx.decoded is not None:
+        packet_type = ctx.portnum_name
+        payload_size = len(ctx.decoded.payload) if ctx.decoded.payload else None
+    else:
+        packet_type = "PKI_ENCRYPTED" if packet.pki_encrypted else "ENCRYPTED"
+        payload_size = len(packet.encrypted) if packet.encrypted else None
+    writer.add_node_packet(**_packet_row(ctx, packet_type, payload_size=payload_size))
+
 def handle_packet(
-    packet: mesh_pb2.MeshPacket,
-    decoded_data: mesh_pb2.Data,
-    enabled_portnums: Optional[list] = None,
+    ctx: MessageContext,
     callback: Optional[callable] = None,
-    gateway_node_id: Optional[str] = None,
-    channel_id_str: Optional[str] = None  # Pass the human-readable channel id
+    writer=None  # DBClient or IngestQueue receiving the writes
 ) -> None:
-    if enabled_portnums is None:
-        logging.warning("No enabled portnums provided, processing all packets.")
-
-    from_node_number = getattr(packet, 'from', 0)
-    to_node_number = getattr(packet, 'to', 0)
-    from_node_id = num_to_id(from_node_number)
-    to_node_id = num_to_id(to_node_number)
-    from_node_shortname, from_node_longname = DB.resolve_node_names(from_node_number)
-    to_node_shortname, to_node_longname = DB.resolve_node_names(to_node_number)
-    portnum = portnums_pb2.PortNum.Name(decoded_data.portnum) if decoded_data.portnum in portnums_pb2.PortNum.values() else decoded_data.portnum
-
-    if enabled_portnums is not None and decoded_data.portnum not in enabled_portnums:
-        logging.debug(f"[Packet] Port number {decoded_data.portnum} not enabled, skipping processing.")
-        return
-    logging.info(f"[Packet] from: {from_node_number} ({from_node_id}, {from_node_shortname}, {from_node_longname}) >-- portnum:{portnum} --> to: {to_node_number} ({to_node_id}, {to_node_shortname}, {to_node_longname})")
+    writer = writer or DB
+    decoded_data = ctx.decoded
+    packet = ctx.packet
+    from_node_number = ctx.from_num
+    from_node_id = ctx.from_id
+    to_node_id = ctx.to_id
+    portnum = ctx.portnum_name
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        from_node_shortname, from_node_longname = DB.resolve_node_names(from_node_number)
+        to_node_shortname, to_node_longname = DB.resolve_node_names(ctx.to_num)
+        logging.info(f"[Packet] from: {from_node_number} ({from_node_id}, {from_node_shortname}, {from_node_longname}) >-- portnum:{portnum} --> to: {ctx.to_num} ({to_node_id}, {to_node_shortname}, {to_node_longname})")
     logging.debug(f"[Packet] decoded={decoded_data}")
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     node_kwargs = dict()
     match decoded_data.portnum:
         case portnums_pb2.NODEINFO_APP:
@@ -129,316 +181,155 @@ def handle_packet(
         case portnums_pb2.RANGE_TEST_APP:
                 handle_range_test(decoded_data.payload)
         case portnums_pb2.TELEMETRY_APP:
-                node_kwargs = handle_telemetry(decoded_data.payload)
+                node_kwargs = handle_telemetry(decoded_data.payload) or {}
         case portnums_pb2.TRACEROUTE_APP:
                 handle_route_discovery(decoded_data.payload)
         case portnums_pb2.ROUTING_APP:
-                handle_routing(decoded_data.payload)
-                # --- ACK-matching logic for packet success ---
-                try:
-                    routing = mesh_pb2.Routing()
-                    routing.ParseFromString(decoded_data.payload)
-                    # Try to extract request_id from multiple sources
-                    request_id = getattr(routing, 'request_id', None)
-                    # Fallback: try decoded_data.request_id if present
-                    if (request_id is None or request_id == 0) and hasattr(decoded_data, 'request_id'):
-                        request_id = getattr(decoded_data, 'request_id', None)
-                        logging.debug(f"[ACK-DEBUG] Fallback: got request_id from decoded_data: {request_id}")
-                    # Fallback: try to parse payload as Routing and get request_id
-                    if (request_id is None or request_id == 0):
-                        try:
-                            routing2 = mesh_pb2.Routing()
-                            routing2.ParseFromString(decoded_data.payload)
-                            request_id = getattr(routing2, 'request_id', None)
-                            logging.debug(f"[ACK-DEBUG] Fallback: got request_id from reparsed payload: {request_id}")
-                        except Exception as e:
-                            logging.debug(f"[ACK-DEBUG] Could not extract request_id from payload: {e}")
-                    logging.debug(f"[ACK-DEBUG] RoutingApp received: error_reason={getattr(routing, 'error_reason', None)}, request_id={request_id}, from_node_id={from_node_id}, to_node_id={to_node_id}")
-                    # Only care about error_reason==NONE and request_id: mark by request_id only
-                    if hasattr(routing, 'error_reason') and routing.error_reason == 0 and request_id not in (None, 0):
-                        logging.debug(f"[ACK-DEBUG] Attempting to mark packet_id={request_id} as success=True (ANY node)")
-                        updated = DB.mark_packet_success_by_ack(request_id=request_id)
-                        if updated:
+                routing = handle_routing(decoded_data.payload)
+                # The ACKed packet id travels in Data.request_id
+                request_id = decoded_data.request_id
+                if _is_ack(routing) and request_id:
+                    try:
+                        updated = writer.mark_packet_success_by_ack(request_id=request_id, acked_at=ctx.received_at)
+                        if updated is None:
+                            logging.debug(f"[ACK-DEBUG] Queued ACK for packet_id={request_id} (ANY node)")
+                        elif updated:
                             logging.info(f"[ACK] Marked packet_id={request_id} as success=True (ANY node)")
                         else:
-                            logging.warning(f"[ACK-DEBUG] No matching NodePacket found for packet_id={request_id} (ANY node)")
-                    else:
-                        logging.debug(f"[ACK-DEBUG] RoutingApp packet did not meet ACK criteria: error_reason={getattr(routing, 'error_reason', None)}, request_id={request_id}")
-                except Exception as e:
-                    logging.warning(f"[ACK] Failed to process RoutingApp ACK: {e}")
+                            logging.debug(f"[ACK-DEBUG] No packet waiting for an ACK with packet_id={request_id}")
+                    except Exception as e:
+                        logging.warning(f"[ACK] Failed to process RoutingApp ACK: {e}")
+                else:
+                    logging.debug(f"[ACK-DEBUG] RoutingApp packet is not an ACK: request_id={request_id}")
         case portnums_pb2.TEXT_MESSAGE_APP:
                 logging.info(f"[TextMessage] {decoded_data.payload.decode('utf-8', errors='ignore')}")
         case _:
                 handle_other(decoded_data.portnum, decoded_data.payload)
-    DB.add_or_update_node(
+    writer.add_or_update_node(
         node_number=from_node_number,
-        last_seen=now,
+        last_seen=_last_seen(ctx),
         **node_kwargs
     )
 
     # Guardar actividad del nodo
     try:
-        # Determinar gateway_node_id (node_id en el topic MQTT)
-        gateway_node_dbid = None
-        if gateway_node_id:
-            from src.models import Node
-            session = DB.get_session()
-            try:
-                node = session.query(Node).filter(Node.node_id == gateway_node_id).first()
-                if node:
-                    gateway_node_dbid = node.id
-            finally:
-                session.close()
-        # Convertir node_number a node_id (string tipo !abcd1234) antes de guardar
-        from_node_id_str = num_to_id(from_node_number)
-        to_node_id_str = num_to_id(to_node_number)
-        # --- NEW: get channel_id and packet_id, rx_rssi, rx_snr, rx_time, hop_start, hop_limit ---
-        channel_id = channel_id_str  # Use the string from the envelope, not the hash
-        packet_id = None
-        rx_rssi = None
-        rx_snr = None
-        rx_time = None
-        hop_start = None
-        hop_limit = None
-        try:
-            if hasattr(packet, 'id'):
-                packet_id = getattr(packet, 'id', None)
-            if hasattr(packet, 'rx_rssi'):
-                rx_rssi = getattr(packet, 'rx_rssi', None)
-            if hasattr(packet, 'rx_snr'):
-                rx_snr = getattr(packet, 'rx_snr', None)
-            if hasattr(packet, 'rx_time'):
-                rx_time = getattr(packet, 'rx_time', None)
-            if hasattr(packet, 'hop_start'):
-                hop_start = getattr(packet, 'hop_start', None)
-            if hasattr(packet, 'hop_limit'):
-                hop_limit = getattr(packet, 'hop_limit', None)
-        except Exception as e:
-            logging.warning(f"Could not extract extra packet fields: {e}")
-        # Only set success=False if want_ack is True, otherwise leave as None
-        want_ack = getattr(packet, 'want_ack', None)
-        DB.add_node_packet(
-            from_node_id=from_node_id_str,
-            gateway_node_id=gateway_node_dbid if gateway_node_dbid is not None else 0,
-            to_node_id=to_node_id_str,
-            packet_type=portnum,
-            rssi=getattr(packet, 'rssi', None),
-            snr=getattr(packet, 'snr', None),
-            payload_size=len(decoded_data.payload) if hasattr(decoded_data, 'payload') and decoded_data.payload else None,
-            success=False if want_ack else None,
-            response_time=None,
-            timestamp=datetime.now(),
-            channel_id=channel_id,  # Use the string channel id
-            packet_id=packet_id,
-            rx_rssi=rx_rssi,
-            rx_snr=rx_snr,
-            rx_time=rx_time,
-            hop_start=hop_start,
-            hop_limit=hop_limit,
-        )
+        writer.add_node_packet(**_packet_row(
+            ctx,
+            portnum,
+            payload_size=len(decoded_data.payload) if decoded_data.payload else None,
+        ))
     except Exception as e:
         logging.error(f"Error guardando NodePacket: {e}")
+    ctx.mark('handled')
 
     if callback is not None:
         try:
-            # Fix type annotation for callback to avoid mypy/pyright error
-            callback = callback  # type: ignore
-            callback(packet, decoded_data, decoded_data.portnum, from_node_id, to_node_id, **node_kwargs)
+            callback(packet, decoded_data, decoded_data.portnum, from_node_id, to_node_id, context=ctx, **node_kwargs)
         except Exception as e:
             logging.error(f"Error in callback: {e}")
 
 
 
-def _should_process_packet(packet, node_id=None, enabled_portnums=None):
-    from_ = num_to_id(getattr(packet, 'from', None))
-    if node_id is not None and from_ != node_id:
-        return False
-    portnum = None
-    if packet.HasField('decoded'):
-        portnum = packet.decoded.portnum
-    elif packet.HasField('encrypted'):
-        pass
-    if enabled_portnums is not None and portnum is not None and portnum not in enabled_portnums:
-        return False
-    return True
+def decrypt_context(ctx: MessageContext, key) -> None:
+    """Decrypt the packet payload in place, once; PKI packets and missing keys are left as they are."""
+    packet = ctx.packet
+    if ctx.decoded is not None or 'decrypted' in ctx.timings or key is None:
+        return
+    if packet.HasField('encrypted') and not packet.pki_encrypted:
+        payload = decrypt_packet(packet, key)
+        ctx.mark('decrypted')
+        if payload is not None:
+            ctx.set_decoded(payload)
 
-def on_message(client, userdata, msg, key: Optional[str] = None, enabled_portnums: Optional[list] = None, callback = None) -> None:
+def process_message(ctx: MessageContext, key=None, packet_filter: Optional[PacketFilter] = None, callback = None, writer = None, record_all: bool = False) -> None:
+    """
+    Run a parsed message through filtering, decryption and packet handling.
+    Header filters run before decryption and the portnum filter right after it; nothing is
+    written to the DB for packets they drop unless record_all is set.
+    """
+    writer = writer or DB
+    packet = ctx.packet
+    logging.debug(f"Received envelope in topic={ctx.topic}\n{ctx.envelope}")
+    if packet is None:
+        if record_all:
+            fallback_channel_num = abs(hash(ctx.channel_id)) % (10 ** 8)
+            writer.add_or_update_channel(channel_num=fallback_channel_num, channel_id=ctx.channel_id)
+        return
+    packet_filter = packet_filter or PacketFilter()
+    accepted = packet_filter.accepts_header(ctx)
+    if not accepted and not record_all:
+        logging.debug(f"Filtered out packet from {ctx.from_id} to {ctx.to_id} (header)")
+        return
     try:
-        topic = msg.topic
-        envelope = mqtt_pb2.ServiceEnvelope()
-        envelope.ParseFromString(msg.payload)
-        gateway_node_id = getattr(envelope, 'gateway_id', None)
-        channel_id_str = getattr(envelope, 'channel_id', None)  # This is the human-readable channel name/id
+        decrypt_context(ctx, key)
+        accepted = accepted and packet_filter.accepts_portnum(ctx.portnum)
+        if not accepted:
+            if record_all:
+                _record_packet(ctx, writer)
+            else:
+                logging.debug(f"Filtered out packet from {ctx.from_id} to {ctx.to_id} (portnum {ctx.portnum})")
+            return
         # --- Ensure channel exists in DB and add sender as member ---
-        if envelope.HasField('packet'):
-            channel_num = getattr(envelope.packet, 'channel', None)
-            sender_node_number = getattr(envelope.packet, 'from', None)
-            sender_node_id = None
-            if sender_node_number is not None:
-                node_obj = DB.get_node(sender_node_number)
-                if node_obj:
-                    sender_node_id_str = node_obj.node_id
-                    sender_node_id = node_obj.node_id
+        _record_channel_membership(ctx, writer)
+        if ctx.decoded is not None:
+            handle_packet(ctx, callback=callback, writer=writer)
+        elif packet.HasField('encrypted'):
+            if not packet.pki_encrypted:
+                if key is not None:
+                    from_shortname, from_longname = DB.resolve_node_names(ctx.from_num)
+                    to_shortname, to_longname = DB.resolve_node_names(ctx.to_num)
+                    logging.info(f"[Encrypted] Could not decrypt packet from {ctx.from_num} ({ctx.from_id}, {from_shortname}, {from_longname}) to {ctx.to_num} ({ctx.to_id}, {to_shortname}, {to_longname})")
+                    # Save encrypted but undecoded packet to DB
+                    try:
+                        # Add or update both from_node and to_node before saving activity
+                        writer.add_or_update_node(node_number=ctx.from_num, last_seen=_last_seen(ctx))
+                        writer.add_or_update_node(node_number=ctx.to_num)
+                        _store_raw_packet(ctx, writer, "ENCRYPTED")
+                        logging.warning(f"[DB] Saved encrypted/undecoded packet from {ctx.from_id} to {ctx.to_id} (id={packet.id}) to DB.")
+                    except Exception as e2:
+                        logging.error(f"[DB] Failed to save encrypted/undecoded packet: {e2}")
                 else:
-                    sender_node_id = num_to_id(sender_node_number)
-            if channel_num is not None:
-                if sender_node_id is not None:
-                    member_node_ids = [sender_node_id]
-                DB.add_or_update_channel(channel_num=channel_num, channel_id=channel_id_str, member_node_ids=member_node_ids)
-        else:
-            channel_id = getattr(envelope, 'channel_id', None)
-            if channel_id is not None:
-                fallback_channel_num = abs(hash(channel_id)) % (10 ** 8)
-                DB.add_or_update_channel(channel_num=fallback_channel_num, channel_id=channel_id)
-        logging.debug(f"Received envelope in topic={topic}\n{envelope}")
-        if envelope.HasField('packet'):
-            packet = envelope.packet
-            try:
-                if packet.HasField('decoded'):
-                    handle_packet(packet, packet.decoded, enabled_portnums, callback=callback, gateway_node_id=gateway_node_id, channel_id_str=channel_id_str)
-                elif packet.HasField('encrypted'):
-                    pki_encrypted = getattr(packet, 'pki_encrypted', False)
-                    from_ = getattr(packet, 'from')
-                    from_id = num_to_id(from_)
-                    from_shortname, from_longname = DB.resolve_node_names(from_)
-                    to_id = num_to_id(packet.to)
-                    to_shortname, to_longname = DB.resolve_node_names(packet.to)
-                    if not pki_encrypted:
-                        if key is not None:
-                            payload = decrypt_packet(packet, key)
-                            if payload is not None:
-                                handle_packet(packet, payload, enabled_portnums, callback=callback, gateway_node_id=gateway_node_id, channel_id_str=channel_id_str)
-                            else:
-                                logging.info(f"[Encrypted] Could not decrypt packet from {from_} ({from_id}, {from_shortname}, {from_longname}) to {packet.to} ({to_id}, {to_shortname}, {to_longname})")
-                                # Save encrypted but undecoded packet to DB
-                                try:
-                                    from_node_id_str = num_to_id(getattr(packet, 'from', 0))
-                                    to_node_id_str = num_to_id(getattr(packet, 'to', 0))
-                                    packet_id = getattr(packet, 'id', None)
-                                    rx_rssi = getattr(packet, 'rx_rssi', None)
-                                    rx_snr = getattr(packet, 'rx_snr', None)
-                                    rx_time = getattr(packet, 'rx_time', None)
-                                    hop_start = getattr(packet, 'hop_start', None)
-                                    hop_limit = getattr(packet, 'hop_limit', None)
-                                    want_ack = getattr(packet, 'want_ack', None)
-                                    # Add or update both from_node and to_node before saving activity
-                                    DB.add_or_update_node(
-                                        node_number=getattr(packet, 'from', 0),
-                                        last_seen=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                                    )
-                                    DB.add_or_update_node(
-                                        node_number=getattr(packet, 'to', 0)
-                                    )
-                                    DB.add_node_packet(
-                                        from_node_id=from_node_id_str,
-                                        gateway_node_id=gateway_node_id or 0,
-                                        to_node_id=to_node_id_str,
-                                        packet_type="ENCRYPTED",
-                                        rssi=getattr(packet, 'rssi', None),
-                                        snr=getattr(packet, 'snr', None),
-                                        payload_size=len(packet.encrypted) if hasattr(packet, 'encrypted') and packet.encrypted else None,
-                                        success=False if want_ack else None,
-                                        response_time=None,
-                                        timestamp=datetime.now(),
-                                        channel_id=channel_id_str,
-                                        packet_id=packet_id,
-                                        rx_rssi=rx_rssi,
-                                        rx_snr=rx_snr,
-                                        rx_time=rx_time,
-                                        hop_start=hop_start,
-                                        hop_limit=hop_limit,
-                                    )
-                                    logging.warning(f"[DB] Saved encrypted/undecoded packet from {from_node_id_str} to {to_node_id_str} (id={packet_id}) to DB.")
-                                except Exception as e2:
-                                    logging.error(f"[DB] Failed to save encrypted/undecoded packet: {e2}")
-                        else:
-                            logging.info(f"[Encrypted] No key provided for decryption.")
-                    else:
-                        logging.info(f"[PKI] Trying to decrypt PKI encrypted packet from {from_} ({from_id}, {from_shortname}, {from_longname}) to {packet.to} ({to_id}, {to_shortname}, {to_longname}) (Not implemented yet)")
-                        try:
-                            from_node_id_str = num_to_id(from_)
-                            to_node_id_str = num_to_id(packet.to)
-                            packet_id = getattr(packet, 'id', None)
-                            rx_rssi = getattr(packet, 'rx_rssi', None)
-                            rx_snr = getattr(packet, 'rx_snr', None)
-                            rx_time = getattr(packet, 'rx_time', None)
-                            hop_start = getattr(packet, 'hop_start', None)
-                            hop_limit = getattr(packet, 'hop_limit', None)
-                            want_ack = getattr(packet, 'want_ack', None)
-                            DB.add_node_packet(
-                                from_node_id=from_node_id_str,
-                                gateway_node_id=gateway_node_id or 0,
-                                to_node_id=to_node_id_str,
-                                packet_type="PKI_ENCRYPTED",
-                                rssi=getattr(packet, 'rssi', None),
-                                snr=getattr(packet, 'snr', None),
-                                payload_size=len(packet.encrypted) if hasattr(packet, 'encrypted') and packet.encrypted else None,
-                                success=False if want_ack else None,
-                                response_time=None,
-                                timestamp=datetime.now(),
-                                channel_id=channel_id_str,
-                                packet_id=packet_id,
-                                rx_rssi=rx_rssi,
-                                rx_snr=rx_snr,
-                                rx_time=rx_time,
-                                hop_start=hop_start,
-                                hop_limit=hop_limit,
-                            )
-                            logging.debug(f"[PKI] Saved PKI-encrypted packet from {from_node_id_str} to {to_node_id_str} (id={packet_id}) to DB.")
-                        except Exception as e:
-                            logging.error(f"[PKI] Failed to save PKI-encrypted packet: {e}")
-            except Exception as e:
-                # Save undecoded packet with minimal info
+                    logging.info(f"[Encrypted] No key provided for decryption.")
+            else:
+                from_shortname, from_longname = DB.resolve_node_names(ctx.from_num)
+                to_shortname, to_longname = DB.resolve_node_names(ctx.to_num)
+                logging.info(f"[PKI] Trying to decrypt PKI encrypted packet from {ctx.from_num} ({ctx.from_id}, {from_shortname}, {from_longname}) to {ctx.to_num} ({ctx.to_id}, {to_shortname}, {to_longname}) (Not implemented yet)")
                 try:
-                    from_node_id_str = num_to_id(getattr(packet, 'from', 0))
-                    to_node_id_str = num_to_id(getattr(packet, 'to', 0))
-                    packet_id = getattr(packet, 'id', None)
-                    rx_rssi = getattr(packet, 'rx_rssi', None)
-                    rx_snr = getattr(packet, 'rx_snr', None)
-                    rx_time = getattr(packet, 'rx_time', None)
-                    hop_start = getattr(packet, 'hop_start', None)
-                    hop_limit = getattr(packet, 'hop_limit', None)
-                    DB.add_node_packet(
-                        from_node_id=from_node_id_str,
-                        gateway_node_id=gateway_node_id or 0,
-                        to_node_id=to_node_id_str,
-                        packet_type="UNDECODED",
-                        rssi=getattr(packet, 'rssi', None),
-                        snr=getattr(packet, 'snr', None),
-                        payload_size=len(packet.encrypted) if hasattr(packet, 'encrypted') and packet.encrypted else None,
-                        success=False if want_ack else None,
-                        response_time=None,
-                        timestamp=datetime.now(),
-                        channel_id=channel_id_str,
-                        packet_id=packet_id,
-                        rx_rssi=rx_rssi,
-                        rx_snr=rx_snr,
-                        rx_time=rx_time,
-                        hop_start=hop_start,
-                        hop_limit=hop_limit,
-                        want_ack=want_ack
-                    )
-                    logging.warning(f"[DB] Saved undecoded packet from {from_node_id_str} to {to_node_id_str} (id={packet_id}) to DB.")
-                except Exception as e2:
-                    logging.error(f"[DB] Failed to save undecoded packet: {e2}")
-                logging.error(f"[on_message] Failed to decode or process packet: {e}")
+                    _store_raw_packet(ctx, writer, "PKI_ENCRYPTED")
+                    logging.debug(f"[PKI] Saved PKI-encrypted packet from {ctx.from_id} to {ctx.to_id} (id={packet.id}) to DB.")
+                except Exception as e:
+                    logging.error(f"[PKI] Failed to save PKI-encrypted packet: {e}")
+    except Exception as e:
+        # Save undecoded packet with minimal info
+        try:
+            _store_raw_packet(ctx, writer, "UNDECODED")
+            logging.warning(f"[DB] Saved undecoded packet from {ctx.from_id} to {ctx.to_id} (id={packet.id}) to DB.")
+        except Exception as e2:
+            logging.error(f"[DB] Failed to save undecoded packet: {e2}")
+        logging.error(f"[on_message] Failed to decode or process packet: {e}")
+
+def on_message(client, userdata, msg, key=None, enabled_portnums: Optional[list] = None, callback = None, writer = None) -> None:
+    try:
+        ctx = MessageContext.from_mqtt(msg).parse()
     except Exception as e:
         logging.info(f"Error parsing message: {e}")
+        return
+    # Undecodable packets are always stored, whatever portnums are enabled
+    packet_filter = PacketFilter(portnums=enabled_portnums, keep_undecoded=True)
+    process_message(ctx, key, packet_filter=packet_filter, callback=callback, writer=writer)
 
-def filtered_on_message_factory(node_id=None, callback=None, enabled_portnums=None, key=None):
+def filtered_on_message_factory(node_id=None, callback=None, enabled_portnums=None, key=None, writer=None, packet_filter=None, record_all=False):
+    """
+    Build a paho on_message handler. packet_filter takes precedence over node_id/enabled_portnums;
+    with record_all every packet is persisted but only accepted ones are logged and passed to callback.
+    """
+    if packet_filter is None:
+        packet_filter = PacketFilter(from_ids=[node_id] if node_id else None, portnums=enabled_portnums)
     def handler(client, userdata, msg):
-        envelope = mqtt_pb2.ServiceEnvelope()
         try:
-            envelope.ParseFromString(msg.payload)
-            if envelope.HasField('packet'):
-                packet = envelope.packet
-                if not _should_process_packet(packet, node_id=node_id, enabled_portnums=enabled_portnums):
-                    from_ = num_to_id(getattr(packet, 'from', None))
-                    to = num_to_id(getattr(packet, 'to', None))
-                    logging.debug(f"Filtered out packet from {from_} () to {to} ()")
-                    return
-            
-                on_message(client, userdata, msg, key, enabled_portnums=enabled_portnums, callback=callback)
+            ctx = MessageContext.from_mqtt(msg).parse()
+            if ctx.packet is not None or record_all:
+                process_message(ctx, key, packet_filter=packet_filter, callback=callback, writer=writer, record_all=record_all)
         except Exception as e:
             logging.info(f"Sniffer: Error in filtered_on_message: {e}")
     return handler
@@ -0,0 +1,231 @@
+import collections
+import itertools
+import random
+import time
+from meshtastic.protobuf import mesh_pb2, portnums_pb2, telemetry_pb2
+from settings import CHANNEL, KEY, ROOT_TOPIC, BROADCAST_NUM
+from src.mesh.encryption import get_channel_crypto
+from src.mesh.packet.crafter import PacketTemplate, encode_data, encode_packet_fields
+from src.utils import num_to_id, set_topic
+
+# Packet kinds accepted in traffic mix specs ("nodeinfo=3,position=3,...")
+KINDS = ('nodeinfo', 'position', 'telemetry', 'environment', 'text', 'routing', 'traceroute')
+DEFAULT_MIX = 'nodeinfo=3,position=3,text=3,telemetry=1'
+FIRST_NODE = 0x10000000
+HW_MODELS = (43, 9, 4, 31, 48, 50)  # HELTEC_V3, RAK4631, TBEAM, STATION_G2, HELTEC_WIRELESS_TRACKER, T_DECK
+MESSAGES = ('hello mesh', 'anyone on?', 'testing 1 2 3', 'good morning', 'copy that', 'signal check', 'on my way', '73')
+# Routing payload of an ACK: Routing.error_reason = NONE
+ACK_PAYLOAD = b"\x18\x00"
+# Waiting ACKs and traceroute replies kept per kind; older ones are forgotten
+PENDING_REPLIES = 1000
+
+
+def parse_mix(spec):
+    """Parse "kind=weight,..." into a {kind: weight} dict."""
+    mix = {}
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in KINDS:
+            raise ValueError(f"unknown packet kind {name!r} in traffic mix (expected one of {', '.join(KINDS)})")
+        mix[name] = float(weight) if weight else 1.0
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError(f"empty traffic mix {spec!r}")
+    return mix
+
+
+class VirtualNode:
+    """A simulated mesh node: its identity, location, distance to its gateway and packet templates."""
+    __slots__ = ('number', 'node_id', 'gateway', 'topic', 'hops', 'hop_start', 'rssi', 'lat', 'lon', 'alt', 'template', 'position', 'battery')
+
+    def __init__(self, number, gateway, topic, rng, crypto, channel, center):
+        self.number = number
+        self.node_id = num_to_id(number)
+        self.gateway = gateway
+        self.topic = topic
+        self.hop_start = 7 if rng.random() < 0.2 else 3
+        # Gateways hear themselves directly, other nodes mostly within a hop or two
+        self.hops = 0 if gateway == number else min(self.hop_start, int(rng.expovariate(1.0)))
+        self.rssi = rng.uniform(-120, -60)
+        self.lat = center[0] + rng.gauss(0, 0.05)
+        self.lon = center[1] + rng.gauss(0, 0.05)
+        self.alt = rng.randrange(0, 400)
+        self.battery = rng.randrange(20, 101)
+        gateway_id = num_to_id(gateway)
+        # The node's NodeInfo is the template's default payload, everything else is passed per emission
+        self.template = PacketTemplate.node_info(
+            BROADCAST_NUM, False, number, channel, crypto, gateway_id,
+            f"Node {self.node_id[1:]}", self.node_id[-4:], rng.choice(HW_MODELS), None
+        )
+        self.position = PacketTemplate.position(BROADCAST_NUM, self.lat, self.lon, self.alt, number, channel, crypto, gateway_id)
+
+
+class SyntheticTraffic:
+    """
+    Endless stream of synthetic Meshtastic MQTT traffic from a fixed set of virtual nodes.
+
+    Each message is a (topic, serialized ServiceEnvelope) pair, uplinked by the gateway that
+    hears the sending node and built from per-node PacketTemplates, so a packet costs an
+    encryption plus a few concatenations. Kinds are drawn from `mix`. Direct text messages
+    ask for an ACK and traceroute requests for a reply; later routing/traceroute draws
+    answer them with matching request ids. Hop counts and rx_rssi/rx_snr follow each node's
+    distance to its gateway. A fraction `encrypted_ratio` of packets is encrypted with the
+    channel key and the rest is uplinked decoded. A seed makes the stream reproducible.
+    """
+    def __init__(self, nodes=50, mix=DEFAULT_MIX, encrypted_ratio=0.8, channel=CHANNEL, key=KEY, root_topic=ROOT_TOPIC, seed=None, center=(40.4168, -3.7038)):
+        self.rng = random.Random(seed)
+        self.channel = channel
+        self.crypto = get_channel_crypto(channel, key)
+        mix = parse_mix(mix) if isinstance(mix, str) else dict(mix)
+        self.kinds = list(mix)
+        self.cum_weights = list(itertools.accumulate(mix.values()))
+        self.encrypted_ratio = encrypted_ratio
+        numbers = [FIRST_NODE + i for i in range(max(1, nodes))]
+        # A tenth of the nodes act as MQTT gateways for the whole mesh
+        gateways = numbers[:max(1, len(numbers) // 10)]
+        self.nodes = []
+        for number in numbers:
+            gateway = number if number in gateways else self.rng.choice(gateways)
+            topic = set_topic(num_to_id(gateway), root_topic, channel)
+            self.nodes.append(VirtualNode(number, gateway, topic, self.rng, self.crypto, channel, center))
+        self.by_number = {node.number: node for node in self.nodes}
+        self.node_numbers = numbers
+        self.topics = sorted({node.topic for node in self.nodes})
+        self._awaiting_ack = collections.deque(maxlen=PENDING_REPLIES)
+        self._awaiting_route = collections.deque(maxlen=PENDING_REPLIES)
+        self.now = None
+        self.sent = 0
+
+    def _other(self, node):
+        other = self.rng.choice(self.nodes)
+        return other if other is not node or len(self.nodes) == 1 else self.rng.choice(self.nodes)
+
+    def _emit(self, node, plaintext=None, to=None, want_ack=False, template=None, encrypted=None):
+        rng = self.rng
+        now = time.time() if self.now is None else self.now
+        packet_id = rng.getrandbits(32)
+        # Signal at the gateway: the node's own level with some fading, SNR follows RSSI
+        rssi = int(node.rssi + rng.gauss(0, 4))
+        snr = round((rssi + 120) / 5 - 4 + rng.gauss(0, 1.5), 2)
+        extra = encode_packet_fields(
+            to=to, hop_limit=node.hop_start - node.hops, hop_start=node.hop_start, want_ack=want_ack,
+            rx_time=now, rx_snr=snr, rx_rssi=rssi
+        )
+        if encrypted is None:
+            encrypted = rng.random() < self.encrypted_ratio
+        payload = (template or node.template).emit(packet_id, now, plaintext, extra, encrypted)
+        self.sent += 1
+        return packet_id, node.topic, payload
+
+    def _telemetry(self, node, environment):
+        rng = self.rng
+        now = int(time.time() if self.now is None else self.now)
+        if environment:
+            telemetry = telemetry_pb2.Telemetry(time=now, environment_metrics=telemetry_pb2.EnvironmentMetrics(
+                temperature=round(rng.uniform(5, 35), 1), relative_humidity=round(rng.uniform(20, 90), 1),
+                barometric_pressure=round(rng.uniform(990, 1030), 1)))
+        else:
+            node.battery = max(0, node.battery - (rng.random() < 0.05))
+            telemetry = telemetry_pb2.Telemetry(time=now, device_metrics=telemetry_pb2.DeviceMetrics(
+                battery_level=node.battery, voltage=round(3.3 + node.battery / 110, 2),
+                channel_utilization=round(rng.uniform(0, 30), 2), air_util_tx=round(rng.uniform(0, 5), 2),
+                uptime_seconds=rng.randrange(0, 10 ** 6)))
+        return encode_data(portnums_pb2.TELEMETRY_APP, telemetry.SerializeToString())
+
+    def _build(self, kind, node):
+        rng = self.rng
+        if kind == 'nodeinfo':
+            return self._emit(node)
+        if kind == 'position':
+            return self._emit(node, template=node.position)
+        if kind in ('telemetry', 'environment'):
+            return self._emit(node, self._telemetry(node, kind == 'environment'))
+        if kind == 'text':
+            text = rng.choice(MESSAGES).encode()
+            if rng.random() < 0.3:
+                # Direct message, acknowledged later by the destination
+                dest = self._other(node)
+                packet_id, topic, payload = self._emit(node, encode_data(portnums_pb2.TEXT_MESSAGE_APP, text), to=dest.number, want_ack=True)
+                self._awaiting_ack.append((dest, node.number, packet_id))
+                return packet_id, topic, payload
+            return self._emit(node, encode_data(portnums_pb2.TEXT_MESSAGE_APP, text))
+        if kind == 'routing':
+            if self._awaiting_ack:
+                node, to, request_id = self._awaiting_ack.popleft()
+            else:
+                to, request_id = self._other(node).number, rng.getrandbits(32)
+            return self._emit(node, encode_data(portnums_pb2.ROUTING_APP, ACK_PAYLOAD, request_id=request_id), to=to)
+        if kind == 'traceroute':
+            if self._awaiting_route and rng.random() < 0.5:
+                node, to, request_id = self._awaiting_route.popleft()
+                hops = [self.rng.choice(self.node_numbers) for _ in range(node.hops)]
+                route = mesh_pb2.RouteDiscovery(route=hops, snr_towards=[rng.randrange(-40, 40) for _ in range(len(hops) + 1)])
+                return self._emit(node, encode_data(portnums_pb2.TRACEROUTE_APP, route.SerializeToString(), request_id=request_id), to=to)
+            dest = self._other(node)
+            packet_id, topic, payload = self._emit(node, encode_data(portnums_pb2.TRACEROUTE_APP, b"", want_response=True), to=dest.number)
+            self._awaiting_route.append((dest, node.number, packet_id))
+            return packet_id, topic, payload
+        raise ValueError(f"unknown packet kind {kind!r}")
+
+    def packet(self, node_number, kind, encrypted=True):
+        """One (topic, envelope) of `kind` from a given virtual node, e.g. to trigger a reactive spoofer."""
+        node = self.by_number[node_number]
+        if kind == 'position':
+            _, topic, payload = self._emit(node, template=node.position, encrypted=encrypted)
+        elif kind == 'nodeinfo':
+            _, topic, payload = self._emit(node, encrypted=encrypted)
+        else:
+            _, topic, payload = self._build(kind, node)
+        return topic, payload
+
+    def next(self):
+        kind = self.rng.choices(self.kinds, cum_weights=self.cum_weights)[0]
+        _, topic, payload = self._build(kind, self.rng.choice(self.nodes))
+        return topic, payload
+
+    def take(self, count):
+        return [self.next() for _ in range(count)]
+
+    def timed(self, rate, start=None):
+        """
+        Yield (timestamp, topic, payload) on a virtual clock with Poisson arrivals at `rate`
+        messages/s, starting at `start` (now by default). Packet times follow the clock.
+        """
+        self.now = time.time() if start is None else start
+        while True:
+            self.now += self.rng.expovariate(rate)
+            topic, payload = self.next()
+            yield self.now, topic, payload
+
+    def __iter__(self):
+        while True:
+            yield self.next()
+
+
+def paced(items, rate, count=None, stop=None):
+    """
+    Yield from `items` at `rate` per second of wall-clock time, up to `count` items or until
+    the `stop` Event is set. Items are released in small bursts of whatever is due, so the
+    average rate holds even when the consumer is slower than one sleep per item.
+    """
+    items = iter(items)
+    sent = 0
+    started = time.monotonic()
+    while (stop is None or not stop.is_set()) and (count is None or sent < count):
+        due = int((time.monotonic() - started) * rate) - sent
+        if count is not None:
+            due = min(due, count - sent)
+        for _ in range(due):
+            try:
+                yield next(items)
+            except StopIteration:
+                return
+            sent += 1
+        if due <= 0:
+            if stop is not None:
+                stop.wait(0.001)
+            else:
+                time.sleep(0.001)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, Table, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Boolean, Table, ForeignKey, DateTime, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from pydantic import BaseModel
@@ -16,7 +16,8 @@ channel_node_association = Table(
 class Node(Base):
     __tablename__ = 'nodes'
     id = Column(Integer, primary_key=True, index=True)
-    node_number = Column(Integer, unique=True, nullable=False)
+    # Unsigned 32-bit in the mesh, so wider than a PostgreSQL INTEGER
+    node_number = Column(BigInteger, unique=True, nullable=False)
     node_mac = Column(String, unique=True, nullable=False)
     node_id = Column(String, unique=True, nullable=False)
     short_name = Column(String, nullable=True)
@@ -93,9 +94,10 @@ class NodePacket(Base):
     __tablename__ = 'node_packet'
     id = Column(Integer, primary_key=True)
     timestamp = Column(DateTime, index=True, nullable=False)
-    from_node_id = Column(Integer, ForeignKey('nodes.id'), nullable=False)
-    gateway_node_id = Column(Integer, ForeignKey('nodes.id'), nullable=False)
-    to_node_id = Column(Integer, ForeignKey('nodes.id'), nullable=False)
+    # Node references are node ids (!abcd1234); the gateway is NULL when the topic does not name one
+    from_node_id = Column(String, ForeignKey('nodes.node_id'), nullable=False)
+    gateway_node_id = Column(String, ForeignKey('nodes.node_id'), nullable=True)
+    to_node_id = Column(String, ForeignKey('nodes.node_id'), nullable=False)
     packet_type = Column(String, nullable=True)
     rssi = Column(Float, nullable=True)
     snr = Column(Float, nullable=True)
@@ -103,10 +105,10 @@ class NodePacket(Base):
     success = Column(Boolean, nullable=True)
     response_time = Column(Float, nullable=True)
     channel_id = Column(String, nullable=True)  # NEW: store channel_id from envelope
-    packet_id = Column(Integer, nullable=True)  # NEW: store packet.id from protobuf
+    packet_id = Column(BigInteger, nullable=True)  # NEW: store packet.id from protobuf
     rx_rssi = Column(Float, nullable=True)  # NEW: store rx_rssi from packet
     rx_snr = Column(Float, nullable=True)   # NEW: store rx_snr from packet
-    rx_time = Column(Integer, nullable=True)  # CHANGED: store rx_time as Integer
+    rx_time = Column(BigInteger, nullable=True)  # CHANGED: store rx_time as Integer
     hop_start = Column(Integer, nullable=True)  # NEW: store hop_start from packet
     hop_limit = Column(Integer, nullable=True)  # NEW: store hop_limit from packet
 
@@ -114,12 +116,26 @@ class NodePacket(Base):
     gateway_node = relationship('Node', foreign_keys=[gateway_node_id], back_populates='packets_gateway')
     peer_node = relationship('Node', foreign_keys=[to_node_id], back_populates='packets_to')
 
+    # Per-node activity over a time window (db nodes activity) reads the node/time indexes without
+    # touching the table; ACK matching seeks the newest packet with a packet id
+    __table_args__ = (
+        Index('ix_node_packet_from_node_time', 'from_node_id', 'timestamp', 'success'),
+        Index('ix_node_packet_to_node_time', 'to_node_id', 'timestamp', 'success'),
+        Index('ix_node_packet_packet_id', 'packet_id', 'timestamp'),
+        Index('ix_node_packet_channel_time', 'channel_id', 'timestamp'),
+    )
+
+# Packets reference nodes that are never stored (broadcast, gateways only seen in topics); SQLite does
+# not enforce the references, and they are left out of the schema on servers that would
+for constraint in NodePacket.__table__.foreign_key_constraints:
+    constraint.ddl_if(dialect='sqlite')
+
 class NodePacketModel(BaseModel):
     id: Optional[int]
     timestamp: str
-    from_node_id: int
-    gateway_node_id: int
-    to_node_id: int
+    from_node_id: str
+    gateway_node_id: Optional[str] = None
+    to_node_id: str
     packet_type: Optional[str] = None
     rssi: Optional[float] = None
     snr: Optional[float] = None
@@ -135,3 +151,26 @@ class NodePacketModel(BaseModel):
     hop_limit: Optional[int] = None  # NEW
     class Config:
         from_attributes = True
+
+# Bucket sizes of the packet rollups, in seconds
+ROLLUP_MINUTE = 60
+ROLLUP_HOUR = 3600
+ROLLUP_DAY = 86400
+ROLLUP_PERIODS = (ROLLUP_MINUTE, ROLLUP_HOUR, ROLLUP_DAY)
+
+class PacketRollup(Base):
+    """
+    Packet and byte counts per (bucket, channel, sender, packet type), kept up to date by the
+    ingest path in the same transaction as the packet inserts. Missing channel ids are
+    stored as '' and missing packet types as '-', so every key takes part in the primary key.
+    """
+    __tablename__ = 'packet_rollup'
+    # Rows clustered by (period, bucket): reading one period over a time range is a sequential scan
+    __table_args__ = {'sqlite_with_rowid': False}
+    period = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    channel_id = Column(String, primary_key=True)
+    node_id = Column(String, primary_key=True)
+    packet_type = Column(String, primary_key=True)
+    packets = Column(BigInteger, nullable=False, default=0)
+    bytes = Column(BigInteger, nullable=False, default=0)
@@ -1,5 +1,21 @@
 import argparse
-from settings import BROADCAST_MAC, KEY
+from settings import BROADCAST_MAC, KEY, CHANNEL, DB_RETENTION_DAYS
+from src.clients.packet_archive import EXPORT_CHUNK_ROWS, MODEM_PRESETS
+
+def add_filter_arguments(parser):
+    """Portnum and header filter flags shared by the modes that run the packet handler."""
+    parser.add_argument('--text', action='store_true', help='Print incoming text messages')
+    parser.add_argument('--seq', action='store_true', help='Print incoming sequence numbers')
+    parser.add_argument('--position', action='store_true', help='Print incoming position data')
+    parser.add_argument('--nodeinfo', action='store_true', help='Print incoming nodeinfo data')
+    parser.add_argument('--route', action='store_true', help='Print incoming routing data')
+    parser.add_argument('--telemetry', action='store_true', help='Print incoming telemetry data')
+    parser.add_argument('--keyring', type=str, help='File with extra channel keys to try, one "<channel name> <psk>" per line')
+    parser.add_argument('--from-node', type=str, action='append', help='Only handle packets sent by this node id (repeatable)')
+    parser.add_argument('--to-node', type=str, action='append', help='Only handle packets sent to this node id (repeatable)')
+    parser.add_argument('--gateway-node', type=str, action='append', help='Only handle packets relayed by this gateway node id (repeatable)')
+    parser.add_argument('--channel-hash', type=int, action='append', help='Only handle packets with this channel hash (repeatable)')
+    parser.add_argument('--record-all', action='store_true', help='Store every packet in the DB, not only the ones that pass the filters')
 
 def build_parser():
     parser = argparse.ArgumentParser(description="Meshtastic MQTT Client")
@@ -8,12 +24,43 @@ def build_parser():
 
     # sniffer subparser
     sniffer_parser = subparsers.add_parser("sniffer", help="sniffer for incoming packets")
-    sniffer_parser.add_argument('--text', action='store_true', help='Print incoming text messages')
-    sniffer_parser.add_argument('--seq', action='store_true', help='Print incoming sequence numbers')
-    sniffer_parser.add_argument('--position', action='store_true', help='Print incoming position data')
-    sniffer_parser.add_argument('--nodeinfo', action='store_true', help='Print incoming nodeinfo data')
-    sniffer_parser.add_argument('--route', action='store_true', help='Print incoming routing data')
-    sniffer_parser.add_argument('--telemetry', action='store_true', help='Print incoming telemetry data')
+    add_filter_arguments(sniffer_parser)
+    sniffer_parser.add_argument('--topic', type=str, help='Subscribe to this MQTT topic pattern instead of ROOT_TOPIC/#')
+    sniffer_parser.add_argument('--async', dest='async_mode', action='store_true', help='Use the asyncio sniffer with a pool of decode workers')
+    sniffer_parser.add_argument('--workers', type=int, help='Number of decode workers for --async (default: SNIFFER_WORKERS)')
+    sniffer_parser.add_argument('--worker-mode', type=str, choices=['thread', 'process'], help='Decode worker type for --async (default: SNIFFER_WORKER_MODE)')
+
+    # Capture subparser
+    capture_parser = subparsers.add_parser("capture", help="Record raw MQTT traffic to a capture file")
+    capture_parser.add_argument('--output', type=str, required=True, help='Capture file to write; rotated files get a .0001, .0002... suffix')
+    capture_parser.add_argument('--topic', type=str, help='Subscribe to this MQTT topic pattern instead of ROOT_TOPIC/#')
+    capture_parser.add_argument('--rotate-mb', type=int, help='Start a new file after this many MB (default: CAPTURE_ROTATE_MB)')
+    capture_parser.add_argument('--fsync-seconds', type=float, help='Seconds between fsyncs (default: CAPTURE_FSYNC_SECONDS)')
+
+    # Replay subparser
+    replay_parser = subparsers.add_parser("replay", help="Feed capture files through the sniffer pipeline")
+    replay_parser.add_argument('files', type=str, nargs='+', help='Capture files, replayed in order with their rotated continuations')
+    replay_parser.add_argument('--realtime', action='store_true', help='Keep the recorded spacing between messages instead of replaying as fast as possible')
+    replay_parser.add_argument('--speed', type=float, default=1.0, help='Speed-up factor for --realtime (default: 1.0)')
+    add_filter_arguments(replay_parser)
+
+    # Reingest subparser
+    reingest_parser = subparsers.add_parser("reingest", help="Re-decode capture files in parallel into the DB")
+    reingest_parser.add_argument('files', type=str, nargs='+', help='Capture files, ingested in order with their rotated continuations')
+    reingest_parser.add_argument('--workers', type=int, help='Number of worker processes (default: REINGEST_WORKERS)')
+    reingest_parser.add_argument('--shard-records', type=int, help='Capture records per shard (default: REINGEST_SHARD_RECORDS)')
+    add_filter_arguments(reingest_parser)
+
+    # Generate subparser
+    generate_parser = subparsers.add_parser("generate", help="Emit synthetic mesh traffic to a capture file or the broker")
+    generate_parser.add_argument('--output', type=str, help='Capture file to write instead of publishing to the broker')
+    generate_parser.add_argument('--rate', type=float, default=1000, help='Messages per second; with --output, the rate of the recorded timestamps (default: 1000)')
+    generate_parser.add_argument('--count', type=int, help='Stop after this many messages (default: 100000 with --output, unlimited otherwise)')
+    generate_parser.add_argument('--duration', type=float, help='Stop after this many seconds of traffic')
+    generate_parser.add_argument('--nodes', type=int, help='Number of virtual nodes (default: LOCAL_TRAFFIC_NODES)')
+    generate_parser.add_argument('--mix', type=str, help='Packet kind weights, e.g. "nodeinfo=3,position=3,telemetry=1,environment=1,text=3,routing=1,traceroute=1" (default: LOCAL_TRAFFIC_MIX)')
+    generate_parser.add_argument('--encrypted-ratio', type=float, help='Fraction of encrypted packets (default: LOCAL_TRAFFIC_ENCRYPTED_RATIO)')
+    generate_parser.add_argument('--seed', type=int, help='Random seed for a reproducible stream')
 
     # Send subparser with its own subparsers
     send_parser = subparsers.add_parser("send", help="Send data (position, nodeinfo, message)")
@@ -44,6 +91,15 @@ def build_parser():
     db_subparser.add_argument('--follow', action='store_true', help='Continuously refresh the table output every second')
     db_subparsers = db_subparser.add_subparsers(dest="db_action", required=True, help="Database action")
     db_subparsers.add_parser("delete", help="Delete the database")
+    db_subparsers.add_parser("migrate", help="Upgrade the database schema to the current version")
+    prune_parser = db_subparsers.add_parser("prune", help="Delete old raw packets and expired rollups (retention policy)")
+    prune_parser.add_argument('--days', type=int, default=DB_RETENTION_DAYS, help=f'Keep the packets of the last N days, 0 keeps all (default: DB_RETENTION_DAYS, {DB_RETENTION_DAYS})')
+    compact_parser = db_subparsers.add_parser("compact", help="Return the space of deleted rows to the filesystem")
+    compact_parser.add_argument('--full', action='store_true', help='Rewrite the whole database (blocks writers); needed once for databases without incremental auto_vacuum')
+    export_parser = db_subparsers.add_parser("export", help="Export packets, nodes and channels to Parquet files for the analyze mode")
+    export_parser.add_argument('--output', type=str, required=True, help='Archive directory; the days exported replace the same days in it, others are kept')
+    export_parser.add_argument('--days', type=int, help='Only export the last N days (default: all packets)')
+    export_parser.add_argument('--chunk-rows', type=int, default=EXPORT_CHUNK_ROWS, help=f'Packets read from the DB per query (default: {EXPORT_CHUNK_ROWS})')
 
     # nodes subparser for db
     nodes_parser = db_subparsers.add_parser("nodes", help="Node operations")
@@ -73,6 +129,24 @@ def build_parser():
     show_parser = channels_subparsers.add_parser("show", help="Show channel info and members")
     show_parser.add_argument("channel_id", type=str, help="Channel name/id to show")
     activity_parser = channels_subparsers.add_parser("activity", help="Show channel activity (Packets, Bytes) for each channel")
+    activity_parser.add_argument("--last-minutes", dest="minutes", type=int, help="Only count the last N minutes (default: all time)")
+
+    # rollup subparser for db
+    rollup_parser = db_subparsers.add_parser("rollup", help="Packet rollup operations")
+    rollup_subparsers = rollup_parser.add_subparsers(dest="rollup_action", required=True, help="Rollup action")
+    rollup_subparsers.add_parser("rebuild", help="Recompute the packet rollups from the stored packets")
+
+    # Analyze subparser
+    default_preset = CHANNEL if CHANNEL in MODEM_PRESETS else 'LongFast'
+    analyze_parser = subparsers.add_parser("analyze", help="Per-node packet statistics over an archive written by `db export`")
+    analyze_parser.add_argument('archive', type=str, help='Archive directory written by `db export`')
+    analyze_parser.add_argument('--days', type=int, help='Only read the last N days (default: all)')
+    analyze_parser.add_argument('--node', type=str, help='Only packets sent by this node id (!abcd1234)')
+    analyze_parser.add_argument('--channel', type=str, help='Only packets of this channel id')
+    analyze_parser.add_argument('--preset', type=str, choices=list(MODEM_PRESETS), default=default_preset, help=f'Modem preset used to estimate airtime (default: the CHANNEL preset, {default_preset})')
+    analyze_parser.add_argument('--sort', type=str, default='packets', help='Column to sort by, descending (default: packets)')
+    analyze_parser.add_argument('--limit', type=int, default=50, help='Nodes shown in the table (default: 50)')
+    analyze_parser.add_argument('--output', type=str, help='Also write all the nodes to this file, CSV if it ends in .csv, Parquet otherwise')
 
     # Spoofer subparser
     spoofer_parser = subparsers.add_parser("spoofer", help="Spoof a node")
@@ -94,4 +168,17 @@ def build_parser():
     periodic_spoofing_parser.add_argument('--interval', type=int, default=60, help='Interval in seconds for periodic spoofing')
     hybrid_spoofing_parser = spoof_mode_subparsers.add_parser("hybrid", help="Spoof node periodically and when receiving nodeinfo/position from the original node")
     hybrid_spoofing_parser.add_argument('--interval', type=int, default=60, help='Interval in seconds for periodic spoofing')
+
+    # Campaign subparser
+    campaign_parser = subparsers.add_parser("campaign", help="Spoof many nodes from one process")
+    campaign_parser.add_argument('--targets', type=str, help='CSV file with one target per row (header: node_id,short_name,long_name,hw_model,lat,lon,alt,pubkey,mode,interval,to_node,gateway_node)')
+    campaign_parser.add_argument('--from-db', action='store_true', help='Use the nodes stored in the DB as targets')
+    campaign_parser.add_argument('--limit', type=int, help='Maximum number of DB nodes to use, most recently seen first (with --from-db)')
+    campaign_parser.add_argument('--mode', dest='target_mode', type=str, choices=['periodic', 'reactive', 'hybrid'], default='hybrid', help='Default spoofing mode for targets without one (default: hybrid)')
+    campaign_parser.add_argument('--interval', type=float, default=60, help='Default seconds between periodic emissions (default: 60)')
+    campaign_parser.add_argument('--jitter', type=float, default=0.1, help='Random fraction of the interval added to or removed from each period (default: 0.1)')
+    campaign_parser.add_argument('--burst', type=int, default=1, help='Number of spoof packets to send per event')
+    campaign_parser.add_argument('--period', type=float, default=2, help='Seconds between spoof packets in a burst')
+    campaign_parser.add_argument('--gateway-node', type=str, default=BROADCAST_MAC, help='Default gateway node mac to spoof data to')
+    campaign_parser.add_argument('--to-node', type=str, default=BROADCAST_MAC, help='Default node mac to spoof data to')
     return parser
@@ -1,6 +1,9 @@
 import base64
+import bisect
 import logging
 import os
+import threading
+from functools import lru_cache
 
 from prettytable import PrettyTable
 
@@ -21,6 +24,20 @@ def ensure_aes_key(key):
 def set_topic(node_mac, root_topic, channel):
     return root_topic + channel + "/" + node_mac
 
+def topic_matches(pattern, topic):
+    """Check an MQTT topic against a subscription pattern with + and # wildcards."""
+    pattern_levels = pattern.split('/')
+    topic_levels = topic.split('/')
+    for i, level in enumerate(pattern_levels):
+        if level == '#':
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != '+' and level != topic_levels[i]:
+            return False
+    return len(pattern_levels) == len(topic_levels)
+
+@lru_cache(maxsize=256)
 def generate_hash(name, key):
     replaced_key = key.replace('-', '+').replace('_', '/')
     key_bytes = base64.b64decode(replaced_key.encode('utf-8'))
@@ -50,6 +67,15 @@ def num_to_mac(num):
     hex = f"{num:012x}".lower()
     return f"{hex[:2]}:{hex[2:4]}:{hex[4:6]}:{hex[6:8]}:{hex[8:10]}:{hex[10:12]}"
 
+def mac_to_num(node_mac):
+    """Convert a MAC address string to a node_number."""
+    if not isinstance(node_mac, str):
+        raise ValueError("Node MAC must be a string")
+    try:
+        return int(node_mac.replace(':', ''), 16)
+    except ValueError:
+        raise ValueError("Invalid node MAC format") from None
+
 def hw_num_to_model(hw_model_n):
     """Convert a hardware model number to its name."""
     hw_model_int = int(hw_model_n) if isinstance(hw_model_n, str) else hw_model_n
@@ -64,6 +90,60 @@ def hw_model_to_num(hw_model):
     return mesh_pb2.HardwareModel.Value(hw_model) if isinstance(hw_model, str) else hw_model
 
 
+class LatencyHistogram:
+    """
+    Thread-safe latency histogram with fixed millisecond buckets.
+    Percentiles are estimated as the upper bound of the bucket they fall in (capped at the max).
+    """
+    BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, buckets_ms=None):
+        self.buckets_ms = tuple(buckets_ms or self.BUCKETS_MS)
+        self._counts = [0] * (len(self.buckets_ms) + 1)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = None
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+            self.count += 1
+            self.total_ms += ms
+            self.min_ms = ms if self.min_ms is None else min(self.min_ms, ms)
+            self.max_ms = ms if self.max_ms is None else max(self.max_ms, ms)
+
+    def percentile(self, p):
+        with self._lock:
+            if not self.count:
+                return None
+            rank = p / 100 * self.count
+            seen = 0
+            for i, n in enumerate(self._counts):
+                seen += n
+                if n and seen >= rank:
+                    return min(self.buckets_ms[i], round(self.max_ms, 3)) if i < len(self.buckets_ms) else round(self.max_ms, 3)
+            return self.max_ms
+
+    def stats(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else None,
+            'min_ms': round(self.min_ms, 3) if self.min_ms is not None else None,
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99),
+            'max_ms': round(self.max_ms, 3) if self.max_ms is not None else None,
+        }
+
+    def buckets(self):
+        """Return (upper bound in ms, count) pairs, the last bound being None (overflow)."""
+        with self._lock:
+            return list(zip(self.buckets_ms + (None,), self._counts))
+
+
 def print_table(data, headers=None):
     """
     Print a table in a formatted way.
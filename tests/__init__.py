@@ -0,0 +1,24 @@
+"""
+Tests, run from the repository root with `python -m unittest` (or pytest).
+
+Importing src.clients.db_client opens the DB singleton on DB_URL, so the tests point it to a
+SQLite file in a temporary directory first: they never touch meshtastic_nodes.db or a
+database configured in .env.
+"""
+import os
+import sys
+import tempfile
+
+if 'settings' in sys.modules:
+    # e.g. `unittest discover tests`, which imports the test modules before this package
+    raise ImportError("settings was imported before the tests package set DB_URL; run `python -m unittest` from the repository root")
+WORKDIR = tempfile.mkdtemp(prefix='spooftastic-tests-')
+os.environ['DB_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'meshtastic_nodes.db')}"
+
+
+def new_client(url=None):
+    """A DBClient of its own, on `url` or else a new SQLite database; the DB singleton is left as it is."""
+    from src.clients.db_client import DBClient
+    client = object.__new__(DBClient)
+    client._init_db(url or f"sqlite:///{os.path.join(tempfile.mkdtemp(dir=WORKDIR), 'meshtastic_nodes.db')}")
+    return client
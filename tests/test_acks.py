@@ -0,0 +1,99 @@
+import unittest
+from datetime import datetime, timedelta
+from src.clients.ack_tracker import AckTracker
+from src.models import NodePacket
+from tests import new_client
+
+
+class AckTrackerTest(unittest.TestCase):
+    def test_resolve(self):
+        acks = AckTracker(ttl=60, capacity=10)
+        acks.track(7, 101, 1000.0)
+        self.assertEqual(acks.resolve(7, 1002.5), (101, 2.5))
+        self.assertIsNone(acks.resolve(7, 1003.0))
+        stats = acks.stats()
+        self.assertEqual((stats['pending'], stats['resolved'], stats['unmatched']), (0, 1, 1))
+
+    def test_copy_heard_again_points_to_newest_row(self):
+        acks = AckTracker(ttl=60, capacity=10)
+        acks.track(7, 101, 1000.0)
+        acks.track(7, 102, 1001.0)
+        # The response time still counts from the first time the packet was heard
+        self.assertEqual(acks.resolve(7, 1004.0), (102, 4.0))
+
+    def test_ttl_expiry(self):
+        acks = AckTracker(ttl=30, capacity=10)
+        acks.track(1, 10, 1000.0)
+        acks.track(2, 11, 1020.0)
+        # Only ACKs move the clock: at 1040, packets heard before 1010 have expired
+        self.assertIsNone(acks.resolve(3, 1040.0))
+        self.assertIsNone(acks.resolve(1, 1040.0))
+        self.assertEqual(acks.resolve(2, 1041.0), (11, 21.0))
+        self.assertEqual(acks.stats()['expired'], 1)
+
+    def test_capacity_evicts_oldest(self):
+        acks = AckTracker(ttl=60, capacity=2)
+        for packet_id in (1, 2, 3):
+            acks.track(packet_id, packet_id * 10, 1000.0 + packet_id)
+        self.assertIsNone(acks.resolve(1, 1005.0))
+        self.assertEqual(acks.resolve(3, 1005.0), (30, 2.0))
+        self.assertEqual(acks.stats()['evictions'], 1)
+
+
+class AckFallbackTest(unittest.TestCase):
+    def setUp(self):
+        self.db = new_client()
+        self.addCleanup(self.db.close)
+        self.sent = datetime.now().replace(microsecond=0) - timedelta(minutes=1)
+
+    def store(self, db, packet_id=42, seconds=0):
+        return db.add_node_packet('!10000001', '!10000002', '!10000003', packet_type='TEXT_MESSAGE_APP', packet_id=packet_id,
+                                  want_ack=True, timestamp=self.sent + timedelta(seconds=seconds))
+
+    def acked_at(self, seconds):
+        return (self.sent + timedelta(seconds=seconds)).timestamp()
+
+    def packet(self, row_id):
+        with self.db.get_read_session() as session:
+            packet = session.get(NodePacket, row_id)
+            return packet.success, packet.response_time
+
+    def test_tracker_resolves(self):
+        row_id = self.store(self.db)
+        self.assertTrue(self.db.mark_packet_success_by_ack(42, acked_at=self.acked_at(2.5)))
+        self.assertEqual(self.packet(row_id), (True, 2.5))
+        self.assertEqual(self.db.acks.stats()['recovered'], 0)
+
+    def test_expired_entry_falls_back_to_db(self):
+        row_id = self.store(self.db)
+        late = self.db.acks.ttl + 10
+        self.assertTrue(self.db.mark_packet_success_by_ack(42, acked_at=self.acked_at(late)))
+        self.assertEqual(self.packet(row_id), (True, late))
+        stats = self.db.acks.stats()
+        self.assertEqual((stats['expired'], stats['unmatched'], stats['recovered']), (1, 1, 1))
+
+    def test_packet_stored_by_another_process(self):
+        other = new_client(self.db._url)
+        self.addCleanup(other.close)
+        # The other client's tracker is built before the packet is stored, so it never hears of it
+        self.assertEqual(len(other.acks), 0)
+        row_id = self.store(self.db)
+        self.assertTrue(other.mark_packet_success_by_ack(42, acked_at=self.acked_at(3)))
+        self.assertEqual(self.packet(row_id), (True, 3.0))
+        self.assertFalse(other.mark_packet_success_by_ack(42, acked_at=self.acked_at(4)))
+        self.assertFalse(other.mark_packet_success_by_ack(43, acked_at=self.acked_at(4)))
+
+    def test_fallback_takes_newest_unacked_copy_once_per_batch(self):
+        other = new_client(self.db._url)
+        self.addCleanup(other.close)
+        other.acks
+        first = self.store(self.db)
+        second = self.store(self.db, seconds=1)
+        acks = [dict(request_id=42, acked_at=self.acked_at(5))] * 3
+        self.assertEqual(other.ingest_batch(acks=acks), 2)
+        self.assertEqual(self.packet(second), (True, 4.0))
+        self.assertEqual(self.packet(first), (True, 5.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
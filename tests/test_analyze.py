@@ -0,0 +1,63 @@
+"""
+`analyze` only reads a `db export` archive: it must run, and leave no database behind, with
+a DB_URL that cannot be opened.
+
+    python -m unittest tests.test_analyze
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class AnalyzeWithoutDatabase(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory(prefix='spooftastic-analyze-')
+        self.addCleanup(self.workdir.cleanup)
+        self.missing_dir = os.path.join(self.workdir.name, 'missing')
+        self.archive = os.path.join(self.workdir.name, 'archive')
+
+    def analyze(self, *extra):
+        env = dict(os.environ, DB_URL=f'sqlite:///{self.missing_dir}/meshtastic_nodes.db')
+        return subprocess.run(
+            [sys.executable, os.path.join(ROOT, 'spooftastic.py'), 'analyze', self.archive, *extra],
+            cwd=self.workdir.name, env=env, capture_output=True, text=True, timeout=120,
+        )
+
+    def assert_no_database(self, result):
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertNotIn('Traceback', result.stderr)
+        self.assertFalse(os.path.exists(self.missing_dir))
+        # Nor the default database in the working directory
+        self.assertEqual([name for name in os.listdir(self.workdir.name) if name.startswith('meshtastic_nodes.db')], [])
+
+    def test_missing_archive(self):
+        self.assert_no_database(self.analyze())
+
+    def test_archive(self):
+        try:
+            from src.clients import packet_archive
+            pa = packet_archive._arrow()
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        schema = packet_archive._packet_schema(pa)
+        row = {name: None for name in schema.names}
+        row.update(timestamp=datetime(2026, 1, 2, 3, 4), from_node_id='!10000001', gateway_node_id='!10000002',
+                   packet_type='TEXT_MESSAGE_APP', payload_size=12, rx_rssi=-90.0, rx_snr=5.5, day=datetime(2026, 1, 2).date())
+        pa.dataset.write_dataset(
+            pa.Table.from_pylist([row], schema=schema), os.path.join(self.archive, packet_archive.PACKETS_DIR),
+            format='parquet', partitioning=packet_archive._partitioning(pa),
+        )
+        output = os.path.join(self.workdir.name, 'stats.csv')
+        result = self.analyze('--output', output)
+        self.assert_no_database(result)
+        with open(output) as f:
+            self.assertIn('"!10000001",1,12', f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+from src.agents.campaign import load_targets_file
+
+
+class FakeSpoofer:
+    def get_effective_spoof_params(self, node_id, overrides):
+        return dict(overrides)
+
+
+class LoadTargetsFileTest(unittest.TestCase):
+    def load(self, text, **defaults):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(text)
+        self.addCleanup(os.remove, f.name)
+        with self.assertLogs(level='WARNING') as logs:
+            targets = load_targets_file(f.name, spoofer=FakeSpoofer(), **defaults)
+        # "... on <path>:<line>: <error>" -> "<line>: <error>"
+        return targets, [record.getMessage().split(f'{f.name}:', 1)[1] for record in logs.records]
+
+    def test_invalid_intervals_are_skipped_with_their_line(self):
+        targets, warnings = self.load(
+            '# spoofed nodes\n'
+            'node_id,interval\n'
+            '# first batch\n'
+            '!10000001,30\n'
+            '!10000002,0\n'
+            '\n'
+            '# second batch\n'
+            '!10000003,-5\n'
+            '!10000004,nan\n'
+            '!10000005,\n'
+        )
+        self.assertEqual([(t.node_id, t.interval) for t in targets], [('!10000001', 30.0), ('!10000005', 60.0)])
+        self.assertEqual(warnings, [
+            '5: interval must be positive, got 0.0',
+            '8: interval must be positive, got -5.0',
+            '9: interval must be positive, got nan',
+        ])
+
+    def test_default_interval_is_validated(self):
+        targets, warnings = self.load('node_id\n!10000001\n', interval=0)
+        self.assertEqual(targets, [])
+        self.assertEqual(warnings, ['2: interval must be positive, got 0.0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from sqlalchemy.exc import IntegrityError, OperationalError
+from src.clients.ingest_queue import IngestQueue, WriteRecorder
+
+
+def locked():
+    return OperationalError('INSERT INTO node_packet ...', {}, Exception('database is locked'))
+
+
+class FakeDB:
+    """ingest_batch recording each call; raises the queued `errors` first, and rejects packets of type 'bad'."""
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.batches = []
+
+    def ingest_batch(self, nodes=None, packets=None, channels=None, acks=None):
+        if self.errors:
+            raise self.errors.pop(0)
+        if any(packet.get('packet_type') == 'bad' for packet in packets or ()):
+            raise IntegrityError('INSERT INTO node_packet ...', {}, Exception('NOT NULL constraint failed'))
+        self.batches.append(dict(nodes=nodes or [], packets=packets or [], channels=channels or [], acks=acks or []))
+        return len(acks or ())
+
+    def written(self, name):
+        return [item for batch in self.batches for item in batch[name]]
+
+
+class IngestQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.writes = WriteRecorder()
+
+    def flush(self, db, **options):
+        ingest = IngestQueue(db, retry_delay=0, **options)
+        ingest.write(self.writes.items)
+        return ingest.stats()
+
+    def packet(self, packet_type='POSITION_APP'):
+        self.writes.add_node_packet('!10000001', '!10000002', '!ffffffff', packet_type=packet_type)
+
+    def test_node_updates_coalesce_later_non_null_values_win(self):
+        self.writes.add_or_update_node(1, short_name='a', rssi=-90.0)
+        self.writes.add_or_update_node(1, short_name=None, long_name='Alpha')
+        self.writes.add_or_update_node(2, short_name='b')
+        self.writes.add_or_update_node(1, short_name='c', freeze=None)
+        db = FakeDB()
+        self.flush(db)
+        self.assertEqual(len(db.batches), 1)
+        self.assertEqual(db.written('nodes'), [
+            dict(node_number=1, short_name='c', rssi=-90.0, long_name='Alpha', freeze=None),
+            dict(node_number=2, short_name='b'),
+        ])
+
+    def test_channel_updates_merge_members(self):
+        self.writes.add_or_update_channel(8, channel_id='LongFast', member_node_ids=['!10000001'])
+        self.writes.add_or_update_channel(8, member_node_ids=['!10000002', '!10000001'])
+        self.writes.add_or_update_channel(8, aes_key='AQ==')
+        self.writes.add_or_update_channel(9)
+        db = FakeDB()
+        self.flush(db)
+        self.assertEqual(db.written('channels'), [
+            dict(channel_num=8, channel_id='LongFast', member_node_ids=['!10000001', '!10000002'], aes_key='AQ=='),
+            dict(channel_num=9, channel_id=None, member_node_ids=None, aes_key=None),
+        ])
+
+    def test_transient_error_is_retried(self):
+        self.packet()
+        self.writes.mark_packet_success_by_ack(42)
+        db = FakeDB(errors=[locked(), locked()])
+        with self.assertLogs(level='WARNING'):
+            stats = self.flush(db)
+        self.assertEqual(len(db.batches), 1)
+        self.assertEqual((stats['flushed'], stats['failed'], stats['retries']), (2, 0, 2))
+
+    def test_retries_exhausted_drops_batch(self):
+        self.packet()
+        db = FakeDB(errors=[locked()] * 3)
+        with self.assertLogs(level='ERROR'):
+            stats = self.flush(db, retries=2)
+        self.assertEqual(db.batches, [])
+        self.assertEqual((stats['flushed'], stats['failed'], stats['retries']), (0, 1, 2))
+
+    def test_rejected_write_only_drops_itself(self):
+        self.writes.add_or_update_node(1, short_name='a')
+        self.packet()
+        self.packet('bad')
+        self.packet('TEXT_MESSAGE_APP')
+        self.writes.add_or_update_channel(8, member_node_ids=['!10000001'])
+        self.writes.mark_packet_success_by_ack(42)
+        db = FakeDB()
+        with self.assertLogs(level='ERROR') as logs:
+            stats = self.flush(db)
+        self.assertEqual(len([record for record in logs.records if record.levelname == 'ERROR']), 1)
+        self.assertEqual([packet['packet_type'] for packet in db.written('packets')], ['POSITION_APP', 'TEXT_MESSAGE_APP'])
+        self.assertEqual(len(db.written('nodes')), 1)
+        self.assertEqual(len(db.written('channels')), 1)
+        self.assertEqual(len(db.written('acks')), 1)
+        self.assertEqual((stats['flushed'], stats['failed']), (5, 1))
+
+    def test_background_thread_flushes_on_close(self):
+        db = FakeDB()
+        ingest = IngestQueue(db, batch_size=2, flush_interval=60).start()
+        for _ in range(3):
+            ingest.add_node_packet('!10000001', '!10000002', '!ffffffff')
+        ingest.close(timeout=5)
+        self.assertEqual([len(batch['packets']) for batch in db.batches], [2, 1])
+        self.assertEqual(ingest.stats()['flushed'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from sqlalchemy import func
+from src.models import NodePacket, PacketRollup, ROLLUP_MINUTE, ROLLUP_HOUR, ROLLUP_DAY
+from tests import new_client
+
+
+class RetentionTest(unittest.TestCase):
+    def setUp(self):
+        self.db = new_client()
+        self.addCleanup(self.db.close)
+        self.now = datetime.now()
+
+    def store(self, timestamp):
+        self.db.add_node_packet('!10000001', '!10000002', '!ffffffff', packet_type='POSITION_APP', payload_size=10,
+                                channel_id='LongFast', timestamp=timestamp)
+
+    def packet_times(self):
+        with self.db.get_read_session() as session:
+            return sorted(timestamp for timestamp, in session.query(NodePacket.timestamp))
+
+    def rollups(self, period):
+        with self.db.get_read_session() as session:
+            rows = session.query(func.count(), func.coalesce(func.sum(PacketRollup.packets), 0)).filter(PacketRollup.period == period).one()
+            return tuple(rows)
+
+    def test_prune_removes_whole_expired_days_and_keeps_daily_rollups(self):
+        first_kept_day = (self.now - timedelta(days=5)).replace(hour=0, minute=0, second=0, microsecond=0)
+        expired = [first_kept_day - timedelta(days=3), first_kept_day - timedelta(minutes=1)]
+        kept = [first_kept_day + timedelta(minutes=1), self.now]
+        for timestamp in expired + kept:
+            self.store(timestamp)
+        deleted = self.db.prune(days=5)
+        self.assertEqual(deleted['packets'], 2)
+        self.assertGreater(deleted['rollups'], 0)
+        self.assertEqual(self.packet_times(), kept)
+        # All-time stats still count the pruned packets; the short levels keep what their windows
+        # read (hours: 7 days, minutes: 6 hours), whatever the packet retention
+        self.assertEqual(self.rollups(ROLLUP_DAY)[1], 4)
+        self.assertEqual(self.db.get_channel_activity(), {'LongFast': {'packets': 4, 'bytes': 40}})
+        self.assertEqual(self.rollups(ROLLUP_HOUR)[1], 3)
+        self.assertEqual(self.rollups(ROLLUP_MINUTE), (1, 1))
+
+    def test_prune_without_retention_keeps_packets(self):
+        self.store(self.now - timedelta(days=30))
+        self.assertEqual(self.db.prune(days=0)['packets'], 0)
+        self.assertEqual(len(self.packet_times()), 1)
+
+    def test_ingest_expires_rollups_without_packet_retention(self):
+        self.store(self.now - timedelta(days=10))
+        self.assertEqual(self.rollups(ROLLUP_MINUTE)[0], 1)
+        with mock.patch('src.clients.db_client.DB_RETENTION_DAYS', 0):
+            self.db.ingest_batch(packets=[dict(from_node_id='!10000001', gateway_node_id='!10000002', to_node_id='!ffffffff', timestamp=self.now)])
+        self.assertEqual(len(self.packet_times()), 2)
+        self.assertEqual(self.rollups(ROLLUP_MINUTE), (1, 1))
+        self.assertEqual(self.rollups(ROLLUP_HOUR), (1, 1))
+        self.assertEqual(self.rollups(ROLLUP_DAY)[1], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()